@@ -0,0 +1,295 @@
+"""
+Воспроизводимые бенчмарки горячих путей хранилища: upload_file, upload_files, list_files,
+rename_object и delete_object на больших папках, потоковая отдача file_download_view
+и число запросов к базе данных на запрос пользователя при разных хранилищах сессий.
+
+S3 поднимается локально: moto server в том же процессе (по умолчанию) или бинарник MinIO
+во временном каталоге; можно указать и уже запущенный сервер. База данных - временный sqlite.
+Нужен env/local.env, как для manage.py: настройки FILES_* из него и из переменных окружения
+учитываются и попадают в результат.
+
+Примеры:
+    python benchmarks/run.py --scale quick --output bench.json
+    python benchmarks/run.py --backend minio --minio-binary ./minio --output bench.json
+    python benchmarks/run.py --backend external --endpoint http://127.0.0.1:9000
+    python benchmarks/run.py --output new.json --baseline bench.json --max-regression 0.25
+
+Результат - JSON с разделами meta и results; при --baseline сценарии с ухудшением сильнее
+--max-regression перечисляются в разделе regressions, а код завершения равен 1.
+"""
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SCALE_NAMES = ('quick', 'default', 'large')
+BENCHMARK_NAMES = ('upload_file', 'upload_files', 'folder', 'download', 'sessions')
+
+# Учетные данные локального S3; для --backend external берутся из окружения или env/local.env
+LOCAL_ACCESS_KEY = 'benchmark'
+LOCAL_SECRET_KEY = 'benchmark-secret'
+
+# Настройки, от которых зависят результаты, - сохраняются в meta для сравнения прогонов
+RECORDED_SETTINGS = (
+    'FILES_MULTIPART_THRESHOLD', 'FILES_MULTIPART_PART_SIZE', 'FILES_MULTIPART_MAX_CONCURRENCY',
+    'FILES_UPLOAD_BATCH_CONCURRENCY', 'FILES_COPY_MAX_CONCURRENCY', 'FILES_DELETE_MAX_CONCURRENCY',
+    'FILES_LISTING_SOURCE', 'FILES_LISTING_CACHE_BACKEND', 'FILES_METADATA_INDEX_ENABLED',
+    'FILES_DEDUP_ENABLED', 'FILES_USAGE_TRACKING_ENABLED', 'FILES_DOWNLOAD_CHUNK_SIZE',
+    'FILES_S3_MAX_POOL_CONNECTIONS', 'SESSION_STORAGE',
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей FileStorageService")
+    parser.add_argument('--backend', choices=('moto', 'minio', 'external'), default='moto',
+                        help="Где запускается S3: moto server, бинарник MinIO или уже запущенный сервер")
+    parser.add_argument('--minio-binary', default=shutil.which('minio'),
+                        help="Путь к бинарнику MinIO для --backend minio")
+    parser.add_argument('--endpoint', help="Адрес S3 для --backend external")
+    parser.add_argument('--scale', choices=SCALE_NAMES, default='default',
+                        help="Набор размеров и количеств объектов")
+    parser.add_argument('--only', choices=BENCHMARK_NAMES, action='append',
+                        help="Запустить только указанные сценарии (можно повторять)")
+    parser.add_argument('--output', help="Файл для JSON с результатами (по умолчанию - stdout)")
+    parser.add_argument('--baseline', help="JSON предыдущего прогона для поиска регрессий")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="Допустимое ухудшение относительно --baseline (0.25 = 25%%)")
+    parser.add_argument('--verbose', action='store_true', help="Печатать ход прогона в stderr")
+    args = parser.parse_args()
+    # Пути считаются от текущего каталога до перехода в корень проекта
+    for name in ('output', 'baseline', 'minio_binary'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    return args
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(args, workdir: Path):
+    """
+    Запускает локальный S3.
+
+    :return: tuple - (адрес S3, функция остановки)
+    """
+    if args.backend == 'external':
+        if not args.endpoint:
+            sys.exit("Для --backend external нужен --endpoint")
+        return args.endpoint, lambda: None
+
+    os.environ['MINIO_ROOT_USER'] = LOCAL_ACCESS_KEY
+    os.environ['MINIO_ROOT_PASSWORD'] = LOCAL_SECRET_KEY
+    port = free_port()
+
+    if args.backend == 'moto':
+        try:
+            from moto.server import ThreadedMotoServer
+        except ImportError:
+            sys.exit("Для --backend moto нужен moto[server]: pip install -r benchmarks/requirements.txt")
+        # Журнал запросов werkzeug заглушил бы вывод прогона
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+        server.start()
+        return f"http://127.0.0.1:{port}", server.stop
+
+    if not args.minio_binary:
+        sys.exit("Для --backend minio нужен --minio-binary или minio в PATH")
+    process = subprocess.Popen(
+        [args.minio_binary, 'server', str(workdir / 'minio'), '--quiet',
+         '--address', f"127.0.0.1:{port}", '--console-address', f"127.0.0.1:{free_port()}"],
+        env={**os.environ, 'MINIO_ROOT_USER': LOCAL_ACCESS_KEY, 'MINIO_ROOT_PASSWORD': LOCAL_SECRET_KEY},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+
+    endpoint = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{endpoint}/minio/health/live", timeout=1):
+                return endpoint, stop
+        except OSError:
+            if process.poll() is not None:
+                sys.exit(f"MinIO завершился с кодом {process.returncode}")
+            time.sleep(0.2)
+    stop()
+    sys.exit("MinIO не запустился за 30 секунд")
+
+
+def setup_django(endpoint: str, workdir: Path, verbose: bool) -> None:
+    os.environ['TESTING'] = '1'
+    os.environ['TEST_DB_NAME'] = str(workdir / 'bench.sqlite3')
+    os.environ['MINIO_ENDPOINT_URL'] = endpoint
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, str(BASE_DIR))
+    os.chdir(BASE_DIR)
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    django.setup()
+    # Отдельный бакет на каждый прогон, чтобы не задеть данные на внешнем сервере
+    settings.AWS_STORAGE_BUCKET_NAME = f"bench-{uuid.uuid4().hex[:12]}"
+    settings.FILES_DOWNLOAD_MODE = 'proxy'
+    if 'testserver' not in settings.ALLOWED_HOSTS:
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    logging.disable(logging.NOTSET if verbose else logging.WARNING)
+    call_command('migrate', verbosity=0)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def drop_bucket(service) -> None:
+    """Удаляет временный бакет прогона вместе с оставшимися объектами"""
+    client = service.s3_client
+    bucket = service.bucket_name
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+        if keys:
+            client.delete_objects(Bucket=bucket, Delete={'Objects': keys, 'Quiet': True})
+    for upload in client.list_multipart_uploads(Bucket=bucket).get('Uploads', []):
+        client.abort_multipart_upload(Bucket=bucket, Key=upload['Key'], UploadId=upload['UploadId'])
+    client.delete_bucket(Bucket=bucket)
+
+
+def result_key(result: dict) -> str:
+    return json.dumps([result['name'], result['params']], sort_keys=True)
+
+
+def find_regressions(results: list[dict], baseline: list[dict], max_regression: float) -> list[dict]:
+    """
+    Сравнивает результаты с базовым прогоном.
+
+    Для задержки (latency_ms.p50) и db_queries_per_request хуже - больше,
+    для throughput_mb_s и objects_per_s - меньше.
+
+    :return: list[dict] - сценарии с ухудшением больше max_regression
+    """
+    previous = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        checks = [('latency_ms.p50', old['latency_ms']['p50'], result['latency_ms']['p50'], True)]
+        for metric in ('throughput_mb_s', 'objects_per_s'):
+            if old.get(metric) and result.get(metric):
+                checks.append((metric, old[metric], result[metric], False))
+        if old.get('db_queries_per_request') is not None and result.get('db_queries_per_request') is not None:
+            checks.append(('db_queries_per_request', old['db_queries_per_request'],
+                           result['db_queries_per_request'], True))
+        for metric, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before if lower_is_better else (before - after) / before
+            if change > max_regression:
+                regressions.append({'name': result['name'], 'params': result['params'], 'metric': metric,
+                                    'baseline': before, 'current': after, 'change': round(change, 3)})
+    return regressions
+
+
+def print_summary(results: list[dict]) -> None:
+    for result in results:
+        params = ' '.join(f"{name}={value}" for name, value in result['params'].items())
+        metrics = [f"p50={result['latency_ms']['p50']}ms", f"p95={result['latency_ms']['p95']}ms"]
+        for metric, unit in (('throughput_mb_s', 'MB/s'), ('objects_per_s', 'obj/s'), ('ttfb_ms', 'ms ttfb'),
+                             ('db_queries_per_request', 'db/req')):
+            if result.get(metric) is not None:
+                metrics.append(f"{result[metric]} {unit}")
+        print(f"{result['name']:<20} {params:<45} {'  '.join(metrics)}", file=sys.stderr)
+
+
+def main() -> int:
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix='filestorage-bench-'))
+    endpoint, stop_backend = start_backend(args, workdir)
+    try:
+        setup_django(endpoint, workdir, args.verbose)
+
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from files.services.fileStorage_service import FileStorageService
+        import scenarios
+
+        service = FileStorageService()
+        service.ensure_bucket()
+        user = get_user_model().objects.create_user(username=f"bench-{uuid.uuid4().hex[:8]}",
+                                                    password=uuid.uuid4().hex)
+        context = scenarios.BenchContext(service=service, user=user, params=scenarios.SCALES[args.scale],
+                                         verbose=args.verbose)
+        started = time.perf_counter()
+        results = []
+        try:
+            for name in args.only or BENCHMARK_NAMES:
+                results.extend(scenarios.BENCHMARKS[name](context))
+        finally:
+            drop_bucket(service)
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'backend': args.backend,
+                'scale': args.scale,
+                'params': scenarios.SCALES[args.scale],
+                'settings': {name: getattr(settings, name, None) for name in RECORDED_SETTINGS},
+                'cache_backend': settings.CACHES['default']['BACKEND'],
+                'seconds': round(time.perf_counter() - started, 3),
+            },
+            'results': results,
+        }
+    finally:
+        stop_backend()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        report['baseline'] = {'commit': baseline['meta'].get('commit'), 'max_regression': args.max_regression}
+        report['regressions'] = find_regressions(results, baseline['results'], args.max_regression)
+        if report['regressions']:
+            exit_code = 1
+
+    print_summary(results)
+    for regression in report.get('regressions', []):
+        print(f"РЕГРЕССИЯ {regression['name']} {regression['params']} {regression['metric']}: "
+              f"{regression['baseline']} -> {regression['current']} (хуже на {regression['change']:.0%})", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
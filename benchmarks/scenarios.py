@@ -0,0 +1,326 @@
+"""
+Сценарии бенчмарков горячих путей FileStorageService.
+
+Каждый сценарий получает контекст BenchContext и возвращает список результатов
+в формате make_result; окружение (S3, база данных, настройки Django) готовит run.py.
+"""
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from files.services.fileStorage_service import FileStorageService
+import io
+import os
+import statistics
+import sys
+import time
+
+KB = 1024
+MB = 1024 * 1024
+
+# Наборы параметров: quick - для проверки в CI, default - для сравнения изменений, large - для нагрузочных прогонов
+SCALES = {
+    'quick': {
+        'upload_sizes': [4 * KB, 1 * MB, 8 * MB],
+        'upload_repeat': 3,
+        'batch_files': 100,
+        'folder_objects': [300],
+        'list_repeat': 3,
+        'download_sizes': [4 * KB, 1 * MB, 8 * MB],
+        'download_repeat': 3,
+        'session_requests': 50,
+    },
+    'default': {
+        'upload_sizes': [4 * KB, 256 * KB, 4 * MB, 32 * MB, 96 * MB],
+        'upload_repeat': 5,
+        'batch_files': 500,
+        'folder_objects': [1000, 5000],
+        'list_repeat': 5,
+        'download_sizes': [4 * KB, 1 * MB, 16 * MB, 96 * MB],
+        'download_repeat': 5,
+        'session_requests': 200,
+    },
+    'large': {
+        'upload_sizes': [4 * KB, 4 * MB, 96 * MB, 512 * MB],
+        'upload_repeat': 3,
+        'batch_files': 2000,
+        'folder_objects': [10000, 50000],
+        'list_repeat': 3,
+        'download_sizes': [4 * KB, 16 * MB, 512 * MB],
+        'download_repeat': 3,
+        'session_requests': 500,
+    },
+}
+
+# Хранилища сессий, сравниваемые по числу запросов к базе данных
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+
+# Размер файлов, которыми заполняются папки для листинга, удаления и переименования
+FOLDER_OBJECT_SIZE = 1 * KB
+
+
+@dataclass
+class BenchContext:
+    service: FileStorageService
+    user: object
+    params: dict
+    verbose: bool = False
+
+    @property
+    def user_id(self) -> int:
+        return self.user.id
+
+    def user_key(self, path: str) -> str:
+        return f"user-{self.user_id}-files/{path}"
+
+    def log(self, message: str) -> None:
+        if self.verbose:
+            print(message, file=sys.stderr, flush=True)
+
+
+def make_result(name: str, params: dict, timings: list[float], total_bytes: int = 0,
+                total_objects: int = 0, extra: dict = None) -> dict:
+    """
+    Сводит замеры одного сценария в запись результата.
+
+    :param name: Имя сценария (например, 'upload_file')
+    :param params: Параметры, которые вместе с именем однозначно определяют сценарий при сравнении
+    :param timings: Длительности отдельных операций в секундах
+    :param total_bytes: Сколько байт передано за все операции, для расчета пропускной способности
+    :param total_objects: Сколько объектов обработано за все операции, для расчета объектов в секунду
+    :param extra: Дополнительные метрики сценария
+
+    :return: dict - запись результата с ключами name, params, iterations, seconds,
+        latency_ms (min, p50, p95, max, mean) и, если заданы объемы, throughput_mb_s и objects_per_s
+    """
+    total = sum(timings)
+    ordered = sorted(timings)
+    result = {
+        'name': name,
+        'params': params,
+        'iterations': len(timings),
+        'seconds': round(total, 6),
+        'latency_ms': {
+            'min': round(ordered[0] * 1000, 3),
+            'p50': round(_percentile(ordered, 50) * 1000, 3),
+            'p95': round(_percentile(ordered, 95) * 1000, 3),
+            'max': round(ordered[-1] * 1000, 3),
+            'mean': round(statistics.fmean(ordered) * 1000, 3),
+        },
+    }
+    if total_bytes:
+        result['throughput_mb_s'] = round(total_bytes / MB / total, 3) if total else None
+    if total_objects:
+        result['objects_per_s'] = round(total_objects / total, 3) if total else None
+    if extra:
+        result.update(extra)
+    return result
+
+
+def _percentile(ordered: list[float], percent: int) -> float:
+    """Перцентиль с линейной интерполяцией по отсортированному списку"""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _timed(func, *args, **kwargs) -> tuple[float, object]:
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    return time.perf_counter() - started, value
+
+
+def bench_upload_file(ctx: BenchContext) -> list[dict]:
+    """Загрузка одного файла для каждого размера; крупные размеры идут через multipart"""
+    results = []
+    for size in ctx.params['upload_sizes']:
+        data = os.urandom(size)
+        timings = []
+        for number in range(ctx.params['upload_repeat']):
+            # Первые байты различаются, чтобы повторные загрузки не попадали в дедупликацию
+            payload = number.to_bytes(8, 'big') + data[8:]
+            elapsed, ok = _timed(ctx.service.upload_file, ctx.user_id, io.BytesIO(payload),
+                                 f"bench-upload/{size}/{number}.bin")
+            if not ok:
+                raise RuntimeError(f"upload_file не загрузил файл размером {size}")
+            timings.append(elapsed)
+        results.append(make_result('upload_file', {'size': size}, timings,
+                                   total_bytes=size * len(timings), total_objects=len(timings),
+                                   extra={'multipart': size >= ctx.service.multipart_threshold}))
+        ctx.log(f"upload_file size={size}: {results[-1]['latency_ms']['p50']} мс")
+    ctx.service.delete_object(ctx.user_id, ctx.user_key('bench-upload/'))
+    return results
+
+
+def bench_upload_files(ctx: BenchContext) -> list[dict]:
+    """Пакетная загрузка мелких файлов в пуле потоков"""
+    count = ctx.params['batch_files']
+    files = [(os.urandom(FOLDER_OBJECT_SIZE), f"bench-batch/{number:06d}.bin") for number in range(count)]
+    elapsed, report = _timed(ctx.service.upload_files, ctx.user_id, files)
+    failed = [item for item in report if not item['success']]
+    if failed:
+        raise RuntimeError(f"upload_files: не загружено файлов {len(failed)} из {count}")
+    per_file = [item['elapsed'] for item in report]
+    result = make_result('upload_files', {'files': count, 'size': FOLDER_OBJECT_SIZE}, per_file,
+                         extra={'wall_seconds': round(elapsed, 6),
+                                'wall_objects_per_s': round(count / elapsed, 3)})
+    ctx.log(f"upload_files files={count}: {result['wall_objects_per_s']} объектов/с")
+    ctx.service.delete_object(ctx.user_id, ctx.user_key('bench-batch/'))
+    return [result]
+
+
+def bench_folder(ctx: BenchContext) -> list[dict]:
+    """
+    Листинг, переименование и удаление папки с большим количеством объектов.
+
+    Папка заполняется через upload_files, затем листинг измеряется без кэша и с кэшем,
+    папка переименовывается и удаляется целиком.
+    """
+    results = []
+    for count in ctx.params['folder_objects']:
+        folder = f"bench-folder-{count}/"
+        ctx.log(f"Заполнение папки {folder}: {count} объектов")
+        # Содержимое у всех файлов разное, чтобы дедупликация не схлопнула их в один объект
+        files = [(os.urandom(FOLDER_OBJECT_SIZE), f"{folder}{number:06d}.bin") for number in range(count)]
+        if not all(item['success'] for item in ctx.service.upload_files(ctx.user_id, files)):
+            raise RuntimeError(f"Не удалось заполнить папку {folder}")
+
+        results.extend(_bench_listing(ctx, folder, count))
+
+        elapsed, ok = _timed(ctx.service.rename_object, ctx.user_id, ctx.user_key(folder), f"renamed-{count}")
+        if not ok:
+            raise RuntimeError(f"rename_object не переименовал папку {folder}")
+        results.append(make_result('rename_object', {'objects': count}, [elapsed], total_objects=count))
+        ctx.log(f"rename_object objects={count}: {results[-1]['objects_per_s']} объектов/с")
+
+        elapsed, deleted = _timed(ctx.service.delete_object, ctx.user_id, ctx.user_key(f"renamed-{count}/"))
+        if not deleted:
+            raise RuntimeError(f"delete_object не удалил папку renamed-{count}/")
+        results.append(make_result('delete_object', {'objects': count}, [elapsed], total_objects=count))
+        ctx.log(f"delete_object objects={count}: {results[-1]['objects_per_s']} объектов/с")
+    return results
+
+
+def _bench_listing(ctx: BenchContext, folder: str, count: int) -> list[dict]:
+    results = []
+    prefix = folder
+    repeat = ctx.params['list_repeat']
+    cache = ctx.service.listing_cache
+    # Без кэша листингов (FILES_LISTING_CACHE_BACKEND=none) измеряется только холодный листинг
+    for cached in (False, True) if cache is not None else (False,):
+        full, page = [], []
+        if cached:
+            # Прогрев кэша листинга
+            ctx.service.list_files_page(ctx.user_id, prefix)
+        for _ in range(repeat):
+            if cache is not None and not cached:
+                cache.invalidate(ctx.user_id, prefix)
+            elapsed, items = _timed(ctx.service.list_files, ctx.user_id, prefix)
+            if len(items) != count:
+                raise RuntimeError(f"list_files вернул {len(items)} элементов вместо {count}")
+            full.append(elapsed)
+            if cache is not None and not cached:
+                cache.invalidate(ctx.user_id, prefix)
+            elapsed, _ = _timed(ctx.service.list_files_page, ctx.user_id, prefix)
+            page.append(elapsed)
+        params = {'objects': count, 'cached': cached, 'source': ctx.service.listing_source}
+        results.append(make_result('list_files', params, full, total_objects=count * repeat))
+        results.append(make_result('list_files_page', params, page))
+        ctx.log(f"list_files objects={count} cached={cached}: {results[-2]['latency_ms']['p50']} мс")
+    return results
+
+
+def bench_download(ctx: BenchContext) -> list[dict]:
+    """
+    Потоковая отдача файла через file_download_view целиком, вместе с middleware Django.
+
+    Помимо общего времени измеряется время до первого фрагмента ответа (ttfb_ms).
+    """
+    client = Client()
+    client.force_login(ctx.user)
+    results = []
+    for size in ctx.params['download_sizes']:
+        path = f"bench-download/{size}.bin"
+        if not ctx.service.upload_file(ctx.user_id, io.BytesIO(os.urandom(size)), path):
+            raise RuntimeError(f"Не удалось загрузить файл для скачивания размером {size}")
+        url = reverse('files:download', kwargs={'s3_key': ctx.user_key(path)})
+
+        timings, first_chunk = [], []
+        for _ in range(ctx.params['download_repeat']):
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"file_download_view вернул {response.status_code}")
+            received, ttfb = 0, None
+            for chunk in response.streaming_content:
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                received += len(chunk)
+            response.close()
+            timings.append(time.perf_counter() - started)
+            first_chunk.append(ttfb if ttfb is not None else timings[-1])
+            if received != size:
+                raise RuntimeError(f"Получено {received} байт вместо {size}")
+
+        results.append(make_result('file_download_view', {'size': size}, timings,
+                                   total_bytes=size * len(timings),
+                                   extra={'ttfb_ms': round(statistics.median(first_chunk) * 1000, 3)}))
+        ctx.log(f"file_download_view size={size}: {results[-1].get('throughput_mb_s')} МБ/с")
+    ctx.service.delete_object(ctx.user_id, ctx.user_key('bench-download/'))
+    return results
+
+
+def bench_sessions(ctx: BenchContext) -> list[dict]:
+    """
+    Запросы к базе данных и задержка легкого представления files:jobs при разных хранилищах сессий.
+
+    Кэш сессий - CACHES['default'] из настроек (Redis при заданном REDIS_URL, иначе память процесса).
+    """
+    results = []
+    url = reverse('files:jobs')
+    original_engine = settings.SESSION_ENGINE
+    try:
+        for storage, engine in SESSION_ENGINES.items():
+            # Новый Client заново собирает middleware, и SessionMiddleware берет новое хранилище
+            settings.SESSION_ENGINE = engine
+            client = Client()
+            client.force_login(ctx.user)
+            client.get(url)
+
+            timings, queries, session_queries = [], 0, 0
+            for _ in range(ctx.params['session_requests']):
+                with CaptureQueriesContext(connection) as captured:
+                    elapsed, response = _timed(client.get, url)
+                if response.status_code != 200:
+                    raise RuntimeError(f"files:jobs вернул {response.status_code}")
+                timings.append(elapsed)
+                queries += len(captured.captured_queries)
+                session_queries += sum('django_session' in query['sql'] for query in captured.captured_queries)
+
+            count = len(timings)
+            results.append(make_result('session_request', {'storage': storage}, timings, extra={
+                'db_queries_per_request': round(queries / count, 3),
+                'session_queries_per_request': round(session_queries / count, 3),
+            }))
+            ctx.log(f"session_request storage={storage}: {results[-1]['db_queries_per_request']} запросов к базе")
+    finally:
+        settings.SESSION_ENGINE = original_engine
+    return results
+
+
+BENCHMARKS = {
+    'upload_file': bench_upload_file,
+    'upload_files': bench_upload_files,
+    'folder': bench_folder,
+    'download': bench_download,
+    'sessions': bench_sessions,
+}
@@ -16,8 +16,34 @@ DEBUG = config('DEBUG', default=False, cast=bool)
 TESTING = config('TESTING', default=False, cast=bool)
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default=None, cast=lambda v: [s.strip() for s in v.split(',') if s])
 
+# Кэш Django: Redis по адресу REDIS_URL (нужен пакет redis) или, если адрес не задан, память процесса.
+# Кэш в памяти не разделяется между воркерами Gunicorn, поэтому при нескольких воркерах
+# сессии в кэше ('cached_db', 'cache') требуют Redis: иначе выход из аккаунта виден только одному воркеру
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Включаем работу с сессиями
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Хранилище сессий: 'db' - таблица django_session (запрос к базе на каждый запрос пользователя),
+# 'cached_db' - кэш с записью в базу (чтение обычно без базы, сессии переживают очистку кэша),
+# 'cache' - только кэш (сессии теряются вместе с кэшем)
+SESSION_STORAGE = config('SESSION_STORAGE', default='db')
+SESSION_ENGINE = {
+    'db': "django.contrib.sessions.backends.db",
+    'cached_db': "django.contrib.sessions.backends.cached_db",
+    'cache': "django.contrib.sessions.backends.cache",
+}[SESSION_STORAGE]
 SESSION_COOKIE_AGE = 1209600  # 2 недели
 SESSION_SAVE_EVERY_REQUEST = False
 SESSION_COOKIE_SECURE = False  # True для HTTPS
@@ -43,6 +69,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'files.middleware.StorageMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,7 +108,12 @@ if os.getenv('TESTING'):
             'NAME': config('TEST_DB_NAME', default=BASE_DIR / 'test_db.sqlite3'),
             'USER': '',
             'PASSWORD': '',
-            'HOST': ''
+            'HOST': '',
+            # Воркер run_jobs пишет в базу из двух потоков: транзакции сразу берут блокировку
+            # на запись и ждут ее, а не завершаются ошибкой "database is locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
         }
     }
 else:
@@ -139,4 +171,130 @@ AWS_SECRET_ACCESS_KEY = config('MINIO_ROOT_PASSWORD')
 AWS_S3_ENDPOINT_URL = config('MINIO_ENDPOINT_URL')
 AWS_STORAGE_BUCKET_NAME = 'user-files'
 AWS_S3_REGION_NAME = 'us-east-1'
-AWS_S3_SIGNATURE_VERSION = 's3v4'
\ No newline at end of file
+AWS_S3_SIGNATURE_VERSION = 's3v4'
+# Адрес MinIO, доступный из браузера (для presigned-ссылок), если он отличается от внутреннего
+AWS_S3_PUBLIC_ENDPOINT_URL = config('MINIO_PUBLIC_ENDPOINT_URL', default=AWS_S3_ENDPOINT_URL)
+
+# Параметры загрузки файлов в S3
+# Файлы больше порога загружаются по частям (multipart upload) в несколько потоков
+FILES_MULTIPART_THRESHOLD = config('FILES_MULTIPART_THRESHOLD', default=64 * 1024 * 1024, cast=int)
+FILES_MULTIPART_PART_SIZE = config('FILES_MULTIPART_PART_SIZE', default=16 * 1024 * 1024, cast=int)
+FILES_MULTIPART_MAX_CONCURRENCY = config('FILES_MULTIPART_MAX_CONCURRENCY', default=8, cast=int)
+FILES_MULTIPART_PART_RETRIES = config('FILES_MULTIPART_PART_RETRIES', default=3, cast=int)
+# Количество файлов, загружаемых одновременно при пакетной загрузке
+FILES_UPLOAD_BATCH_CONCURRENCY = config('FILES_UPLOAD_BATCH_CONCURRENCY', default=8, cast=int)
+# Количество объектов, копируемых одновременно при переименовании папок
+FILES_COPY_MAX_CONCURRENCY = config('FILES_COPY_MAX_CONCURRENCY', default=16, cast=int)
+# Количество пакетов delete_objects, выполняемых одновременно при удалении папок
+FILES_DELETE_MAX_CONCURRENCY = config('FILES_DELETE_MAX_CONCURRENCY', default=4, cast=int)
+# Количество элементов на одной странице файлового менеджера
+FILES_LIST_PAGE_SIZE = config('FILES_LIST_PAGE_SIZE', default=200, cast=int)
+
+# Кэш листингов папок: 'locmem' - LRU в памяти процесса, 'django' - кэш Django (CACHES), 'none' - отключен
+# При нескольких процессах locmem сбрасывается только в процессе, выполнившем изменение, и остальные
+# воркеры до FILES_LISTING_CACHE_TTL отдают устаревший листинг, поэтому по умолчанию кэш включается
+# только с общим кэшем Django в Redis; 'locmem' подходит лишь для одного процесса
+FILES_LISTING_CACHE_BACKEND = config('FILES_LISTING_CACHE_BACKEND', default='django' if REDIS_URL else 'none')
+FILES_LISTING_CACHE_TTL = config('FILES_LISTING_CACHE_TTL', default=300, cast=int)
+FILES_LISTING_CACHE_MAX_ENTRIES = config('FILES_LISTING_CACHE_MAX_ENTRIES', default=4096, cast=int)
+FILES_LISTING_CACHE_ALIAS = config('FILES_LISTING_CACHE_ALIAS', default='default')
+
+# Индекс метаданных объектов в базе данных (модель files.FileObject)
+FILES_METADATA_INDEX_ENABLED = config('FILES_METADATA_INDEX_ENABLED', default=True, cast=bool)
+# Источник листинга папок: 's3' - list_objects_v2, 'index' - индекс метаданных с сортировкой
+FILES_LISTING_SOURCE = config('FILES_LISTING_SOURCE', default='s3')
+
+# Прямая загрузка из браузера в MinIO по presigned-ссылкам
+# Требует CORS на бакете: разрешить PUT с адреса сайта и открыть заголовок ETag (ExposeHeaders)
+FILES_DIRECT_UPLOAD_ENABLED = config('FILES_DIRECT_UPLOAD_ENABLED', default=False, cast=bool)
+FILES_PRESIGNED_EXPIRES = config('FILES_PRESIGNED_EXPIRES', default=3600, cast=int)
+
+# Способ отдачи файлов при скачивании:
+#   proxy      - поток из MinIO через Django (по умолчанию)
+#   presigned  - редирект браузера на короткоживущую presigned-ссылку MinIO
+#   accel      - передача отдачи nginx через X-Accel-Redirect. Пример location:
+#       location /internal-s3/ {
+#           internal;
+#           proxy_set_header Host minio:9000;
+#           proxy_pass http://minio:9000/;
+#       }
+FILES_DOWNLOAD_MODE = config('FILES_DOWNLOAD_MODE', default='proxy')
+FILES_DOWNLOAD_URL_EXPIRES = config('FILES_DOWNLOAD_URL_EXPIRES', default=300, cast=int)
+FILES_ACCEL_REDIRECT_PREFIX = config('FILES_ACCEL_REDIRECT_PREFIX', default='/internal-s3/')
+# Размер блока чтения из MinIO при отдаче файла через Django (режим proxy)
+FILES_DOWNLOAD_CHUNK_SIZE = config('FILES_DOWNLOAD_CHUNK_SIZE', default=256 * 1024, cast=int)
+
+# Скачивание папки ZIP-архивом: сколько следующих объектов загружать заранее
+# и до какого размера объект читается в память целиком (большие передаются потоком)
+FILES_ZIP_PREFETCH_DEPTH = config('FILES_ZIP_PREFETCH_DEPTH', default=4, cast=int)
+FILES_ZIP_PREFETCH_MAX_SIZE = config('FILES_ZIP_PREFETCH_MAX_SIZE', default=8 * 1024 * 1024, cast=int)
+
+# Асинхронные представления файлового менеджера, скачивания и загрузки (только при запуске под ASGI)
+FILES_ASYNC_VIEWS = config('FILES_ASYNC_VIEWS', default=False, cast=bool)
+# Размер общего пула соединений асинхронного клиента S3 на процесс
+FILES_ASYNC_MAX_POOL_CONNECTIONS = config('FILES_ASYNC_MAX_POOL_CONNECTIONS', default=100, cast=int)
+
+# Общий для процесса клиент S3: размер пула соединений (не меньше числа потоков,
+# одновременно работающих с S3), таймауты в секундах и режим повторов ('adaptive', 'standard', 'legacy')
+FILES_S3_MAX_POOL_CONNECTIONS = config('FILES_S3_MAX_POOL_CONNECTIONS', default=50, cast=int)
+FILES_S3_CONNECT_TIMEOUT = config('FILES_S3_CONNECT_TIMEOUT', default=5, cast=int)
+FILES_S3_READ_TIMEOUT = config('FILES_S3_READ_TIMEOUT', default=60, cast=int)
+FILES_S3_MAX_ATTEMPTS = config('FILES_S3_MAX_ATTEMPTS', default=5, cast=int)
+FILES_S3_RETRY_MODE = config('FILES_S3_RETRY_MODE', default='adaptive')
+
+# Учет занятого места по пользователям и квота по умолчанию в байтах (0 - без ограничения)
+FILES_USAGE_TRACKING_ENABLED = config('FILES_USAGE_TRACKING_ENABLED', default=True, cast=bool)
+FILES_USER_QUOTA_BYTES = config('FILES_USER_QUOTA_BYTES', default=0, cast=int)
+
+# Дедупликация: содержимое файлов хранится один раз под ключом по SHA-256, файлы пользователей -
+# ссылки на него в индексе метаданных. Требует FILES_METADATA_INDEX_ENABLED; после включения
+# режим не следует отключать, так как такие файлы доступны только через индекс
+FILES_DEDUP_ENABLED = config('FILES_DEDUP_ENABLED', default=False, cast=bool)
+
+# Фоновое выполнение удаления и переименования папок воркером (python manage.py run_jobs)
+FILES_JOBS_ENABLED = config('FILES_JOBS_ENABLED', default=False, cast=bool)
+# Количество попыток выполнения операции и начальная задержка перед повтором в секундах (удваивается)
+FILES_JOB_MAX_ATTEMPTS = config('FILES_JOB_MAX_ATTEMPTS', default=3, cast=int)
+FILES_JOB_RETRY_DELAY = config('FILES_JOB_RETRY_DELAY', default=30, cast=int)
+# Интервал опроса очереди воркером в секундах
+FILES_JOB_POLL_INTERVAL = config('FILES_JOB_POLL_INTERVAL', default=2, cast=float)
+# Операция без отметки воркера дольше этого времени в секундах считается прерванной и перезапускается
+FILES_JOB_STALE_TIMEOUT = config('FILES_JOB_STALE_TIMEOUT', default=300, cast=int)
+
+# Миниатюры изображений и первых страниц PDF (PDF - если установлен pypdfium2).
+# Строятся воркером run_jobs после загрузки и хранятся в бакете под служебным префиксом .derivatives/
+FILES_THUMBNAILS_ENABLED = config('FILES_THUMBNAILS_ENABLED', default=False, cast=bool)
+# Наибольшая сторона миниатюры в пикселях
+FILES_THUMBNAIL_SIZE = config('FILES_THUMBNAIL_SIZE', default=256, cast=int)
+# Файлы больше этого размера в байтах не декодируются
+FILES_THUMBNAIL_MAX_SOURCE_SIZE = config('FILES_THUMBNAIL_MAX_SOURCE_SIZE', default=50 * 1024 * 1024, cast=int)
+
+# Возобновляемая загрузка по частям (протокол в духе tus): принятые части сохраняются,
+# и после обрыва связи клиент продолжает загрузку с последнего принятого смещения
+FILES_RESUMABLE_UPLOAD_ENABLED = config('FILES_RESUMABLE_UPLOAD_ENABLED', default=False, cast=bool)
+# Незавершенная загрузка без активности дольше этого времени в секундах удаляется командой collect_uploads
+FILES_RESUMABLE_UPLOAD_EXPIRES = config('FILES_RESUMABLE_UPLOAD_EXPIRES', default=24 * 3600, cast=int)
+
+# Метрики запросов к S3 (время, объем, повторы, коды ошибок) и HTTP-запросов: эндпоинт /files/metrics/
+# в формате Prometheus и заголовок Server-Timing. Метрики собираются отдельно в каждом процессе
+FILES_METRICS_ENABLED = config('FILES_METRICS_ENABLED', default=False, cast=bool)
+# Токен для эндпоинта метрик (заголовок Authorization: Bearer <токен>); без токена эндпоинт закрыт
+FILES_METRICS_TOKEN = config('FILES_METRICS_TOKEN', default='')
+# Добавлять к ответам заголовок Server-Timing с временем S3, базы данных и приложения
+FILES_SERVER_TIMING_ENABLED = config('FILES_SERVER_TIMING_ENABLED', default=True, cast=bool)
+
+# Наибольшее количество файлов и папок в одной операции над выбором (удаление, перемещение, скачивание ZIP)
+FILES_BULK_MAX_KEYS = config('FILES_BULK_MAX_KEYS', default=1000, cast=int)
+
+# Сжатие содержимого в хранилище: файлы подходящих типов сжимаются на лету при загрузке через Django,
+# кодек записывается в метаданные объекта. При скачивании сжатый объект отдается как есть
+# с Content-Encoding, если клиент его принимает, иначе распаковывается потоком
+FILES_COMPRESSION_ENABLED = config('FILES_COMPRESSION_ENABLED', default=False, cast=bool)
+# Правила выбора кодека по MIME-типу (первое совпадение): gzip или zstd (zstd - если установлен zstandard)
+FILES_COMPRESSION_CODECS = config(
+    'FILES_COMPRESSION_CODECS',
+    default='text/csv=zstd,text/plain=zstd,application/x-ndjson=zstd,application/json=gzip,'
+            'application/xml=gzip,image/svg+xml=gzip,text/*=gzip',
+)
+# Файлы меньше этого размера в байтах не сжимаются
+FILES_COMPRESSION_MIN_SIZE = config('FILES_COMPRESSION_MIN_SIZE', default=4096, cast=int)
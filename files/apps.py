@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class FilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'files'
+
+    def ready(self):
+        if settings.FILES_METRICS_ENABLED:
+            connection_created.connect(_instrument_connection, dispatch_uid='files-metrics-db')
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    # Соединения создаются в каждом потоке отдельно, поэтому обертка подключается к каждому новому
+    from files.services.metrics import db_execute_wrapper
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
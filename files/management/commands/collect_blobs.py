@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.services.fileStorage_service import FileStorageService
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает ссылки на содержимое в хранилище блобов и удаляет содержимое без ссылок"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="Не трогать содержимое, загруженное или получившее ссылку менее указанного "
+                                 "числа секунд назад (загрузка может быть не завершена)")
+
+    def handle(self, *args, **options):
+        service = FileStorageService()
+        created_before = timezone.now() - timedelta(seconds=options['min_age'])
+        deleted = service.collect_blobs(created_before)
+        self.stdout.write(self.style.SUCCESS(f"Удалено содержимого без ссылок: {deleted}"))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.services.fileStorage_service import FileStorageService
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные загрузки: незавершенные возобновляемые загрузки и multipart upload в бакете"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.FILES_RESUMABLE_UPLOAD_EXPIRES,
+                            help="Удалять загрузки без активности дольше указанного числа секунд")
+
+    def handle(self, *args, **options):
+        service = FileStorageService()
+        updated_before = timezone.now() - timedelta(seconds=options['max_age'])
+        removed = service.collect_resumable_uploads(updated_before)
+        self.stdout.write(self.style.SUCCESS(f"Удалено брошенных загрузок: {removed}"))
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from files.models import FileObject
+from files.services import compression
+from files.services.fileStorage_service import FileStorageService
+from botocore.exceptions import ClientError
+from collections import defaultdict
+import mimetypes
+
+
+class Command(BaseCommand):
+    help = ("Отчет о сжатии по MIME-типам: сколько занимают хранимые файлы (head_object на каждый файл), "
+            "а также степень сжатия и скорость gzip и zstd на выборке файлов")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help="Только файлы указанного пользователя")
+        parser.add_argument('--sample', type=int, default=20,
+                            help="Сколько файлов каждого типа сжимать для замера кодеков")
+        parser.add_argument('--max-size', type=int, default=16 * 1024 * 1024,
+                            help="Файлы больше указанного размера в байтах не участвуют в замере")
+
+    def handle(self, *args, **options):
+        service = FileStorageService()
+        user_id = options.get('user_id')
+        prefix = f"user-{user_id}-files/" if user_id else 'user-'
+        codecs = [compression.CODEC_GZIP] + ([compression.CODEC_ZSTD] if compression.zstd_supported() else [])
+
+        # {MIME-тип: {'files', 'stored', 'compressed', 'original', 'sampled', 'sample_bytes', кодек: [байт, с, с]}}
+        report = defaultdict(lambda: defaultdict(int))
+
+        for key, content_type in self._iter_files(service, prefix):
+            try:
+                info = service.get_object_info(key)
+            except ClientError as e:
+                if not service._is_missing(e):
+                    raise
+                continue
+            stats = report[content_type]
+            stats['files'] += 1
+            stats['stored'] += info['size']
+            if info['codec']:
+                stats['compressed'] += 1
+            logical_size = info['original_size'] if info['codec'] else info['size']
+            stats['original'] += logical_size or 0
+
+            if stats['sampled'] >= options['sample'] or not logical_size or logical_size > options['max_size']:
+                continue
+            data = b''.join(service.open_object(key, if_match=info['etag']))
+            stats['sampled'] += 1
+            stats['sample_bytes'] += len(data)
+            for codec in codecs:
+                measured = compression.measure(data, codec)
+                totals = stats.setdefault(codec, [0, 0.0, 0.0])
+                totals[0] += measured['size']
+                totals[1] += measured['compress_seconds']
+                totals[2] += measured['decompress_seconds']
+
+        rules = compression.parse_rules(settings.FILES_COMPRESSION_CODECS)
+        for content_type, stats in sorted(report.items(), key=lambda item: -item[1]['stored']):
+            chosen = compression.choose_codec(content_type, rules) or '-'
+            original = f"{stats['original']} байт" if stats['original'] else "?"
+            self.stdout.write(
+                f"{content_type}: файлов {stats['files']} (сжато {stats['compressed']}), "
+                f"в хранилище {stats['stored']} байт, исходно {original}, кодек по правилам: {chosen}"
+            )
+            for codec in codecs:
+                if codec not in stats:
+                    continue
+                size, compress_seconds, decompress_seconds = stats[codec]
+                self.stdout.write(
+                    f"    {codec}: x{stats['sample_bytes'] / max(size, 1):.2f}, "
+                    f"сжатие {_throughput(stats['sample_bytes'], compress_seconds)}, "
+                    f"распаковка {_throughput(stats['sample_bytes'], decompress_seconds)} "
+                    f"(выборка {stats['sampled']} файлов, {stats['sample_bytes']} байт)"
+                )
+
+        stored = sum(stats['stored'] for stats in report.values())
+        original = sum(stats['original'] for stats in report.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Всего файлов: {sum(stats['files'] for stats in report.values())}, в хранилище {stored} байт, "
+            f"исходно {original} байт" + (f" (x{original / stored:.2f})" if stored else "")
+        ))
+
+    @staticmethod
+    def _iter_files(service: FileStorageService, prefix: str):
+        """
+        Перебирает файлы (без папок) вместе с MIME-типом: по индексу метаданных, если он включен, иначе по листингу.
+        """
+        if service.file_repository is not None:
+            rows = FileObject.objects.filter(key__startswith=prefix, is_folder=False).order_by('key')
+            for key, content_type in rows.values_list('key', 'content_type').iterator():
+                yield key, content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+            return
+
+        paginator = service.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=service.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    yield obj['Key'], mimetypes.guess_type(obj['Key'])[0] or 'application/octet-stream'
+
+
+def _throughput(size: int, seconds: float) -> str:
+    return f"{size / seconds / 1024 ** 2:.1f} МБ/с" if seconds else "-"
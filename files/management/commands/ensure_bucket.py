@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from botocore.exceptions import BotoCoreError, ClientError
+from files.services.fileStorage_service import FileStorageService
+
+
+class Command(BaseCommand):
+    help = "Проверяет доступность MinIO и наличие бакета, создает бакет при необходимости"
+
+    def handle(self, *args, **options):
+        service = FileStorageService()
+        try:
+            service.ensure_bucket()
+        except (BotoCoreError, ClientError) as e:
+            raise CommandError(f"Бакет {service.bucket_name} недоступен: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Бакет {service.bucket_name} доступен"))
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from files.models import FileObject
+from files.repositories.usage_repository import UsageRepository
+from files.services.fileStorage_service import FileStorageService
+from collections import defaultdict
+import re
+
+USER_KEY_PATTERN = re.compile(r'^user-(\d+)-files/')
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает занятое пользователями место по содержимому бакета"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help="Пересчитать только указанного пользователя")
+
+    def handle(self, *args, **options):
+        user_id = options.get('user_id')
+        service = FileStorageService()
+        repository = UsageRepository()
+        user_model = get_user_model()
+
+        prefix = f"user-{user_id}-files/" if user_id else 'user-'
+        # {user_id: {папка верхнего уровня: [байт, файлов]}}
+        usage = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+
+        paginator = service.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=service.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                match = USER_KEY_PATTERN.match(obj['Key'])
+                # Маркеры папок не занимают места и не считаются файлами
+                if not match or obj['Key'].endswith('/'):
+                    continue
+                key_user_id = int(match.group(1))
+                folder = UsageRepository.top_folder(key_user_id, obj['Key'])
+                usage[key_user_id][folder][0] += obj.get('Size', 0)
+                usage[key_user_id][folder][1] += 1
+
+        # Файлы с дедупликацией хранятся вне папок пользователей и учитываются по индексу
+        blob_files = FileObject.objects.filter(blob__isnull=False, key__startswith=prefix)
+        for key_user_id, key, size in blob_files.values_list('user_id', 'key', 'size').iterator():
+            folder = UsageRepository.top_folder(key_user_id, key)
+            usage[key_user_id][folder][0] += size
+            usage[key_user_id][folder][1] += 1
+
+        user_ids = [user_id] if user_id else list(usage)
+        existing_users = set(user_model.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        for reconcile_user_id in user_ids:
+            if reconcile_user_id not in existing_users:
+                continue
+            folders = {folder: tuple(values) for folder, values in usage[reconcile_user_id].items()}
+            repository.replace(reconcile_user_id, folders)
+
+        reset = 0 if user_id else repository.reset_missing(existing_users)
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано пользователей: {len(existing_users)}, обнулено без файлов: {reset}"
+        ))
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.repositories.file_repository import FileRepository
+from files.services.fileStorage_service import FileStorageService
+from collections import defaultdict
+import re
+
+USER_KEY_PATTERN = re.compile(r'^user-(\d+)-files/')
+
+
+class Command(BaseCommand):
+    help = "Перестраивает индекс метаданных файлов по содержимому бакета"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help="Сверить только файлы указанного пользователя")
+
+    def handle(self, *args, **options):
+        user_id = options.get('user_id')
+        service = FileStorageService()
+        repository = FileRepository()
+        user_model = get_user_model()
+
+        started = timezone.now()
+        prefix = f"user-{user_id}-files/" if user_id else 'user-'
+        indexed = 0
+
+        paginator = service.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=service.bucket_name, Prefix=prefix):
+            objects_by_user = defaultdict(list)
+            for obj in page.get('Contents', []):
+                match = USER_KEY_PATTERN.match(obj['Key'])
+                if not match:
+                    continue
+                objects_by_user[int(match.group(1))].append({
+                    'key': obj['Key'],
+                    'size': obj.get('Size', 0),
+                    'last_modified': obj.get('LastModified'),
+                    'etag': obj.get('ETag'),
+                })
+
+            existing_users = set(user_model.objects.filter(pk__in=objects_by_user).values_list('pk', flat=True))
+            for page_user_id, objects in objects_by_user.items():
+                if page_user_id not in existing_users:
+                    continue
+                repository.upsert_objects(page_user_id, objects)
+                indexed += len(objects)
+
+        removed = repository.delete_stale(started, user_id=user_id)
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано объектов: {indexed}, удалено устаревших записей: {removed}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.services.fileStorage_service import FileStorageService
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = "Завершает переименования папок, прерванные падением процесса, по журналам в бакете"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=1800,
+                            help="Не трогать переименования, журнал которых обновлялся менее указанного "
+                                 "числа секунд назад (операция может еще выполняться в другом процессе)")
+
+    def handle(self, *args, **options):
+        service = FileStorageService()
+        updated_before = timezone.now() - timedelta(seconds=options['min_age'])
+        completed = service.resume_renames(updated_before)
+        self.stdout.write(self.style.SUCCESS(f"Завершено переименований: {completed}"))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from files.services.job_service import JobService
+import os
+import socket
+import threading
+import uuid
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых операций над файлами: выполняет операции из очереди в базе данных"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Выполнить операции, уже стоящие в очереди, и завершиться")
+        parser.add_argument('--poll-interval', type=float, default=settings.FILES_JOB_POLL_INTERVAL,
+                            help="Интервал опроса пустой очереди в секундах")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Количество потоков, одновременно выполняющих операции (например, миниатюры)")
+
+    def handle(self, *args, **options):
+        service = JobService()
+        worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Воркер {worker} запущен, потоков: {workers}")
+
+        stop = threading.Event()
+        processed = [0] * workers
+        threads = [
+            threading.Thread(target=self._work, args=(service, f"{worker}:{number}", options, stop, processed, number),
+                             name=f"files-worker-{number}", daemon=True)
+            for number in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # Потоки завершают текущие операции; прерванные операции перезапустит requeue_stale
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.stdout.write("Воркер остановлен")
+
+        self.stdout.write(self.style.SUCCESS(f"Обработано операций: {sum(processed)}"))
+
+    @staticmethod
+    def _work(service: JobService, worker: str, options: dict, stop: threading.Event,
+              processed: list, number: int) -> None:
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                service.requeue_stale()
+                if service.run_next(worker):
+                    processed[number] += 1
+                    continue
+                if options['once']:
+                    break
+                stop.wait(options['poll_interval'])
+        finally:
+            # У каждого потока собственное соединение с базой данных
+            connection.close()
@@ -0,0 +1,66 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from files.services import metrics
+import time
+
+
+class StorageMetricsMiddleware:
+    """
+    Учет времени HTTP-запросов с разбивкой на S3, базу данных и остальное (приложение и шаблоны).
+
+    Итоги запроса попадают в метрики Prometheus и, при FILES_SERVER_TIMING_ENABLED, в заголовок
+    Server-Timing. При FILES_METRICS_ENABLED = False middleware исключается из цепочки при запуске.
+    Время потоковой отдачи ответа (StreamingHttpResponse) в итоги запроса не входит.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.FILES_METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.server_timing = settings.FILES_SERVER_TIMING_ENABLED
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._finish(request, response, request_metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._finish(request, response, request_metrics, time.perf_counter() - started)
+
+    def _finish(self, request, response, request_metrics: metrics.RequestMetrics, elapsed: float):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+
+        metrics.registry.inc('files_http_requests_total',
+                             {'view': view, 'method': request.method, 'status': str(response.status_code)})
+        metrics.registry.observe('files_http_request_duration_seconds', {'view': view}, elapsed)
+        metrics.registry.observe('files_http_request_s3_seconds', {'view': view}, request_metrics.s3_seconds)
+        metrics.registry.observe('files_http_request_db_seconds', {'view': view}, request_metrics.db_seconds)
+
+        if self.server_timing:
+            # Параллельные запросы к S3 суммируются, поэтому s3 может оказаться больше total
+            app = max(elapsed - request_metrics.s3_seconds - request_metrics.db_seconds, 0)
+            response['Server-Timing'] = ', '.join((
+                f'total;dur={elapsed * 1000:.1f}',
+                f's3;dur={request_metrics.s3_seconds * 1000:.1f};desc="S3 x{request_metrics.s3_calls}"',
+                f'db;dur={request_metrics.db_seconds * 1000:.1f};desc="DB x{request_metrics.db_queries}"',
+                f'app;dur={app * 1000:.1f}',
+            ))
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=1024)),
+                ('key_hash', models.CharField(max_length=40, unique=True)),
+                ('parent_prefix', models.CharField(max_length=1024)),
+                ('parent_hash', models.CharField(max_length=40)),
+                ('name', models.CharField(max_length=255)),
+                ('is_folder', models.BooleanField(default=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('content_type', models.CharField(blank=True, default='', max_length=255)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_objects', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['parent_hash', 'is_folder', 'name'], name='files_obj_parent_name_idx'), models.Index(fields=['parent_hash', 'size'], name='files_obj_parent_size_idx'), models.Index(fields=['parent_hash', 'last_modified'], name='files_obj_parent_mtime_idx'), models.Index(fields=['user', 'name'], name='files_obj_user_name_idx')],
+            },
+        ),
+    ]
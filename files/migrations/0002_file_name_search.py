@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_name_search_index(apps, schema_editor):
+    FileObject = apps.get_model('files', 'FileObject')
+    FileNameTrigram = apps.get_model('files', 'FileNameTrigram')
+
+    last_pk = 0
+    while True:
+        rows = list(FileObject.objects.filter(pk__gt=last_pk).order_by('pk')[:1000])
+        if not rows:
+            break
+        trigrams = []
+        for row in rows:
+            row.name_lower = row.name.lower()
+            trigrams += [FileNameTrigram(file_id=row.pk, user_id=row.user_id, trigram=trigram)
+                         for trigram in {row.name_lower[i:i + 3] for i in range(len(row.name_lower) - 2)}]
+        FileObject.objects.bulk_update(rows, ['name_lower'])
+        FileNameTrigram.objects.bulk_create(trigrams)
+        last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileNameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fileobject',
+            name='name_lower',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='fileobject',
+            index=models.Index(fields=['user', 'name_lower'], name='files_obj_user_lname_idx'),
+        ),
+        migrations.AddField(
+            model_name='filenametrigram',
+            name='file',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='files.fileobject'),
+        ),
+        migrations.AddField(
+            model_name='filenametrigram',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='filenametrigram',
+            index=models.Index(fields=['user', 'trigram', 'file'], name='files_trigram_user_idx'),
+        ),
+        migrations.RunPython(fill_name_search_index, migrations.RunPython.noop),
+    ]
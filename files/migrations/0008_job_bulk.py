@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_resumable_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('delete', 'Удаление'), ('rename', 'Переименование'), ('bulk_delete', 'Удаление выбранных'), ('move', 'Перемещение'), ('thumbnail', 'Миниатюра')], max_length=20),
+        ),
+    ]
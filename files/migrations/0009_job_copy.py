@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_job_bulk'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('delete', 'Удаление'), ('rename', 'Переименование'), ('bulk_delete', 'Удаление выбранных'), ('move', 'Перемещение'), ('copy', 'Копирование'), ('thumbnail', 'Миниатюра')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_job_copy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='acquired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
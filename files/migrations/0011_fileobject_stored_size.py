@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_blob_acquired_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileobject',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,211 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+import hashlib
+import uuid
+
+
+def key_hash(value: str) -> str:
+    """Хэш ключа S3 для уникальных индексов: ключи до 1024 байт не помещаются в индекс MySQL"""
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def name_trigrams(name: str) -> set[str]:
+    """Множество триграмм имени в нижнем регистре для поискового индекса"""
+    name = name.lower()
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+class Blob(models.Model):
+    """Содержимое файла, хранящееся в S3 один раз под ключом по SHA-256 (режим дедупликации)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(default=0)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    # Количество записей FileObject, ссылающихся на содержимое
+    ref_count = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Время последнего добавления ссылки: запись индекса нового файла появляется чуть позже
+    acquired_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.sha256}: {self.ref_count}"
+
+
+class FileObject(models.Model):
+    """Запись индекса метаданных объекта пользователя в S3"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='file_objects')
+    key = models.CharField(max_length=1024)
+    key_hash = models.CharField(max_length=40, unique=True)
+    parent_prefix = models.CharField(max_length=1024)
+    parent_hash = models.CharField(max_length=40)
+    name = models.CharField(max_length=255)
+    name_lower = models.CharField(max_length=255, default='')
+    is_folder = models.BooleanField(default=False)
+    size = models.BigIntegerField(default=0)
+    # Размер объекта в S3, если файл хранится сжатым (size - исходный размер); None - совпадает с size
+    stored_size = models.BigIntegerField(null=True, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    # Содержимое в хранилище блобов; None - объект хранится в S3 под собственным ключом
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='file_objects')
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parent_hash', 'is_folder', 'name'], name='files_obj_parent_name_idx'),
+            models.Index(fields=['parent_hash', 'size'], name='files_obj_parent_size_idx'),
+            models.Index(fields=['parent_hash', 'last_modified'], name='files_obj_parent_mtime_idx'),
+            models.Index(fields=['user', 'name'], name='files_obj_user_name_idx'),
+            models.Index(fields=['user', 'name_lower'], name='files_obj_user_lname_idx'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def occupied_size(self) -> int:
+        """Место, которое файл занимает в хранилище и в квоте пользователя"""
+        return self.stored_size if self.stored_size is not None else self.size
+
+    def save(self, *args, **kwargs):
+        self.key_hash = key_hash(self.key)
+        self.parent_hash = key_hash(self.parent_prefix)
+        self.name_lower = self.name.lower()
+        super().save(*args, **kwargs)
+
+
+class FileNameTrigram(models.Model):
+    """Триграмма имени объекта для поиска по подстроке без сканирования всех имен пользователя"""
+    file = models.ForeignKey(FileObject, on_delete=models.CASCADE, related_name='trigrams')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'trigram', 'file'], name='files_trigram_user_idx'),
+        ]
+
+
+class StorageUsage(models.Model):
+    """Суммарный объем файлов пользователя в S3, обновляемый при каждом изменении"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='storage_usage')
+    bytes_used = models.BigIntegerField(default=0)
+    objects_count = models.BigIntegerField(default=0)
+    # Индивидуальная квота; None - квота по умолчанию FILES_USER_QUOTA_BYTES
+    quota_bytes = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.bytes_used}"
+
+
+class FolderUsage(models.Model):
+    """Объем файлов в папке верхнего уровня пользователя ('' - файлы в корне)"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='folder_usage')
+    folder = models.CharField(max_length=255)
+    bytes_used = models.BigIntegerField(default=0)
+    objects_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'folder'], name='files_folder_usage_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.folder}: {self.bytes_used}"
+
+
+class Job(models.Model):
+    """Фоновая операция над файлами пользователя, выполняемая воркером run_jobs"""
+    KIND_DELETE = 'delete'
+    KIND_RENAME = 'rename'
+    KIND_BULK_DELETE = 'bulk_delete'
+    KIND_MOVE = 'move'
+    KIND_COPY = 'copy'
+    # Служебная операция: не показывается пользователю и удаляется после выполнения
+    KIND_THUMBNAIL = 'thumbnail'
+    KIND_CHOICES = [
+        (KIND_DELETE, 'Удаление'),
+        (KIND_RENAME, 'Переименование'),
+        (KIND_BULK_DELETE, 'Удаление выбранных'),
+        (KIND_MOVE, 'Перемещение'),
+        (KIND_COPY, 'Копирование'),
+        (KIND_THUMBNAIL, 'Миниатюра'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCEEDED, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_CANCELLED, 'Отменена'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='file_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Параметры операции: 's3_key' и для переименования 'new_name', для перемещения и копирования 'new_key';
+    # для операций над выбором - 's3_keys' и для перемещения 'destination'
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # Текущий этап операции ('copy' или 'delete') и количество обработанных на нем объектов
+    stage = models.CharField(max_length=20, blank=True, default='')
+    processed = models.BigIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=255, blank=True, default='')
+    # Не запускать раньше этого времени (задержка перед повторной попыткой)
+    run_after = models.DateTimeField(default=timezone.now)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='files_job_queue_idx'),
+            models.Index(fields=['user', 'status'], name='files_job_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.params.get('s3_key', '')}: {self.status}"
+
+
+class ResumableUpload(models.Model):
+    """Возобновляемая загрузка файла по частям (протокол в духе tus)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='resumable_uploads')
+    s3_key = models.CharField(max_length=1024)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    size = models.BigIntegerField()
+    # Количество принятых байт: части multipart upload и сегменты неполной части
+    offset = models.BigIntegerField(default=0)
+    part_size = models.BigIntegerField()
+    # Multipart upload создается при первой полной части; ETag загруженных частей по порядку
+    multipart_id = models.CharField(max_length=1024, blank=True, default='')
+    parts = models.JSONField(default=list)
+    # Принятые данные неполной части: [смещение, размер] объектов под служебным префиксом
+    segments = models.JSONField(default=list)
+    # Блокировка на время запроса PATCH, чтобы параллельные запросы не дописывали одну загрузку
+    lock_token = models.CharField(max_length=32, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='files_upload_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.s3_key}: {self.offset}/{self.size}"
@@ -0,0 +1,98 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from files.models import Blob, FileObject
+from datetime import datetime
+from typing import Optional
+
+
+class BlobRepository:
+    """Учет содержимого файлов в хранилище блобов и ссылок на него"""
+
+    def acquire(self, sha256: str) -> Optional[Blob]:
+        """
+        Добавляет ссылку на уже сохраненное содержимое.
+
+        :param sha256: Хэш содержимого
+
+        :return: Blob - Запись содержимого или None, если такого содержимого еще нет
+        """
+        if not Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1, acquired_at=timezone.now()):
+            return None
+        return Blob.objects.get(sha256=sha256)
+
+    def create(self, sha256: str, size: int, etag: str, content_type: str) -> Blob:
+        """
+        Регистрирует только что загруженное содержимое с одной ссылкой.
+
+        Если то же содержимое параллельно загрузил другой запрос, добавляется ссылка на его запись.
+
+        :return: Blob - Запись содержимого
+        """
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(sha256=sha256, size=size, etag=(etag or '').strip('"'),
+                                           content_type=content_type or '', ref_count=1, acquired_at=timezone.now())
+        except IntegrityError:
+            blob = self.acquire(sha256)
+            if blob is None:
+                raise
+            return blob
+
+    def add_refs(self, counts: dict[int, int]) -> None:
+        """
+        Добавляет ссылки на сохраненное содержимое (при копировании файлов).
+
+        :param counts: Словарь {идентификатор Blob: количество добавляемых ссылок}
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            for blob_id, count in counts.items():
+                if blob_id is not None and count:
+                    Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') + count, acquired_at=now)
+
+    def release(self, counts: dict[int, int]) -> list[int]:
+        """
+        Снимает ссылки на содержимое.
+
+        :param counts: Словарь {идентификатор Blob: количество снимаемых ссылок}
+
+        :return: list[int] - Идентификаторы содержимого, на которое не осталось ссылок
+        """
+        counts = {blob_id: count for blob_id, count in counts.items() if blob_id is not None and count}
+        if not counts:
+            return []
+
+        with transaction.atomic():
+            for blob_id, count in counts.items():
+                Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - count)
+            return list(Blob.objects.filter(pk__in=list(counts), ref_count__lte=0).values_list('pk', flat=True))
+
+    def lock_unreferenced(self, blob_id: int) -> Optional[Blob]:
+        """
+        Блокирует запись содержимого без ссылок до конца текущей транзакции.
+
+        Пока запись заблокирована, acquire для того же содержимого ждет, поэтому
+        объект в S3 можно удалить, не потеряв параллельно добавленную ссылку.
+
+        :return: Blob - Запись содержимого или None, если на него снова есть ссылки
+        """
+        return Blob.objects.select_for_update().filter(pk=blob_id, ref_count__lte=0).first()
+
+    def recount(self, created_before: datetime) -> list[int]:
+        """
+        Пересчитывает ссылки по записям индекса.
+
+        Учитываются только записи, созданные и получавшие ссылки до created_before: у только что
+        загруженного или повторно загруженного (acquire) содержимого запись индекса может еще не появиться.
+
+        :return: list[int] - Идентификаторы содержимого, на которое нет ссылок
+        """
+        references = (FileObject.objects.filter(blob=OuterRef('pk'))
+                      .order_by().values('blob').annotate(total=Count('pk')).values('total'))
+        settled = Blob.objects.filter(Q(acquired_at__isnull=True) | Q(acquired_at__lt=created_before),
+                                      created_at__lt=created_before)
+        with transaction.atomic():
+            settled.update(ref_count=Coalesce(Subquery(references), 0))
+            return list(settled.filter(ref_count__lte=0).values_list('pk', flat=True))
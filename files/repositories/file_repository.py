@@ -0,0 +1,400 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from files.models import FileObject, FileNameTrigram, key_hash, name_trigrams
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+# Поля, по которым разрешена сортировка листинга
+SORT_FIELDS = {
+    'name': 'name',
+    '-name': '-name',
+    'size': 'size',
+    '-size': '-size',
+    'last_modified': 'last_modified',
+    '-last_modified': '-last_modified',
+}
+
+BATCH_SIZE = 1000
+
+
+class FileRepository:
+    """Работа с индексом метаданных объектов пользователей в базе данных"""
+
+    def upsert_objects(self, user_id: int, objects: Iterable[dict]) -> None:
+        """
+        Добавляет или обновляет записи файлов и создает записи всех папок на их пути.
+
+        :param user_id: Идентификатор пользователя Django
+        :param objects: Словари с ключами 'key', 'size', 'last_modified', 'etag', 'content_type',
+            'stored_size' (для сжатого файла) и 'blob_id' (для содержимого в хранилище блобов)
+        """
+        rows = []
+        folders = set()
+        for obj in objects:
+            key = obj['key']
+            folders.update(self._ancestor_folders(user_id, key))
+            if key.endswith('/'):
+                folders.add(key)
+                continue
+            rows.append(self._build(
+                user_id, key,
+                size=obj.get('size', 0),
+                stored_size=obj.get('stored_size'),
+                last_modified=obj.get('last_modified') or timezone.now(),
+                etag=(obj.get('etag') or '').strip('"'),
+                content_type=obj.get('content_type') or '',
+                blob_id=obj.get('blob_id'),
+            ))
+
+        with transaction.atomic():
+            self.ensure_folders(user_id, folders)
+            for i in range(0, len(rows), BATCH_SIZE):
+                batch = rows[i:i + BATCH_SIZE]
+                self._bulk_upsert(batch, ['size', 'stored_size', 'last_modified', 'etag', 'content_type', 'blob',
+                                          'indexed_at'])
+                self._index_new_names([row.key_hash for row in batch])
+
+    def ensure_folders(self, user_id: int, folder_keys: Iterable[str]) -> None:
+        """
+        Создает записи папок, если их еще нет.
+
+        :param user_id: Идентификатор пользователя Django
+        :param folder_keys: Полные ключи папок с завершающим '/'
+        """
+        user_prefix = f"user-{user_id}-files/"
+        rows = [self._build(user_id, key, is_folder=True) for key in folder_keys if key != user_prefix]
+        for i in range(0, len(rows), BATCH_SIZE):
+            batch = rows[i:i + BATCH_SIZE]
+            self._bulk_upsert(batch, ['indexed_at'])
+            self._index_new_names([row.key_hash for row in batch])
+
+    def delete_keys(self, user_id: int, keys: Iterable[str]) -> int:
+        """
+        Удаляет записи по полным ключам.
+
+        :return: Количество удаленных записей
+        """
+        hashes = [key_hash(key) for key in keys]
+        deleted = 0
+        for i in range(0, len(hashes), BATCH_SIZE):
+            deleted += FileObject.objects.filter(user_id=user_id, key_hash__in=hashes[i:i + BATCH_SIZE]).delete()[0]
+        return deleted
+
+    def delete_prefix(self, user_id: int, prefix: str, exclude_keys: Iterable[str] = ()) -> int:
+        """
+        Удаляет записи папки и всего ее содержимого.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Полный ключ папки с завершающим '/'
+        :param exclude_keys: Ключи, которые нужно сохранить (например, не удаленные из S3)
+
+        :return: Количество удаленных записей
+        """
+        queryset = FileObject.objects.filter(user_id=user_id, key__startswith=prefix)
+        exclude_hashes = [key_hash(key) for key in exclude_keys]
+        if exclude_hashes:
+            queryset = queryset.exclude(key_hash__in=exclude_hashes)
+        return queryset.delete()[0]
+
+    def move_key(self, user_id: int, old_key: str, new_key: str) -> None:
+        """
+        Переносит запись файла на новый ключ.
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_key: Прежний полный ключ
+        :param new_key: Новый полный ключ
+        """
+        with transaction.atomic():
+            FileObject.objects.filter(user_id=user_id, key_hash=key_hash(new_key)).delete()
+            row = FileObject.objects.filter(user_id=user_id, key_hash=key_hash(old_key)).first()
+            if row is None:
+                return
+            old_name = row.name
+            self._assign_key(row, new_key)
+            row.save()
+            if row.name != old_name:
+                self._reindex_names([row])
+            self.ensure_folders(user_id, self._ancestor_folders(user_id, new_key))
+
+    def move_prefix(self, user_id: int, old_prefix: str, new_prefix: str) -> int:
+        """
+        Переносит записи папки и всего ее содержимого под новый префикс.
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_prefix: Прежний полный ключ папки с завершающим '/'
+        :param new_prefix: Новый полный ключ папки с завершающим '/'
+
+        :return: Количество перенесенных записей
+        """
+        moved = 0
+        with transaction.atomic():
+            queryset = FileObject.objects.filter(user_id=user_id, key__startswith=old_prefix).order_by('pk')
+            last_pk = 0
+            while True:
+                rows = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+                if not rows:
+                    break
+                renamed = []
+                for row in rows:
+                    old_name = row.name
+                    self._assign_key(row, f"{new_prefix}{row.key[len(old_prefix):]}")
+                    if row.name != old_name:
+                        renamed.append(row)
+                FileObject.objects.bulk_update(
+                    rows, ['key', 'key_hash', 'parent_prefix', 'parent_hash', 'name', 'name_lower'])
+                # Имена вложенных объектов не меняются, поисковый индекс обновляется только для переименованных
+                self._reindex_names(renamed)
+                moved += len(rows)
+                last_pk = rows[-1].pk
+
+            self.ensure_folders(user_id, self._ancestor_folders(user_id, new_prefix) | {new_prefix})
+        return moved
+
+    def copy_prefix(self, user_id: int, old_prefix: str, new_prefix: str) -> int:
+        """
+        Копирует записи папки и всего ее содержимого под новый префикс (существующие записи обновляются).
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_prefix: Полный ключ исходной папки с завершающим '/'
+        :param new_prefix: Полный ключ новой папки с завершающим '/'
+
+        :return: Количество скопированных записей
+        """
+        copied = 0
+        with transaction.atomic():
+            batch = []
+            for row in self.iter_prefix(user_id, old_prefix):
+                batch.append(self._build(
+                    user_id, f"{new_prefix}{row.key[len(old_prefix):]}",
+                    is_folder=row.is_folder,
+                    size=row.size,
+                    stored_size=row.stored_size,
+                    last_modified=row.last_modified,
+                    etag=row.etag,
+                    content_type=row.content_type,
+                    blob_id=row.blob_id,
+                ))
+                if len(batch) == BATCH_SIZE:
+                    copied += self._upsert_rows(batch)
+                    batch = []
+            copied += self._upsert_rows(batch)
+
+            self.ensure_folders(user_id, self._ancestor_folders(user_id, new_prefix) | {new_prefix})
+        return copied
+
+    def prefix_totals(self, user_id: int, prefix: str) -> dict:
+        """
+        :return: dict - Занятое место и количество файлов папки по индексу: ключи 'bytes' и 'files'
+        """
+        totals = (FileObject.objects.filter(user_id=user_id, key__startswith=prefix, is_folder=False)
+                  .aggregate(bytes=Sum(Coalesce('stored_size', 'size')), files=Count('pk')))
+        return {'bytes': totals['bytes'] or 0, 'files': totals['files']}
+
+    def list_children(self, user_id: int, parent_prefix: str, order_by: str = 'name',
+                      offset: int = 0, limit: int = 1000) -> list[dict]:
+        """
+        Возвращает содержимое папки из индекса: сначала папки, затем файлы.
+
+        :param user_id: Идентификатор пользователя Django
+        :param parent_prefix: Полный ключ папки с завершающим '/'
+        :param order_by: Поле сортировки из SORT_FIELDS
+        :param offset: Смещение от начала списка
+        :param limit: Максимальное количество элементов
+
+        :return: list[dict] - Элементы в формате FileStorageService.list_files
+        """
+        queryset = (FileObject.objects
+                    .filter(user_id=user_id, parent_hash=key_hash(parent_prefix))
+                    .order_by('-is_folder', SORT_FIELDS.get(order_by, 'name'), 'pk'))
+        return [self.to_item(row) for row in queryset[offset:offset + limit]]
+
+    def search_by_name(self, user_id: int, query: str, limit: int = 100) -> list[dict]:
+        """
+        Ищет файлы и папки пользователя по части имени без учета регистра.
+
+        Запросы короче трех символов ищутся по началу имени через индекс (user, name_lower),
+        более длинные - по пересечению триграмм запроса в индексе FileNameTrigram
+        с последующей проверкой вхождения подстроки только у найденных кандидатов.
+
+        :param user_id: Идентификатор пользователя Django
+        :param query: Часть имени
+        :param limit: Максимальное количество результатов
+
+        :return: list[dict] - Элементы в формате FileStorageService.list_files
+            с дополнительным ключом 'parent_key' - полный ключ папки, содержащей элемент
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        trigrams = name_trigrams(query)
+        if trigrams:
+            candidates = (FileNameTrigram.objects
+                          .filter(user_id=user_id, trigram__in=trigrams)
+                          .values('file_id')
+                          .annotate(matched=Count('trigram', distinct=True))
+                          .filter(matched=len(trigrams))
+                          .values('file_id'))
+            queryset = FileObject.objects.filter(pk__in=candidates, name_lower__contains=query)
+        else:
+            queryset = FileObject.objects.filter(user_id=user_id, name_lower__startswith=query)
+
+        items = []
+        for row in queryset.order_by('-is_folder', 'name_lower')[:limit]:
+            item = self.to_item(row)
+            item['parent_key'] = row.parent_prefix
+            items.append(item)
+        return items
+
+    def get_by_key(self, user_id: int, key: str) -> Optional[FileObject]:
+        return FileObject.objects.filter(user_id=user_id, key_hash=key_hash(key)).select_related('blob').first()
+
+    def get_many(self, user_id: int, keys: Iterable[str]) -> dict[str, FileObject]:
+        """
+        :return: dict[str, FileObject] - Записи найденных ключей {полный ключ: запись}
+        """
+        hashes = [key_hash(key) for key in keys]
+        rows = {}
+        for i in range(0, len(hashes), BATCH_SIZE):
+            queryset = (FileObject.objects.filter(user_id=user_id, key_hash__in=hashes[i:i + BATCH_SIZE])
+                        .select_related('blob'))
+            rows.update((row.key, row) for row in queryset)
+        return rows
+
+    def iter_prefix(self, user_id: int, prefix: str) -> Iterator[FileObject]:
+        """
+        Перебирает записи папки и всего ее содержимого в порядке ключей, как листинг S3.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Полный ключ папки с завершающим '/'
+        """
+        queryset = (FileObject.objects.filter(user_id=user_id, key__startswith=prefix)
+                    .select_related('blob').order_by('key'))
+        return queryset.iterator(chunk_size=BATCH_SIZE)
+
+    def prefix_exists(self, user_id: int, prefix: str) -> bool:
+        return FileObject.objects.filter(user_id=user_id, key__startswith=prefix).exists()
+
+    def count_blob_refs(self, user_id: int, prefix: str) -> dict:
+        """
+        Считает файлы папки, содержимое которых хранится в хранилище блобов.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Полный ключ папки с завершающим '/'
+
+        :return: dict - Словарь с ключами 'bytes', 'files' и 'blobs' ({идентификатор Blob: количество ссылок})
+        """
+        rows = list(FileObject.objects.filter(user_id=user_id, key__startswith=prefix, blob__isnull=False)
+                    .order_by().values('blob_id').annotate(files=Count('pk'), bytes=Sum('size')))
+        blobs = {row['blob_id']: row['files'] for row in rows}
+        return {
+            'bytes': sum(row['bytes'] or 0 for row in rows),
+            'files': sum(blobs.values()),
+            'blobs': blobs,
+        }
+
+    def delete_stale(self, indexed_before: datetime, user_id: Optional[int] = None) -> int:
+        """
+        Удаляет записи, не подтвержденные при последней сверке с бакетом.
+
+        :param indexed_before: Время начала сверки
+        :param user_id: Идентификатор пользователя или None для всех пользователей
+
+        :return: Количество удаленных записей
+        """
+        # Файлы в хранилище блобов не видны в листинге папок пользователей и сверкой не подтверждаются
+        queryset = FileObject.objects.filter(indexed_at__lt=indexed_before, blob__isnull=True)
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset.delete()[0]
+
+    @staticmethod
+    def to_item(row: FileObject) -> dict:
+        if row.is_folder:
+            return {'type': 'folder', 'name': row.name, 'full_key': row.key}
+        return {
+            'type': 'file',
+            'name': row.name,
+            'full_key': row.key,
+            'size': row.size,
+            'last_modified': row.last_modified,
+        }
+
+    def _build(self, user_id: int, key: str, **fields) -> FileObject:
+        row = FileObject(user_id=user_id, **fields)
+        self._assign_key(row, key)
+        return row
+
+    @staticmethod
+    def _assign_key(row: FileObject, key: str) -> None:
+        parent_prefix, _, name = key.rstrip('/').rpartition('/')
+        row.key = key
+        row.key_hash = key_hash(key)
+        row.parent_prefix = f"{parent_prefix}/"
+        row.parent_hash = key_hash(row.parent_prefix)
+        row.name = name
+        row.name_lower = name.lower()
+
+    def _upsert_rows(self, rows: list[FileObject]) -> int:
+        if not rows:
+            return 0
+        self._bulk_upsert(rows, ['is_folder', 'size', 'stored_size', 'last_modified', 'etag', 'content_type', 'blob',
+                                 'indexed_at'])
+        self._index_new_names([row.key_hash for row in rows])
+        return len(rows)
+
+    @staticmethod
+    def _bulk_upsert(rows: list[FileObject], update_fields: list[str]) -> None:
+        """
+        Вставляет записи, обновляя поля update_fields у уже существующих ключей.
+
+        MySQL не поддерживает указание уникальных полей конфликта (ON DUPLICATE KEY UPDATE
+        срабатывает на любом уникальном индексе), поэтому unique_fields передаются только
+        базам, где это поддерживается (PostgreSQL, SQLite). Единственный уникальный индекс
+        модели, кроме первичного ключа, - key_hash, так что поведение совпадает.
+        """
+        features = connections[router.db_for_write(FileObject)].features
+        unique_fields = ['key_hash'] if features.supports_update_conflicts_with_target else None
+        FileObject.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+
+    def _index_new_names(self, key_hashes: list[str]) -> None:
+        """
+        Добавляет триграммы имен для записей, у которых их еще нет (то есть только что созданных).
+        """
+        rows = FileObject.objects.filter(key_hash__in=key_hashes, trigrams__isnull=True).only('pk', 'user_id', 'name')
+        FileNameTrigram.objects.bulk_create(self._build_trigrams(rows), batch_size=BATCH_SIZE)
+
+    def _reindex_names(self, rows: list[FileObject]) -> None:
+        """
+        Заменяет триграммы имен переименованных записей.
+        """
+        if not rows:
+            return
+        FileNameTrigram.objects.filter(file_id__in=[row.pk for row in rows]).delete()
+        FileNameTrigram.objects.bulk_create(self._build_trigrams(rows), batch_size=BATCH_SIZE)
+
+    @staticmethod
+    def _build_trigrams(rows: Iterable[FileObject]) -> list[FileNameTrigram]:
+        return [FileNameTrigram(file_id=row.pk, user_id=row.user_id, trigram=trigram)
+                for row in rows for trigram in name_trigrams(row.name)]
+
+    @staticmethod
+    def _ancestor_folders(user_id: int, key: str) -> set[str]:
+        """
+        :return: set[str] - Полные ключи всех папок на пути к объекту, кроме корня пользователя
+        """
+        user_prefix = f"user-{user_id}-files/"
+        parts = key[len(user_prefix):].rstrip('/').split('/')[:-1]
+        folders = set()
+        accumulated = user_prefix
+        for part in parts:
+            accumulated += f"{part}/"
+            folders.add(accumulated)
+        return folders
@@ -0,0 +1,133 @@
+from django.db.models import F
+from django.utils import timezone
+from files.models import Job
+from datetime import datetime
+from typing import Optional
+
+# Количество кандидатов, которые воркер пробует захватить за один вызов claim
+CLAIM_CANDIDATES = 5
+
+
+class JobRepository:
+    """Очередь фоновых операций в базе данных"""
+
+    def create(self, user_id: int, kind: str, params: dict) -> Job:
+        return Job.objects.create(user_id=user_id, kind=kind, params=params)
+
+    def enqueue_once(self, user_id: int, kind: str, params: dict) -> Optional[Job]:
+        """
+        Ставит операцию в очередь, если такая же операция над тем же ключом еще не ожидает выполнения.
+
+        :return: Job - Новая операция или None, если она уже в очереди
+        """
+        if Job.objects.filter(kind=kind, status=Job.STATUS_PENDING, params__s3_key=params['s3_key']).exists():
+            return None
+        return self.create(user_id, kind, params)
+
+    def get(self, user_id: int, job_id: int) -> Optional[Job]:
+        return Job.objects.filter(user_id=user_id, pk=job_id).exclude(kind=Job.KIND_THUMBNAIL).first()
+
+    def list_for_user(self, user_id: int, limit: int = 20) -> list[Job]:
+        """
+        :return: list[Job] - Активные операции пользователя и последние завершенные, новые первыми.
+            Служебные операции (миниатюры) не возвращаются
+        """
+        jobs = Job.objects.filter(user_id=user_id).exclude(kind=Job.KIND_THUMBNAIL)
+        active = list(jobs.filter(status__in=Job.ACTIVE_STATUSES).order_by('-pk'))
+        finished = list(jobs.exclude(status__in=Job.ACTIVE_STATUSES).order_by('-pk')[:max(limit - len(active), 0)])
+        return active + finished
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Захватывает следующую операцию из очереди.
+
+        Захват - условный UPDATE по статусу, поэтому одну операцию не получат два воркера
+        и без поддержки SELECT ... FOR UPDATE SKIP LOCKED в базе данных.
+
+        :param worker: Идентификатор воркера
+
+        :return: Job - Захваченная операция или None, если очередь пуста
+        """
+        now = timezone.now()
+        candidates = (Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now)
+                      .order_by('run_after', 'pk').values_list('pk', flat=True)[:CLAIM_CANDIDATES])
+        for job_id in candidates:
+            claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_PENDING).update(
+                status=Job.STATUS_RUNNING,
+                worker=worker,
+                attempts=F('attempts') + 1,
+                heartbeat_at=now,
+                started_at=now,
+            )
+            if claimed:
+                return Job.objects.get(pk=job_id)
+        return None
+
+    def heartbeat(self, job_id: int, stage: str, processed: int) -> bool:
+        """
+        Сохраняет ход выполнения операции.
+
+        :return: bool - True, если пользователь запросил отмену
+        """
+        Job.objects.filter(pk=job_id).update(stage=stage, processed=processed, heartbeat_at=timezone.now())
+        return Job.objects.filter(pk=job_id, cancel_requested=True).exists()
+
+    def finish(self, job_id: int, status: str, error: str = '') -> None:
+        Job.objects.filter(pk=job_id).update(status=status, error=error, finished_at=timezone.now())
+
+    def delete(self, job_id: int) -> None:
+        Job.objects.filter(pk=job_id).delete()
+
+    def retry(self, job_id: int, error: str, run_after: datetime) -> None:
+        """
+        Возвращает операцию в очередь для повторной попытки не раньше run_after.
+        """
+        Job.objects.filter(pk=job_id).update(status=Job.STATUS_PENDING, error=error, run_after=run_after,
+                                             stage='', processed=0, worker='')
+
+    def request_cancel(self, user_id: int, job_id: int) -> bool:
+        """
+        Отменяет операцию: ожидающая отменяется сразу, выполняемая - воркером при следующей отметке.
+
+        :return: bool - True, если операция еще не была завершена
+        """
+        if Job.objects.filter(user_id=user_id, pk=job_id, status=Job.STATUS_PENDING).update(
+                status=Job.STATUS_CANCELLED, cancel_requested=True, finished_at=timezone.now()):
+            return True
+        return bool(Job.objects.filter(user_id=user_id, pk=job_id, status=Job.STATUS_RUNNING)
+                    .update(cancel_requested=True))
+
+    def requeue_stale(self, heartbeat_before: datetime, max_attempts: int) -> int:
+        """
+        Возвращает в очередь операции, воркер которых перестал отмечаться (например, был остановлен).
+
+        Операции, исчерпавшие попытки, завершаются с ошибкой.
+
+        :return: Количество возвращенных в очередь операций
+        """
+        stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=heartbeat_before)
+        stale.filter(attempts__gte=max_attempts).update(
+            status=Job.STATUS_FAILED, error='Воркер остановился во время выполнения', finished_at=timezone.now())
+        return stale.filter(attempts__lt=max_attempts).update(status=Job.STATUS_PENDING, worker='')
+
+    @staticmethod
+    def to_dict(job: Job) -> dict:
+        return {
+            'id': job.pk,
+            'kind': job.kind,
+            'kind_display': job.get_kind_display(),
+            's3_key': job.params.get('s3_key', ''),
+            'new_name': job.params.get('new_name'),
+            's3_keys': job.params.get('s3_keys', []),
+            'destination': job.params.get('destination'),
+            'new_key': job.params.get('new_key'),
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'stage': job.stage,
+            'processed': job.processed,
+            'attempts': job.attempts,
+            'error': job.error,
+            'cancel_requested': job.cancel_requested,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        }
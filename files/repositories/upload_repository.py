@@ -0,0 +1,62 @@
+from django.db.models import Q
+from django.utils import timezone
+from files.models import ResumableUpload
+from datetime import datetime
+from typing import Optional
+
+
+class UploadRepository:
+    """Состояние возобновляемых загрузок в базе данных"""
+
+    def create(self, user_id: int, s3_key: str, size: int, part_size: int, content_type: str) -> ResumableUpload:
+        return ResumableUpload.objects.create(user_id=user_id, s3_key=s3_key, size=size, part_size=part_size,
+                                              content_type=content_type)
+
+    def get(self, user_id: int, upload_id) -> Optional[ResumableUpload]:
+        return ResumableUpload.objects.filter(user_id=user_id, pk=upload_id).first()
+
+    def lock(self, upload_id, token: str, stale_before: datetime) -> bool:
+        """
+        Захватывает загрузку для запроса PATCH.
+
+        Захват - условный UPDATE, как у очереди операций; блокировка процесса, который завершился
+        не сняв ее, считается устаревшей после stale_before.
+
+        :return: bool - True, если загрузка захвачена
+        """
+        return bool(ResumableUpload.objects
+                    .filter(pk=upload_id)
+                    .filter(Q(lock_token='') | Q(locked_at__lt=stale_before))
+                    .update(lock_token=token, locked_at=timezone.now()))
+
+    def unlock(self, upload_id, token: str) -> None:
+        ResumableUpload.objects.filter(pk=upload_id, lock_token=token).update(lock_token='', locked_at=None)
+
+    def save_progress(self, upload_id, token: str, offset: int, multipart_id: str, parts: list,
+                      segments: list) -> bool:
+        """
+        Сохраняет принятый объем загрузки.
+
+        :return: bool - False, если блокировку за время запроса перехватил другой запрос
+        """
+        return bool(ResumableUpload.objects.filter(pk=upload_id, lock_token=token).update(
+            offset=offset, multipart_id=multipart_id, parts=parts, segments=segments, updated_at=timezone.now()))
+
+    def complete(self, upload_id) -> None:
+        ResumableUpload.objects.filter(pk=upload_id).update(completed_at=timezone.now(), parts=[], segments=[])
+
+    def delete(self, upload_id) -> None:
+        ResumableUpload.objects.filter(pk=upload_id).delete()
+
+    def list_expired(self, updated_before: datetime) -> list[ResumableUpload]:
+        """
+        :return: list[ResumableUpload] - Загрузки, не менявшиеся с updated_before, в том числе завершенные
+        """
+        return list(ResumableUpload.objects.filter(updated_at__lt=updated_before))
+
+    def active_multipart_ids(self) -> set[str]:
+        """
+        :return: set[str] - Идентификаторы multipart upload незавершенных загрузок
+        """
+        return set(ResumableUpload.objects.filter(completed_at__isnull=True).exclude(multipart_id='')
+                   .values_list('multipart_id', flat=True))
@@ -0,0 +1,134 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from files.models import StorageUsage, FolderUsage
+from typing import Iterable, Optional
+
+
+class UsageRepository:
+    """Учет объема файлов пользователей по папкам верхнего уровня"""
+
+    def get_usage(self, user_id: int) -> dict:
+        """
+        Возвращает объем файлов пользователя одним запросом по первичному ключу.
+
+        :param user_id: Идентификатор пользователя Django
+
+        :return: dict - Словарь с ключами 'bytes', 'objects' и 'quota' (None, если квота не задана индивидуально)
+        """
+        row = StorageUsage.objects.filter(user_id=user_id).first()
+        if row is None:
+            return {'bytes': 0, 'objects': 0, 'quota': None}
+        return {'bytes': row.bytes_used, 'objects': row.objects_count, 'quota': row.quota_bytes}
+
+    def list_folders(self, user_id: int) -> list[dict]:
+        """
+        :return: list[dict] - Объем по папкам верхнего уровня: 'folder', 'bytes', 'objects'
+        """
+        return [
+            {'folder': row.folder, 'bytes': row.bytes_used, 'objects': row.objects_count}
+            for row in FolderUsage.objects.filter(user_id=user_id).order_by('-bytes_used')
+        ]
+
+    def apply(self, user_id: int, changes: dict[str, tuple[int, int]]) -> None:
+        """
+        Атомарно применяет изменения объема.
+
+        :param user_id: Идентификатор пользователя Django
+        :param changes: Словарь {папка верхнего уровня: (изменение байт, изменение количества объектов)}
+        """
+        changes = {folder: delta for folder, delta in changes.items() if delta != (0, 0)}
+        if not changes:
+            return
+
+        with transaction.atomic():
+            for folder, (bytes_delta, objects_delta) in changes.items():
+                self._increment(FolderUsage, {'user_id': user_id, 'folder': folder}, bytes_delta, objects_delta)
+            self._increment(StorageUsage, {'user_id': user_id},
+                            sum(delta[0] for delta in changes.values()),
+                            sum(delta[1] for delta in changes.values()))
+
+    def move_folder(self, user_id: int, old_folder: str, new_folder: str) -> None:
+        """
+        Переносит объем папки верхнего уровня на новое имя (при переименовании папки).
+
+        Повторный вызов безопасен: если записи старой папки уже нет, ничего не меняется.
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_folder: Прежнее имя папки
+        :param new_folder: Новое имя папки
+        """
+        with transaction.atomic():
+            row = FolderUsage.objects.select_for_update().filter(user_id=user_id, folder=old_folder).first()
+            if row is None:
+                return
+            self._increment(FolderUsage, {'user_id': user_id, 'folder': new_folder}, row.bytes_used, row.objects_count)
+            row.delete()
+
+    def replace(self, user_id: int, folders: dict[str, tuple[int, int]]) -> None:
+        """
+        Заменяет учет пользователя значениями, посчитанными по бакету (сверка).
+
+        :param user_id: Идентификатор пользователя Django
+        :param folders: Словарь {папка верхнего уровня: (байт, количество объектов)}
+        """
+        with transaction.atomic():
+            FolderUsage.objects.filter(user_id=user_id).exclude(folder__in=list(folders)).delete()
+            for folder, (bytes_used, objects_count) in folders.items():
+                FolderUsage.objects.update_or_create(
+                    user_id=user_id, folder=folder,
+                    defaults={'bytes_used': bytes_used, 'objects_count': objects_count},
+                )
+            StorageUsage.objects.update_or_create(
+                user_id=user_id,
+                defaults={
+                    'bytes_used': sum(value[0] for value in folders.values()),
+                    'objects_count': sum(value[1] for value in folders.values()),
+                },
+            )
+
+    def reset_missing(self, user_ids: Iterable[int]) -> int:
+        """
+        Обнуляет учет пользователей, у которых при сверке не найдено ни одного объекта.
+
+        :param user_ids: Пользователи, найденные в бакете
+
+        :return: Количество обнуленных пользователей
+        """
+        user_ids = list(user_ids)
+        FolderUsage.objects.exclude(user_id__in=user_ids).delete()
+        return (StorageUsage.objects.exclude(user_id__in=user_ids)
+                .exclude(bytes_used=0, objects_count=0)
+                .update(bytes_used=0, objects_count=0))
+
+    @staticmethod
+    def top_folder(user_id: int, key: str) -> Optional[str]:
+        """
+        :return: str - Имя папки верхнего уровня для ключа ('' для файлов в корне)
+            или None, если ключ не принадлежит пользователю
+        """
+        user_prefix = f"user-{user_id}-files/"
+        if not key.startswith(user_prefix):
+            return None
+        folder, separator, _ = key[len(user_prefix):].partition('/')
+        return folder if separator else ''
+
+    @staticmethod
+    def _increment(model, lookup: dict, bytes_delta: int, objects_delta: int) -> None:
+        """
+        Увеличивает счетчики выражением F() без чтения строки, создавая ее при первом изменении.
+        """
+        updated = model.objects.filter(**lookup).update(
+            bytes_used=F('bytes_used') + bytes_delta,
+            objects_count=F('objects_count') + objects_delta,
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, bytes_used=bytes_delta, objects_count=objects_delta)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            model.objects.filter(**lookup).update(
+                bytes_used=F('bytes_used') + bytes_delta,
+                objects_count=F('objects_count') + objects_delta,
+            )
@@ -0,0 +1,346 @@
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError, BotoCoreError
+from django.conf import settings
+import asyncio
+import io
+import logging
+import mimetypes
+import time
+import weakref
+from typing import AsyncIterator, BinaryIO, Optional, Tuple, Union
+from files.services import compression
+from files.services.fileStorage_service import FileStorageService, LIST_MAX_KEYS, QuotaExceededError
+from files.services.metrics import instrument_client
+
+logger = logging.getLogger(__name__)
+
+# Клиенты aiobotocore привязаны к циклу событий, поэтому пул соединений общий для всех запросов одного цикла
+_clients = weakref.WeakKeyDictionary()
+
+
+async def get_async_s3_client():
+    """
+    Возвращает общий для текущего цикла событий асинхронный клиент S3.
+
+    :return: Клиент aiobotocore с пулом до FILES_ASYNC_MAX_POOL_CONNECTIONS соединений
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is not None:
+        return client
+
+    config = AioConfig(
+        signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+        max_pool_connections=settings.FILES_ASYNC_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.FILES_S3_CONNECT_TIMEOUT,
+        read_timeout=settings.FILES_S3_READ_TIMEOUT,
+        retries={'total_max_attempts': settings.FILES_S3_MAX_ATTEMPTS, 'mode': settings.FILES_S3_RETRY_MODE},
+        s3={'addressing_style': 'path'},
+    )
+    new_client = await get_session().create_client(
+        's3',
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        region_name=settings.AWS_S3_REGION_NAME,
+        config=config,
+    ).__aenter__()
+    if settings.FILES_METRICS_ENABLED:
+        instrument_client(new_client)
+
+    # Пока клиент создавался, его мог создать другой запрос этого же цикла
+    client = _clients.setdefault(loop, new_client)
+    if client is not new_client:
+        await new_client.__aexit__(None, None, None)
+    return client
+
+
+class AsyncFileStorageService:
+    """
+    Асинхронный вариант FileStorageService для ASGI.
+
+    Запросы к S3 выполняются через aiobotocore без блокировки потоков. Настройки,
+    построение ключей, кэш листингов и индекс метаданных берутся из синхронного
+    сервиса; обращения к базе данных и кэшу выполняются через sync_to_async.
+    """
+
+    def __init__(self, storage: FileStorageService):
+        """
+        :param storage: Синхронный сервис, с которым разделяются настройки, кэш и индекс
+        """
+        self.storage = storage
+        self.bucket_name = storage.bucket_name
+
+    async def list_files_page(self, user_id: int, prefix: str = '', page_size: int = LIST_MAX_KEYS,
+                              cursor: Optional[str] = None, sort: str = 'name') -> dict:
+        """
+        Асинхронный вариант FileStorageService.list_files_page.
+
+        :return: dict - Словарь с ключами 'items' и 'next_cursor'
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось получить страницу листинга
+        """
+        page_size = max(1, min(page_size, LIST_MAX_KEYS))
+        if self.storage.listing_source == 'index' and self.storage.file_repository is not None:
+            return await sync_to_async(self.storage.list_files_page)(user_id, prefix, page_size, cursor, sort)
+
+        listing_cache = self.storage.listing_cache
+        cache_key = None
+        if listing_cache is not None:
+            cache_key, page = await sync_to_async(listing_cache.get)(user_id, prefix, cursor, page_size)
+            if page is not None:
+                return page
+
+        client = await get_async_s3_client()
+        s3_prefix, params = self.storage._build_list_params(user_id, prefix, page_size, cursor)
+        page = self.storage._parse_list_page(s3_prefix, await client.list_objects_v2(**params))
+
+        if cache_key is not None:
+            await sync_to_async(listing_cache.set)(cache_key, page)
+        return page
+
+    async def get_object_info(self, s3_key: str) -> dict:
+        """
+        Асинхронный вариант FileStorageService.get_object_info.
+
+        :return: dict - Словарь с ключами 'size', 'etag', 'last_modified', 'content_type', 'codec', 'original_size'
+        """
+        source_key, row = await self._resolve_object(s3_key)
+        client = await get_async_s3_client()
+        head = await client.head_object(Bucket=self.bucket_name, Key=source_key)
+        info = {
+            'size': head['ContentLength'],
+            'etag': head.get('ETag', ''),
+            'last_modified': head.get('LastModified'),
+            'content_type': head.get('ContentType') or 'application/octet-stream',
+            'codec': compression.object_codec(head),
+            'original_size': compression.original_size(head),
+        }
+        if row is not None:
+            info['last_modified'] = row.last_modified or info['last_modified']
+            info['content_type'] = row.content_type or info['content_type']
+        return info
+
+    async def open_object(self, s3_key: str, byte_range: Optional[Tuple[int, int]] = None,
+                          if_match: Optional[str] = None, decode: bool = True) -> AsyncIterator[bytes]:
+        """
+        Асинхронный вариант FileStorageService.open_object.
+
+        :return: AsyncIterator[bytes] - Асинхронный итератор по содержимому, освобождающий соединение по завершении
+        """
+        params = {'Bucket': self.bucket_name, 'Key': (await self._resolve_object(s3_key))[0]}
+        if byte_range is not None:
+            params['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        if if_match:
+            params['IfMatch'] = if_match
+
+        client = await get_async_s3_client()
+        response = await client.get_object(**params)
+        body = response['Body']
+        codec = compression.object_codec(response) if decode else None
+
+        async def generate() -> AsyncIterator[bytes]:
+            async with body:
+                chunks = body.iter_chunks(self.storage.download_chunk_size)
+                if codec:
+                    chunks = compression.aiter_decompressed(chunks, codec)
+                async for chunk in chunks:
+                    yield chunk
+
+        return generate()
+
+    async def upload_file(self, user_id: int, file_obj: Union[BinaryIO, bytes], filename_in_s3: str) -> bool:
+        """
+        Асинхронный вариант FileStorageService.upload_file.
+
+        :return: True, если загрузка прошла успешно, иначе False
+
+        :raises
+            ValueError: Если имя файла пустое
+        """
+        if not filename_in_s3:
+            raise ValueError("Имя файла не может быть пустым")
+
+        if self.storage.blob_repository is not None:
+            # Хэширование и работа со ссылками на содержимое выполняются синхронным сервисом
+            return await sync_to_async(self.storage.upload_file, thread_sensitive=False)(user_id, file_obj,
+                                                                                         filename_in_s3)
+
+        s3_key = f"user-{user_id}-files/{filename_in_s3.lstrip('/')}"
+        if await sync_to_async(self.storage._select_over_quota)(user_id, [(file_obj, filename_in_s3)]):
+            logger.error(f"Файл {s3_key} не загружен: превышена квота пользователя {user_id}")
+            return False
+
+        try:
+            uploaded = await self._put_file(s3_key, file_obj)
+            await sync_to_async(self.storage._register_upload)(user_id, s3_key, uploaded)
+            await sync_to_async(self.storage._invalidate_listing)(user_id, s3_key)
+            logger.info(f"Файл {s3_key} ({uploaded['size']} байт) загружен для пользователя {user_id}")
+            return True
+
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Ошибка при загрузке файла {s3_key}: {e}")
+            return False
+
+    async def upload_files(self, user_id: int, files: list[tuple[Union[BinaryIO, bytes], str]]) -> list[dict]:
+        """
+        Асинхронный вариант FileStorageService.upload_files: одновременно загружается
+        не больше FILES_UPLOAD_BATCH_CONCURRENCY файлов.
+
+        :return: list[dict] - Результаты в порядке files в формате FileStorageService.upload_files
+        """
+        if self.storage.blob_repository is not None:
+            return await sync_to_async(self.storage.upload_files, thread_sensitive=False)(user_id, files)
+
+        semaphore = asyncio.Semaphore(max(1, self.storage.batch_concurrency))
+        over_quota = await sync_to_async(self.storage._select_over_quota)(user_id, files)
+
+        async def upload_one(index: int, file_obj: Union[BinaryIO, bytes], filename_in_s3: str) -> dict:
+            s3_key = f"user-{user_id}-files/{filename_in_s3.lstrip('/')}"
+            result = {'name': filename_in_s3, 'full_key': s3_key, 'success': False, 'size': 0, 'error': None}
+
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    if not filename_in_s3:
+                        raise ValueError("Имя файла не может быть пустым")
+                    if index in over_quota:
+                        raise QuotaExceededError("Превышена квота на объем хранилища")
+                    uploaded = await self._put_file(s3_key, file_obj)
+                    result['size'] = uploaded.get('original_size') or uploaded['size']
+                    result['success'] = True
+                    await sync_to_async(self.storage._register_upload)(user_id, s3_key, uploaded)
+                    await sync_to_async(self.storage._invalidate_listing)(user_id, s3_key)
+
+                except (ClientError, BotoCoreError, ValueError, QuotaExceededError) as e:
+                    logger.error(f"Ошибка загрузки файла {s3_key} для пользователя {user_id}: {e}")
+                    result['error'] = str(e)
+
+                result['elapsed'] = time.monotonic() - started
+            return result
+
+        started = time.monotonic()
+        results = list(await asyncio.gather(*(upload_one(index, file_obj, name)
+                                              for index, (file_obj, name) in enumerate(files))))
+
+        uploaded = sum(1 for result in results if result['success'])
+        logger.info(f"Пакетная загрузка для пользователя {user_id}: {uploaded} из {len(files)} файлов "
+                    f"за {time.monotonic() - started:.2f} с")
+        return results
+
+    async def _resolve_object(self, s3_key: str) -> tuple:
+        """
+        Асинхронный вариант FileStorageService._resolve_object.
+        """
+        if self.storage.blob_repository is None:
+            return s3_key, None
+        return await sync_to_async(self.storage._resolve_object)(s3_key)
+
+    async def _put_file(self, s3_key: str, file_obj: Union[BinaryIO, bytes]) -> dict:
+        """
+        Асинхронный вариант FileStorageService._put_file.
+
+        :return: dict - Словарь с ключами 'size', 'etag' и 'content_type'
+        """
+        content_type = (getattr(file_obj, 'content_type', None)
+                        or mimetypes.guess_type(s3_key)[0]
+                        or 'application/octet-stream')
+
+        if isinstance(file_obj, (bytes, bytearray)):
+            file_obj = io.BytesIO(file_obj)
+
+        size = self.storage._get_file_size(file_obj)
+        client = await get_async_s3_client()
+
+        object_params = {}
+        reader = None
+        codec = self.storage._compression_codec(content_type, size)
+        if codec is not None:
+            # Сжатие выполняется при чтении из файла, поэтому тоже вне цикла событий
+            reader = file_obj = compression.CompressingReader(file_obj, codec)
+            object_params = self.storage._compression_params(codec, size)
+
+        # Чтение из файла (например, временного файла загрузки) выполняется вне цикла событий
+        if size is not None and size < self.storage.multipart_threshold:
+            data = await asyncio.to_thread(file_obj.read)
+            response = await client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=data,
+                                               ContentType=content_type, **object_params)
+            uploaded = {'size': len(data), 'etag': response.get('ETag', ''), 'content_type': content_type}
+        else:
+            part_size = self.storage._get_part_size(size)
+            first_chunk = await asyncio.to_thread(file_obj.read, part_size)
+            if len(first_chunk) < part_size:
+                response = await client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=first_chunk,
+                                                   ContentType=content_type, **object_params)
+                uploaded = {'size': len(first_chunk), 'etag': response.get('ETag', '')}
+            else:
+                uploaded = await self._upload_multipart(client, s3_key, file_obj, part_size, first_chunk,
+                                                        content_type, object_params)
+            uploaded['content_type'] = content_type
+
+        if reader is not None:
+            return self.storage._finish_compressed(s3_key, reader, uploaded)
+        return uploaded
+
+    async def _upload_multipart(self, client, s3_key: str, file_obj: BinaryIO, part_size: int,
+                                first_chunk: bytes, content_type: str, object_params: Optional[dict] = None) -> dict:
+        """
+        Загружает файл по частям, держа в работе не более FILES_MULTIPART_MAX_CONCURRENCY частей.
+
+        :return: dict - Словарь с ключами 'size' и 'etag'
+
+        :raises
+            botocore.exceptions.ClientError: Если часть не удалось загрузить
+        """
+        upload_id = (await client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=content_type,
+            **(object_params or {}),
+        ))['UploadId']
+        semaphore = asyncio.Semaphore(max(1, self.storage.multipart_concurrency))
+        tasks = []
+        uploaded_bytes = 0
+
+        async def upload_part(part_number: int, data: bytes) -> dict:
+            try:
+                response = await client.upload_part(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                                                    PartNumber=part_number, Body=data)
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            finally:
+                semaphore.release()
+
+        try:
+            part_number, chunk = 1, first_chunk
+            while chunk:
+                await semaphore.acquire()
+                for task in tasks:
+                    if task.done() and task.exception() is not None:
+                        raise task.exception()
+                tasks.append(asyncio.create_task(upload_part(part_number, chunk)))
+                uploaded_bytes += len(chunk)
+                part_number += 1
+                chunk = await asyncio.to_thread(file_obj.read, part_size)
+
+            parts = await asyncio.gather(*tasks)
+            response = await client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': list(parts)},
+            )
+            logger.debug(f"Multipart загрузка {s3_key} завершена: {len(parts)} частей")
+            return {'size': uploaded_bytes, 'etag': response.get('ETag', '')}
+
+        except BaseException:
+            logger.error(f"Multipart загрузка {s3_key} прервана, отмена загрузки {upload_id}")
+            for task in tasks:
+                task.cancel()
+            try:
+                await client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Не удалось отменить multipart загрузку {upload_id}: {e}")
+            raise
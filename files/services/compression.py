@@ -0,0 +1,272 @@
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, Optional
+from files.services.metrics import registry
+import time
+import zlib
+
+CODEC_GZIP = 'gzip'
+# zstd доступен, только если установлен пакет zstandard; без него вместо zstd используется gzip
+CODEC_ZSTD = 'zstd'
+CODECS = (CODEC_GZIP, CODEC_ZSTD)
+
+# Уровни сжатия: баланс степени сжатия и скорости для сжатия на лету при загрузке
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# wbits для zlib: формат gzip (заголовок и CRC32), окно 32 КБ
+GZIP_WBITS = 31
+
+# Ключи пользовательских метаданных объекта S3 (x-amz-meta-*)
+CODEC_METADATA_KEY = 'codec'
+ORIGINAL_SIZE_METADATA_KEY = 'original-size'
+
+# Исходные данные читаются и сжимаются фрагментами этого размера
+READ_CHUNK_SIZE = 1024 * 1024
+# Ограничение на размер одного фрагмента распакованных данных (gzip)
+DECODE_CHUNK_SIZE = 1024 * 1024
+# zstd распаковывается без ограничения выхода, поэтому вход подается маленькими порциями
+ZSTD_FEED_SIZE = 4096
+
+
+def zstd_supported() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_rules(value: str) -> list[tuple[str, str]]:
+    """
+    Разбирает правила выбора кодека вида 'text/csv=zstd,application/json=gzip,text/*=gzip'.
+
+    :param value: Строка правил через запятую
+    :return: list[tuple] - Пары (MIME-тип или шаблон 'type/*', кодек) в исходном порядке
+
+    :raises
+        ValueError: Если правило записано неверно или кодек неизвестен
+    """
+    rules = []
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        pattern, separator, codec = item.partition('=')
+        pattern, codec = pattern.strip().lower(), codec.strip().lower()
+        if not separator or not pattern or codec not in CODECS:
+            raise ValueError(f"Неверное правило сжатия: {item.strip()!r}")
+        rules.append((pattern, codec))
+    return rules
+
+
+def choose_codec(content_type: Optional[str], rules: list[tuple[str, str]]) -> Optional[str]:
+    """
+    Выбирает кодек для MIME-типа по первому подходящему правилу.
+
+    :param content_type: MIME-тип файла или None
+    :param rules: Правила из parse_rules
+
+    :return: Имя кодека или None, если файл не сжимается
+    """
+    if not content_type:
+        return None
+    content_type = content_type.split(';')[0].strip().lower()
+    for pattern, codec in rules:
+        if pattern == content_type or (pattern.endswith('/*') and content_type.startswith(pattern[:-1])):
+            if codec == CODEC_ZSTD and not zstd_supported():
+                return CODEC_GZIP
+            return codec
+    return None
+
+
+def object_codec(head: dict) -> Optional[str]:
+    """
+    :param head: Ответ head_object или get_object
+    :return: Кодек, которым сжат объект, или None для несжатого объекта
+    """
+    codec = (head.get('Metadata') or {}).get(CODEC_METADATA_KEY)
+    return codec if codec in CODECS else None
+
+
+def original_size(head: dict) -> Optional[int]:
+    """
+    :param head: Ответ head_object или get_object
+    :return: Размер содержимого до сжатия или None, если он не записан (размер не был известен при загрузке)
+    """
+    value = (head.get('Metadata') or {}).get(ORIGINAL_SIZE_METADATA_KEY)
+    return int(value) if value and value.isdigit() else None
+
+
+def accepts(accept_encoding: Optional[str], codec: str) -> bool:
+    """
+    Проверяет, что клиент принимает ответ, сжатый кодеком, по заголовку Accept-Encoding.
+
+    :param accept_encoding: Значение заголовка Accept-Encoding или None
+    :param codec: Имя кодека
+    """
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.partition(';')
+        if name.strip().lower() != codec:
+            continue
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _compressor(codec: str):
+    if codec == CODEC_GZIP:
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    if codec == CODEC_ZSTD:
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    raise ValueError(f"Неизвестный кодек сжатия: {codec}")
+
+
+class CompressingReader:
+    """
+    Файлоподобный объект, отдающий сжатое содержимое исходного файла.
+
+    Исходный файл читается фрагментами READ_CHUNK_SIZE по мере чтения из объекта,
+    поэтому в памяти находится не больше запрошенного read() и одного сжатого фрагмента.
+    Размер результата заранее неизвестен: у объекта нет size, tell и seek.
+    """
+
+    def __init__(self, source: BinaryIO, codec: str):
+        self.codec = codec
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self._source = source
+        self._compressor = _compressor(codec)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self._source.read(READ_CHUNK_SIZE)
+            started = time.perf_counter()
+            if chunk:
+                self.bytes_in += len(chunk)
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+            self.seconds += time.perf_counter() - started
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.bytes_out += len(data)
+        return data
+
+    @property
+    def ratio(self) -> float:
+        """
+        :return: Отношение исходного размера к сжатому (больше 1 - данные сжались)
+        """
+        return self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+
+    def record(self) -> None:
+        """
+        Добавляет итоги сжатия в метрики процесса.
+        """
+        labels = {'codec': self.codec}
+        registry.inc('files_compression_input_bytes_total', labels, self.bytes_in)
+        registry.inc('files_compression_output_bytes_total', labels, self.bytes_out)
+        registry.inc('files_compression_seconds_total', labels, self.seconds)
+
+
+class StreamDecoder:
+    """
+    Потоковая распаковка объекта, сжатого CompressingReader.
+    """
+
+    def __init__(self, codec: str):
+        self.codec = codec
+        if codec == CODEC_GZIP:
+            self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        elif codec == CODEC_ZSTD:
+            import zstandard
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise ValueError(f"Неизвестный кодек сжатия: {codec}")
+
+    def decode(self, chunk: bytes) -> Iterator[bytes]:
+        """
+        :param chunk: Очередной фрагмент сжатых данных
+        :return: Iterator[bytes] - Фрагменты распакованных данных
+        """
+        if self.codec == CODEC_GZIP:
+            data = chunk
+            while data:
+                decoded = self._decompressor.decompress(data, DECODE_CHUNK_SIZE)
+                if decoded:
+                    yield decoded
+                data = self._decompressor.unconsumed_tail
+            return
+
+        view = memoryview(chunk)
+        for start in range(0, len(view), ZSTD_FEED_SIZE):
+            decoded = self._decompressor.decompress(view[start:start + ZSTD_FEED_SIZE])
+            if decoded:
+                yield decoded
+
+    def finish(self) -> None:
+        """
+        :raises
+            ValueError: Если сжатые данные оборвались до конца потока
+        """
+        if self.codec == CODEC_GZIP and not self._decompressor.eof:
+            raise ValueError("Сжатые данные объекта оборваны")
+
+
+def iter_decompressed(chunks: Iterable[bytes], codec: str) -> Iterator[bytes]:
+    """
+    Распаковывает поток фрагментов сжатого объекта.
+
+    :param chunks: Фрагменты сжатых данных
+    :param codec: Кодек объекта
+
+    :return: Iterator[bytes] - Фрагменты исходного содержимого
+    """
+    decoder = StreamDecoder(codec)
+    for chunk in chunks:
+        yield from decoder.decode(chunk)
+    decoder.finish()
+
+
+async def aiter_decompressed(chunks: AsyncIterator[bytes], codec: str) -> AsyncIterator[bytes]:
+    """
+    Асинхронный вариант iter_decompressed.
+    """
+    decoder = StreamDecoder(codec)
+    async for chunk in chunks:
+        for decoded in decoder.decode(chunk):
+            yield decoded
+    decoder.finish()
+
+
+def measure(data: bytes, codec: str) -> dict:
+    """
+    Сжимает и распаковывает данные кодеком, измеряя размер и время.
+
+    :param data: Исходное содержимое
+    :param codec: Имя кодека
+
+    :return: dict - Словарь с ключами 'size' (размер после сжатия), 'compress_seconds', 'decompress_seconds'
+    """
+    started = time.perf_counter()
+    compressor = _compressor(codec)
+    compressed = compressor.compress(data) + compressor.flush()
+    compressed_at = time.perf_counter()
+    for _ in iter_decompressed([compressed], codec):
+        pass
+    return {
+        'size': len(compressed),
+        'compress_seconds': compressed_at - started,
+        'decompress_seconds': time.perf_counter() - compressed_at,
+    }
@@ -0,0 +1,91 @@
+from collections import deque
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def iter_bounded(func: Callable[[T], object], items: Iterable[T], max_workers: int,
+                 thread_name_prefix: str = 'files-worker') -> Iterator[Tuple[T, Future]]:
+    """
+    Выполняет func для каждого элемента items в пуле потоков, держа в работе не более max_workers задач.
+
+    Элементы забираются из items лениво, по мере освобождения воркеров, поэтому
+    генератор (например, страницы пагинатора или части файла) никогда не читается вперед
+    больше чем на max_workers элементов, и потребление памяти остается ограниченным.
+    Итератор items читается только из вызывающего потока.
+
+    :param func: Функция, выполняемая в пуле для каждого элемента
+    :param items: Итерируемый объект с элементами (может быть генератором)
+    :param max_workers: Максимальное количество одновременно выполняемых задач
+    :param thread_name_prefix: Префикс имени потоков пула
+
+    :return: Итератор пар (элемент, завершенный Future) в порядке завершения задач
+    """
+    max_workers = max(1, max_workers)
+    iterator = iter(items)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix) as executor:
+        in_flight = {}
+
+        def submit_next() -> bool:
+            for item in iterator:
+                in_flight[_submit(executor, func, item)] = item
+                return True
+            return False
+
+        while len(in_flight) < max_workers and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                yield item, future
+                submit_next()
+
+
+def iter_prefetched(func: Callable[[T], R], items: Iterable[T], depth: int,
+                    thread_name_prefix: str = 'files-prefetch') -> Iterator[Tuple[T, R]]:
+    """
+    Выполняет func для элементов items с опережением на depth элементов, сохраняя порядок.
+
+    Пока вызывающий код обрабатывает текущий результат, в пуле уже выполняются
+    следующие depth задач. Если генератор закрыт раньше времени (например, клиент
+    оборвал скачивание), еще не начатые задачи отменяются.
+
+    :param func: Функция, выполняемая в пуле для каждого элемента
+    :param items: Итерируемый объект с элементами (может быть генератором)
+    :param depth: Количество элементов, обрабатываемых заранее
+    :param thread_name_prefix: Префикс имени потоков пула
+
+    :return: Итератор пар (элемент, результат func) в порядке items
+
+    :raises
+        Exception: Исключение func для элемента пробрасывается при получении его результата
+    """
+    depth = max(1, depth)
+    iterator = iter(items)
+    executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix=thread_name_prefix)
+    pending = deque()
+
+    try:
+        for item in iterator:
+            pending.append((item, _submit(executor, func, item)))
+            if len(pending) > depth:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(executor: ThreadPoolExecutor, func: Callable, item) -> Future:
+    # Задача видит контекстные переменные вызывающего потока, например учет метрик текущего запроса
+    return executor.submit(contextvars.copy_context().run, func, item)
@@ -1,26 +1,162 @@
-import boto3
 from django.conf import settings
-from botocore.exceptions import ClientError
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from botocore.exceptions import ClientError, BotoCoreError
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import hashlib
+import io
+import json
 import logging
-from typing import Union, BinaryIO
+import math
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Union, BinaryIO, Callable, Iterator, Optional, Tuple
+from files.services.concurrency import iter_bounded, iter_prefetched
+from files.services.listing_cache import get_listing_cache
+from files.services.s3_client import get_presign_client, get_s3_client
+from files.services.zip_stream import iter_zip
+from files.services import compression, thumbnails
+from files.models import FileObject, Job, ResumableUpload
+from files.repositories.blob_repository import BlobRepository
+from files.repositories.file_repository import FileRepository
+from files.repositories.job_repository import JobRepository
+from files.repositories.upload_repository import UploadRepository
+from files.repositories.usage_repository import UsageRepository
+from django.db import DatabaseError, transaction
 
 logger = logging.getLogger(__name__)
 
+# Ограничения S3 на multipart upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS_COUNT = 10000
+MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+COPY_PART_SIZE = 512 * 1024 * 1024
+
+DELETE_BATCH_SIZE = 1000
+LIST_MAX_KEYS = 1000
+
+# Служебный префикс вне папок пользователей для журналов переименования
+RENAME_JOURNAL_PREFIX = '.journals/rename/'
+# Пока переименование выполняется, журнал перезаписывается не реже этого интервала в секундах,
+# чтобы resume_renames отличал идущие операции от прерванных
+RENAME_HEARTBEAT_INTERVAL = 60
+# Служебный префикс для содержимого файлов в режиме дедупликации
+BLOB_PREFIX = '.blobs/sha256/'
+HASH_CHUNK_SIZE = 1024 * 1024
+# Служебный префикс для производных файлов (миниатюр): повторяет ключ исходного файла
+DERIVATIVE_PREFIX = '.derivatives/'
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+# Служебный префикс для принятых данных неполных частей возобновляемых загрузок
+UPLOAD_SEGMENT_PREFIX = '.uploads/'
+# Блокировка загрузки запросом PATCH считается брошенной (процесс завершился) после этого времени в секундах
+UPLOAD_LOCK_TIMEOUT = 600
+
+USER_KEY_PATTERN = re.compile(r'^user-(\d+)-files/')
+
+
+class QuotaExceededError(Exception):
+    """Загрузка превысила бы квоту пользователя на объем хранилища"""
+
+
+class UploadOffsetError(Exception):
+    """Смещение фрагмента не совпадает с уже принятым объемом возобновляемой загрузки"""
+
+
+class UploadLockedError(Exception):
+    """Возобновляемую загрузку в это время дополняет другой запрос"""
+
+
+@dataclass
+class DeleteResult:
+    """Результат удаления файла или папки"""
+    deleted: int = 0
+    failed_keys: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    # Объем и количество удаленных файлов (без маркеров папок) для учета занятого места
+    deleted_bytes: int = 0
+    deleted_files: int = 0
+    # Удаление остановлено по запросу отмены, часть объектов осталась
+    cancelled: bool = False
+
+    def __bool__(self) -> bool:
+        return not self.failed_keys and self.error is None and not self.cancelled
+
+
+@dataclass
+class MoveResult:
+    """Результат перемещения выбранных файлов и папок"""
+    # Полные ключи перемещенных файлов и папок из выбора
+    moved: list[str] = field(default_factory=list)
+    # Неперемещенные ключи и причина
+    errors: dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+    # Перемещение остановлено по запросу отмены, часть выбора осталась на месте
+    cancelled: bool = False
+
+    def __bool__(self) -> bool:
+        return not self.errors and not self.cancelled
+
 
 class FileStorageService:
     def __init__(self):
-        """Инициализирует сервис хранения файлов"""
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
-        self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        self._ensure_bucket_exists()
+        """
+        Инициализирует сервис хранения файлов.
 
-    def _ensure_bucket_exists(self) -> None:
+        Сервис не обращается к сети: клиенты S3 общие для процесса и создаются при первом
+        запросе, а наличие бакета проверяется командой ensure_bucket.
+        """
+        self.presigned_expires = settings.FILES_PRESIGNED_EXPIRES
+        self.download_expires = settings.FILES_DOWNLOAD_URL_EXPIRES
+        self.download_chunk_size = settings.FILES_DOWNLOAD_CHUNK_SIZE
+        self.zip_prefetch_depth = settings.FILES_ZIP_PREFETCH_DEPTH
+        self.zip_prefetch_max_size = settings.FILES_ZIP_PREFETCH_MAX_SIZE
+        self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+        self.multipart_threshold = settings.FILES_MULTIPART_THRESHOLD
+        self.multipart_part_size = max(settings.FILES_MULTIPART_PART_SIZE, MIN_PART_SIZE)
+        self.multipart_concurrency = settings.FILES_MULTIPART_MAX_CONCURRENCY
+        self.part_retries = settings.FILES_MULTIPART_PART_RETRIES
+        self.batch_concurrency = settings.FILES_UPLOAD_BATCH_CONCURRENCY
+        self.copy_concurrency = settings.FILES_COPY_MAX_CONCURRENCY
+        self.delete_concurrency = settings.FILES_DELETE_MAX_CONCURRENCY
+        self.listing_cache = get_listing_cache()
+        self.file_repository = FileRepository() if settings.FILES_METADATA_INDEX_ENABLED else None
+        self.blob_repository = None
+        if settings.FILES_DEDUP_ENABLED:
+            if self.file_repository is not None:
+                self.blob_repository = BlobRepository()
+            else:
+                logger.warning("Дедупликация отключена: для нее нужен индекс метаданных (FILES_METADATA_INDEX_ENABLED)")
+        # Файлы с дедупликацией есть только в индексе, поэтому листинг строится по нему
+        self.listing_source = 'index' if self.blob_repository is not None else settings.FILES_LISTING_SOURCE
+        self.usage_repository = UsageRepository() if settings.FILES_USAGE_TRACKING_ENABLED else None
+        self.default_quota = settings.FILES_USER_QUOTA_BYTES
+        # Миниатюры строит воркер run_jobs, сервис только ставит их в очередь и удаляет устаревшие
+        self.job_repository = JobRepository() if settings.FILES_THUMBNAILS_ENABLED else None
+        self.thumbnail_size = settings.FILES_THUMBNAIL_SIZE
+        self.thumbnail_max_source_size = settings.FILES_THUMBNAIL_MAX_SOURCE_SIZE
+        self.compression_rules = (compression.parse_rules(settings.FILES_COMPRESSION_CODECS)
+                                  if settings.FILES_COMPRESSION_ENABLED else [])
+        self.compression_min_size = settings.FILES_COMPRESSION_MIN_SIZE
+        self.upload_repository = UploadRepository()
+        self.resumable_expires = settings.FILES_RESUMABLE_UPLOAD_EXPIRES
+
+    @property
+    def s3_client(self):
+        return get_s3_client()
+
+    @property
+    def presign_client(self):
+        return get_presign_client()
+
+    def ensure_bucket(self) -> None:
         """
         Проверяет наличие бакета и создает его при необходимости
 
@@ -46,6 +182,10 @@ class FileStorageService:
         """
         Загружает файл в бакет.
 
+        Небольшие файлы загружаются одним запросом put_object. Файлы размером от
+        FILES_MULTIPART_THRESHOLD и файлы неизвестного размера, не уместившиеся в одну часть,
+        загружаются по частям (multipart upload) параллельно в ограниченном пуле потоков.
+
         :param user_id: Идентификатор пользователя Django
 
         :param file_obj: Объект файла для загрузки.
@@ -63,201 +203,2888 @@ class FileStorageService:
             raise ValueError("Имя файла не может быть пустым")
 
         s3_key = f"user-{user_id}-files/{filename_in_s3.lstrip('/')}"
+        started = time.monotonic()
+
+        size = len(file_obj) if isinstance(file_obj, (bytes, bytearray)) else self._get_file_size(file_obj)
+        free_space = self.get_free_space(user_id)
+        if free_space is not None and size is not None and size > free_space:
+            logger.error(f"Файл {s3_key} ({size} байт) не загружен: превышена квота пользователя {user_id}")
+            return False
 
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Body=file_obj,
-                Key=s3_key,
-            )
-            logger.info(f'Файл успешно загружен в {self.bucket_name}/{s3_key}')
+            uploaded = self._store_file(s3_key, file_obj)
+            self._register_upload(user_id, s3_key, uploaded)
+            self._invalidate_listing(user_id, s3_key)
+
+            elapsed = time.monotonic() - started
+            logger.info(f'Файл успешно загружен в {self.bucket_name}/{s3_key} '
+                        f'({uploaded["size"]} байт за {elapsed:.2f} с)')
             return True
 
-        except ClientError as e:
+        except (ClientError, BotoCoreError, DatabaseError) as e:
             logger.info(f"Ошибка загрузки файла {s3_key} для пользователя {user_id}: {e}")
             return False
 
-    def list_files(self, user_id: int, prefix: str = '') -> list[dict]:
+    def upload_files(self, user_id: int, files: list[tuple[Union[BinaryIO, bytes], str]]) -> list[dict]:
         """
-        Получает Список файлов и папок для указанного пользователя и префикса.
+        Загружает пакет файлов параллельно в ограниченном пуле потоков.
 
-        :param user_id:Идентификатор пользователя Django
-        :param prefix: Префикс пути внутри пользователя
+        :param user_id: Идентификатор пользователя Django
+        :param files: Список пар (объект файла, имя файла и путь внутри папки пользователя)
 
         :return:
-            list[dict] - Список словарей, представляющий файлы или папки.
+            list[dict] - Отчет по каждому файлу в порядке входного списка.
                 Каждый словарь содержит ключи:
-                - 'type': 'file' или 'folder'
-                - 'name': имя файла или папки
+                - 'name': имя файла внутри папки пользователя
                 - 'full_key': Полный ключ s3
-                - 'size': размер (только для файлов)
-                - 'last_modified': время последнего изменения (только для файлов)
+                - 'success': True, если файл загружен
+                - 'size': размер файла в байтах (для сжатого файла - исходный)
+                - 'elapsed': время загрузки в секундах
+                - 'error': текст ошибки или None
+        """
+        over_quota = self._select_over_quota(user_id, files)
+
+        def upload_one(index: int) -> dict:
+            file_obj, filename_in_s3 = files[index]
+            s3_key = f"user-{user_id}-files/{filename_in_s3.lstrip('/')}"
+            started = time.monotonic()
+            result = {'name': filename_in_s3, 'full_key': s3_key, 'success': False, 'size': 0, 'error': None}
+
+            try:
+                if not filename_in_s3:
+                    raise ValueError("Имя файла не может быть пустым")
+                if index in over_quota:
+                    raise QuotaExceededError("Превышена квота на объем хранилища")
+                uploaded = self._store_file(s3_key, file_obj)
+                self._register_upload(user_id, s3_key, uploaded)
+                result['size'] = uploaded.get('original_size') or uploaded['size']
+                result['success'] = True
+                self._invalidate_listing(user_id, s3_key)
+
+            except (ClientError, BotoCoreError, DatabaseError, ValueError, QuotaExceededError) as e:
+                logger.error(f"Ошибка загрузки файла {s3_key} для пользователя {user_id}: {e}")
+                result['error'] = str(e)
+
+            result['elapsed'] = time.monotonic() - started
+            return result
+
+        started = time.monotonic()
+        results = [None] * len(files)
+        for index, future in iter_bounded(upload_one, range(len(files)), self.batch_concurrency,
+                                          thread_name_prefix='files-batch'):
+            results[index] = future.result()
+
+        uploaded = sum(1 for result in results if result['success'])
+        logger.info(f"Пакетная загрузка для пользователя {user_id}: {uploaded} из {len(files)} файлов "
+                    f"за {time.monotonic() - started:.2f} с")
+        return results
+
+    def _select_over_quota(self, user_id: int, files: list[tuple[Union[BinaryIO, bytes], str]]) -> set[int]:
         """
+        Определяет файлы пакета, которые не помещаются в оставшуюся квоту, до начала загрузки.
 
-        s3_prefix = f"user-{user_id}-files/{prefix.lstrip('/')}"
-        if s3_prefix and not s3_prefix.endswith('/'):
-            s3_prefix += '/'
+        Файлы принимаются по порядку, пока хватает места; файлы неизвестного размера не ограничиваются.
 
-        try:
-            response = self.s3_client.list_objects_v2(
+        :return: set[int] - Индексы файлов, загрузку которых нужно отклонить
+        """
+        free_space = self.get_free_space(user_id)
+        if free_space is None:
+            return set()
+
+        rejected = set()
+        for index, (file_obj, _) in enumerate(files):
+            size = len(file_obj) if isinstance(file_obj, (bytes, bytearray)) else self._get_file_size(file_obj)
+            if size is None:
+                continue
+            if size > free_space:
+                rejected.add(index)
+            else:
+                free_space -= size
+        return rejected
+
+    def _store_file(self, s3_key: str, file_obj: Union[BinaryIO, bytes]) -> dict:
+        """
+        Сохраняет содержимое файла: в хранилище блобов в режиме дедупликации, иначе под ключом s3_key.
+
+        :return: dict - Результат _put_file или _put_blob
+        """
+        if self.blob_repository is not None:
+            return self._put_blob(s3_key, file_obj)
+        return self._put_file(s3_key, file_obj)
+
+    def _put_file(self, s3_key: str, file_obj: Union[BinaryIO, bytes], content_type: Optional[str] = None) -> dict:
+        """
+        Загружает файл под указанным ключом, выбирая между put_object и multipart upload.
+
+        :param s3_key: Полный ключ объекта в S3
+        :param file_obj: Объект файла или байтовая строка
+        :param content_type: MIME-тип или None, чтобы определить его по файлу и ключу
+
+        :return: dict - Словарь с ключами 'size' (количество загруженных байт), 'etag' и 'content_type';
+            для сжатого файла также 'codec' и 'original_size'
+
+        :raises
+            botocore.exceptions.ClientError: Если загрузка не удалась
+        """
+        content_type = (content_type
+                        or getattr(file_obj, 'content_type', None)
+                        or mimetypes.guess_type(s3_key)[0]
+                        or 'application/octet-stream')
+
+        if isinstance(file_obj, (bytes, bytearray)):
+            file_obj = io.BytesIO(file_obj)
+
+        size = self._get_file_size(file_obj)
+
+        codec = self._compression_codec(content_type, size)
+        if codec is not None:
+            return self._put_compressed(s3_key, file_obj, size, content_type, codec)
+
+        if size is not None and size < self.multipart_threshold:
+            response = self.s3_client.put_object(
                 Bucket=self.bucket_name,
-                Prefix=s3_prefix,
-                Delimiter='/'
+                Body=file_obj,
+                Key=s3_key,
+                ContentType=content_type,
             )
-            items = []
-            #Обработка папок
-            for common_prefix in response.get('CommonPrefixes', []):
-                folder_prefix = common_prefix.get('Prefix')
-                folder_name = folder_prefix[len(s3_prefix):].rstrip('/')
-
-                if folder_name:
-                    items.append({
-                        'type': 'folder',
-                        'name': folder_name,
-                        'full_key': folder_prefix
-                    })
-
-            #Обработка папок
-            for item in response.get('Contents', []):
-                key = item.get('Key')
-                file_name = key[len(s3_prefix):]
-
-                if file_name:
-                    items.append({
-                        'type': 'file',
-                        'name': file_name,
-                        'full_key': key,
-                        'size': item.get('Size', 0),
-                        'last_modified': item.get('LastModified', None)
-                    })
+            return {'size': size, 'etag': response.get('ETag', ''), 'content_type': content_type}
 
-            logger.debug(f"Получен список {len(items)} элементов для пользователя {user_id}")
-            return items
+        uploaded = self._upload_multipart(s3_key, file_obj, size, content_type)
+        uploaded['content_type'] = content_type
+        return uploaded
 
-        except ClientError as e:
-            logger.error(f'Ошибка при получении списка элементов пользователя {user_id}: {e} ')
-            return False
+    def _compression_codec(self, content_type: str, size: Optional[int]) -> Optional[str]:
+        """
+        :return: Кодек, которым нужно сжать загружаемый файл, или None
+        """
+        if not self.compression_rules or (size is not None and size < self.compression_min_size):
+            return None
+        return compression.choose_codec(content_type, self.compression_rules)
 
-    def delete_object(self, user_id: int, s3_key: str) -> bool:
+    def _put_compressed(self, s3_key: str, file_obj: BinaryIO, size: Optional[int], content_type: str,
+                        codec: str) -> dict:
         """
-        Удаляет файл или папку (рекурсивно, все объекты с префиксом)
+        Загружает файл, сжимая его на лету.
 
-        :param user_id: Идентификатор пользователя Django
-        :param s3_key: Относительный путь к файлу или папке
+        Размер сжатых данных заранее неизвестен, поэтому они загружаются через _upload_multipart,
+        который читает части по мере сжатия. Кодек и исходный размер записываются в метаданные объекта,
+        Content-Encoding - для отдачи объекта как есть по presigned-ссылке или через nginx.
+
+        :param s3_key: Полный ключ объекта в S3
+        :param file_obj: Объект файла
+        :param size: Размер файла до сжатия или None, если он неизвестен
+        :param content_type: MIME-тип объекта
+        :param codec: Кодек сжатия
 
-        :return: True, если удаление прошло успешно, иначе False
+        :return: dict - Результат в формате _put_file: 'size' - размер сжатого объекта
         """
-        full_s3_key = s3_key
+        reader = compression.CompressingReader(file_obj, codec)
+        # Размер части подбирается по исходному размеру: сжатые данные не больше исходных с точностью до заголовков
+        uploaded = self._upload_multipart(s3_key, reader, size, content_type,
+                                          object_params=self._compression_params(codec, size))
+        uploaded['content_type'] = content_type
+        return self._finish_compressed(s3_key, reader, uploaded)
+
+    @staticmethod
+    def _compression_params(codec: str, size: Optional[int]) -> dict:
+        """
+        :return: dict - Параметры сжатого объекта для put_object и create_multipart_upload
+        """
+        metadata = {compression.CODEC_METADATA_KEY: codec}
+        if size is not None:
+            metadata[compression.ORIGINAL_SIZE_METADATA_KEY] = str(size)
+        return {'ContentEncoding': codec, 'Metadata': metadata}
+
+    @staticmethod
+    def _finish_compressed(s3_key: str, reader: compression.CompressingReader, uploaded: dict) -> dict:
+        """
+        Учитывает итоги сжатия в метриках и дополняет ими результат загрузки.
+        """
+        reader.record()
+        logger.debug(f"Файл {s3_key} сжат ({reader.codec}): {reader.bytes_in} -> {reader.bytes_out} байт, "
+                     f"x{reader.ratio:.2f}, {reader.bytes_in / max(reader.seconds, 1e-6) / 1024 ** 2:.1f} МБ/с")
+        uploaded.update(codec=reader.codec, original_size=reader.bytes_in)
+        return uploaded
+
+    def _put_blob(self, s3_key: str, file_obj: Union[BinaryIO, bytes]) -> dict:
+        """
+        Сохраняет содержимое файла в хранилище блобов под ключом по его SHA-256.
+
+        Хэш считается до отправки в S3, поэтому уже сохраненное содержимое повторно
+        не передается: на него только добавляется ссылка.
+
+        :param s3_key: Полный ключ файла пользователя (для определения MIME-типа)
+        :param file_obj: Объект файла или байтовая строка
+
+        :return: dict - Словарь с ключами 'size', 'etag', 'content_type' и 'blob_id'
+
+        :raises
+            botocore.exceptions.ClientError: Если загрузка не удалась
+        """
+        content_type = (getattr(file_obj, 'content_type', None)
+                        or mimetypes.guess_type(s3_key)[0]
+                        or 'application/octet-stream')
+
+        if isinstance(file_obj, (bytes, bytearray)):
+            file_obj = io.BytesIO(file_obj)
+
+        digest, size, file_obj = self._hash_file(file_obj)
+        blob = self.blob_repository.acquire(digest)
+        if blob is not None:
+            logger.debug(f"Содержимое {s3_key} уже сохранено как {digest}, загрузка не нужна")
+        else:
+            uploaded = self._put_file(self._blob_key(digest), file_obj, content_type)
+            blob = self.blob_repository.create(digest, size, uploaded['etag'], content_type)
+
+        return {'size': size, 'etag': blob.etag, 'content_type': content_type, 'blob_id': blob.pk}
+
+    def _hash_file(self, file_obj: BinaryIO) -> Tuple[str, int, BinaryIO]:
+        """
+        Считает SHA-256 файла от текущей позиции.
+
+        Файл с поддержкой seek после чтения возвращается к исходной позиции, остальные
+        копируются во временный файл, чтобы их можно было прочитать еще раз для загрузки.
+
+        :return: tuple - Хэш, размер в байтах и файл, готовый к чтению с начала содержимого
+        """
+        digest = hashlib.sha256()
+        size = 0
+
+        if self._get_file_size(file_obj) is not None:
+            position = file_obj.tell()
+            while chunk := file_obj.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+            file_obj.seek(position)
+            return digest.hexdigest(), size, file_obj
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=self.multipart_part_size)
+        while chunk := file_obj.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            spooled.write(chunk)
+        spooled.seek(0)
+        return digest.hexdigest(), size, spooled
+
+    @staticmethod
+    def _blob_key(sha256: str) -> str:
+        return f"{BLOB_PREFIX}{sha256[:2]}/{sha256}"
+
+    @staticmethod
+    def _key_user_id(s3_key: str) -> Optional[int]:
+        match = USER_KEY_PATTERN.match(s3_key)
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _normalize_selection(s3_keys: list[str]) -> list[str]:
+        """
+        Убирает из выбора повторы и ключи, вложенные в выбранные папки (они обрабатываются вместе с папкой).
+
+        :return: list[str] - Ключи в исходном порядке
+        """
+        unique = list(dict.fromkeys(s3_keys))
+        folders = [key for key in unique if key.endswith('/')]
+        return [key for key in unique
+                if not any(key != folder and key.startswith(folder) for folder in folders)]
+
+    @staticmethod
+    def _common_parent(s3_keys: list[str]) -> str:
+        """
+        :return: str - Общая родительская папка ключей с завершающим '/'
+        """
+        parents = [key.rstrip('/').rpartition('/')[0] + '/' for key in s3_keys]
+        return os.path.commonprefix(parents).rpartition('/')[0] + '/'
+
+    def _resolve_object(self, s3_key: str) -> Tuple[str, Optional[FileObject]]:
+        """
+        Определяет, где в S3 хранится содержимое файла пользователя.
+
+        :param s3_key: Полный ключ s3
+
+        :return: tuple - Ключ объекта с содержимым и запись индекса (None, если файл хранится под своим ключом)
+        """
+        user_id = self._key_user_id(s3_key)
+        if self.blob_repository is None or user_id is None:
+            return s3_key, None
+
+        row = self.file_repository.get_by_key(user_id, s3_key)
+        if row is None or row.blob is None:
+            return s3_key, None
+        return self._blob_key(row.blob.sha256), row
+
+    def _release_blobs(self, counts: dict[int, int]) -> None:
+        """
+        Снимает ссылки на содержимое и удаляет из S3 содержимое, на которое не осталось ссылок.
+
+        Ошибки только записываются в лог: неудаленное содержимое соберет команда collect_blobs.
+
+        :param counts: Словарь {идентификатор Blob: количество снимаемых ссылок}
+        """
+        if self.blob_repository is None or not counts:
+            return
 
         try:
-            if full_s3_key.endswith('/'):
-                # Удаление папки
-                prefix_to_delete = full_s3_key
-                logger.info(f"Начало удаление папки с префиксом {full_s3_key}")
+            self._delete_unreferenced_blobs(self.blob_repository.release(counts))
+        except (DatabaseError, ClientError) as e:
+            logger.error(f"Ошибка освобождения содержимого в хранилище блобов: {e}")
 
-                paginator = self.s3_client.get_paginator('list_objects_v2')
+    def collect_blobs(self, created_before: datetime) -> int:
+        """
+        Пересчитывает ссылки на содержимое по индексу и удаляет содержимое без ссылок.
 
-                pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix_to_delete)
+        :param created_before: Содержимое, загруженное или получившее ссылку позже, не проверяется
+            (запись индекса файла может еще не появиться)
 
-                delete_keys = []
-                for page in pages:
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            delete_keys.append({"Key": obj['Key']})
+        :return: Количество удаленных объектов содержимого
+        """
+        repository = self.blob_repository or BlobRepository()
+        return self._delete_unreferenced_blobs(repository.recount(created_before))
+
+    def _delete_unreferenced_blobs(self, blob_ids: list[int]) -> int:
+        repository = self.blob_repository or BlobRepository()
+        deleted = 0
+        for blob_id in blob_ids:
+            with transaction.atomic():
+                blob = repository.lock_unreferenced(blob_id)
+                if blob is None:
+                    continue
+                # Сначала запись: если удалить объект из S3 не получится, транзакция ее восстановит
+                blob.delete()
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=self._blob_key(blob.sha256))
+            deleted += 1
+        if deleted:
+            logger.info(f"Удалено содержимое без ссылок: {deleted} объектов")
+        return deleted
+
+    def create_presigned_upload(self, user_id: int, filename_in_s3: str, size: int,
+                                content_type: Optional[str] = None) -> dict:
+        """
+        Готовит прямую загрузку файла из браузера в S3 без передачи данных через Django.
 
-                if delete_keys:
-                    for i in range(0, len(delete_keys), 1000):
-                        batch = delete_keys[i:i + 1000]
-                        self.s3_client.delete_objects(Bucket=self.bucket_name, Delete={'Objects': batch})
+        Для файлов меньше FILES_MULTIPART_THRESHOLD выдается одна presigned-ссылка PUT,
+        для больших создается multipart upload и выдаются presigned-ссылки на каждую часть.
+        Ключ формируется на сервере, поэтому ссылки всегда ведут в папку пользователя.
 
-                    logger.info(f"Удалено {len(delete_keys)} объектов из папки {prefix_to_delete}")
-                else:
-                    logger.info(f"Папка {prefix_to_delete} пуста или не существует.")
+        :param user_id: Идентификатор пользователя Django
+        :param filename_in_s3: Имя файла и путь внутри папки пользователя
+        :param size: Размер файла в байтах
+        :param content_type: MIME-тип файла
 
-            else:
-                self.s3_client.delete_object(Bucket=self.bucket_name, Key=full_s3_key)
+        :return:
+            dict - Словарь с ключами:
+                - 'key': Полный ключ s3
+                - 'method': 'PUT' для загрузки одним запросом или 'MULTIPART'
+                - 'url' и 'headers': ссылка и заголовки запроса (только для PUT)
+                - 'upload_id', 'part_size', 'parts': идентификатор загрузки, размер части
+                  и список {'part_number', 'url'} (только для MULTIPART)
+                - 'expires_in': срок действия ссылок в секундах
 
+        :raises
+            ValueError: Если имя файла пустое или размер отрицательный
+            QuotaExceededError: Если файл не помещается в оставшуюся квоту
+            botocore.exceptions.ClientError: Если не удалось создать multipart upload
+        """
+        filename_in_s3 = filename_in_s3.strip('/')
+        if not filename_in_s3 or '..' in filename_in_s3.split('/'):
+            raise ValueError("Некорректное имя файла")
+        if size < 0:
+            raise ValueError("Размер файла не может быть отрицательным")
+
+        free_space = self.get_free_space(user_id)
+        if free_space is not None and size > free_space:
+            raise QuotaExceededError("Превышена квота на объем хранилища")
+
+        s3_key = f"user-{user_id}-files/{filename_in_s3}"
+        content_type = content_type or mimetypes.guess_type(s3_key)[0] or 'application/octet-stream'
+        expires_in = self.presigned_expires
+
+        if size < self.multipart_threshold:
+            url = self.presign_client.generate_presigned_url(
+                'put_object',
+                Params={'Bucket': self.bucket_name, 'Key': s3_key, 'ContentType': content_type},
+                ExpiresIn=expires_in,
+            )
+            logger.info(f"Выдана presigned-ссылка на загрузку {s3_key} для пользователя {user_id}")
+            return {
+                'key': s3_key,
+                'method': 'PUT',
+                'url': url,
+                'headers': {'Content-Type': content_type},
+                'expires_in': expires_in,
+            }
+
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=content_type,
+        )['UploadId']
+        part_size = self._get_part_size(size)
+        parts = [
+            {
+                'part_number': part_number,
+                'url': self.presign_client.generate_presigned_url(
+                    'upload_part',
+                    Params={'Bucket': self.bucket_name, 'Key': s3_key, 'UploadId': upload_id,
+                            'PartNumber': part_number},
+                    ExpiresIn=expires_in,
+                ),
+            }
+            for part_number in range(1, max(1, math.ceil(size / part_size)) + 1)
+        ]
+        logger.info(f"Создана прямая multipart загрузка {s3_key} ({len(parts)} частей) для пользователя {user_id}")
+        return {
+            'key': s3_key,
+            'method': 'MULTIPART',
+            'upload_id': upload_id,
+            'part_size': part_size,
+            'parts': parts,
+            'expires_in': expires_in,
+        }
+
+    def complete_presigned_upload(self, user_id: int, s3_key: str, upload_id: Optional[str] = None,
+                                  parts: Optional[list[dict]] = None) -> dict:
+        """
+        Регистрирует файл, загруженный напрямую в S3 по presigned-ссылкам.
+
+        Для multipart загрузки сначала собирает объект из частей. Затем проверяет объект
+        через head_object и обновляет индекс метаданных и кэш листингов.
+
+        Квота при выдаче ссылок проверяется по заявленному размеру, а загрузить по ним можно
+        больше, поэтому здесь она проверяется еще раз по фактическому размеру объекта.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ s3, выданный create_presigned_upload
+        :param upload_id: Идентификатор multipart загрузки или None для загрузки одним PUT
+        :param parts: Список {'part_number', 'etag'} загруженных частей (только для multipart)
+
+        :return: dict - Словарь с ключами 'key', 'size', 'etag', 'content_type'
+
+        :raises
+            PermissionError: Если ключ не принадлежит пользователю
+            QuotaExceededError: Если объект не помещается в оставшуюся квоту; объект удаляется
+            botocore.exceptions.ClientError: Если объект не найден или части не удалось собрать
+        """
+        if not s3_key.startswith(f"user-{user_id}-files/"):
+            raise PermissionError("Доступ к объекту запрещен")
+
+        if upload_id:
+            multipart_parts = sorted(
+                ({'PartNumber': int(part['part_number']), 'ETag': part['etag']} for part in parts or []),
+                key=lambda p: p['PartNumber'],
+            )
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': multipart_parts},
+            )
+
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+        uploaded = {
+            'key': s3_key,
+            'size': head['ContentLength'],
+            'etag': head.get('ETag', ''),
+            'content_type': head.get('ContentType', ''),
+        }
+        self._check_presigned_quota(user_id, s3_key, uploaded['size'])
+        self._register_upload(user_id, s3_key, uploaded)
+        self._invalidate_listing(user_id, s3_key)
+
+        logger.info(f"Прямая загрузка {s3_key} ({uploaded['size']} байт) зарегистрирована для пользователя {user_id}")
+        return uploaded
+
+    def _check_presigned_quota(self, user_id: int, s3_key: str, size: int) -> None:
+        """
+        Проверяет, что загруженный напрямую объект помещается в квоту; место прежней версии файла
+        с тем же ключом считается свободным. Объект сверх квоты удаляется.
+
+        :raises
+            QuotaExceededError: Если объект не помещается в оставшуюся квоту
+        """
+        free_space = self.get_free_space(user_id)
+        if free_space is None:
+            return
+
+        previous = None
+        if self.file_repository is not None:
+            try:
+                previous = self.file_repository.get_by_key(user_id, s3_key)
+            except DatabaseError as e:
+                logger.error(f"Ошибка чтения индекса метаданных для {s3_key}: {e}")
+        if previous is not None and previous.is_folder:
+            previous = None
+        if size <= free_space + (previous.occupied_size if previous is not None else 0):
+            return
+
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
+        if previous is not None and previous.blob_id is None:
+            # Прежняя версия хранилась под тем же ключом и уже перезаписана загрузкой
+            self._sync_index('delete_keys', user_id, [s3_key])
+            self._sync_usage('apply', user_id,
+                             {UsageRepository.top_folder(user_id, s3_key): (-previous.occupied_size, -1)})
+            self._invalidate_thumbnails(s3_key)
+        self._invalidate_listing(user_id, s3_key)
+        logger.warning(f"Прямая загрузка {s3_key} ({size} байт) не помещается в квоту пользователя {user_id}, "
+                       f"объект удален")
+        raise QuotaExceededError("Превышена квота на объем хранилища")
+
+    def abort_presigned_upload(self, user_id: int, s3_key: str, upload_id: str) -> bool:
+        """
+        Отменяет незавершенную прямую multipart загрузку.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ s3
+        :param upload_id: Идентификатор multipart загрузки
+
+        :return: True, если отмена прошла успешно, иначе False
+        """
+        if not s3_key.startswith(f"user-{user_id}-files/"):
+            return False
+
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
             return True
 
         except ClientError as e:
-            logger.error(f"Ошибка при удалении объекта {full_s3_key} : {e}")
+            logger.error(f"Ошибка при отмене загрузки {upload_id} для {s3_key}: {e}")
             return False
 
-    def rename_object(self, user_id: int, s3_key: str, new_name: str) -> bool:
+    def create_resumable_upload(self, user_id: int, filename_in_s3: str, size: int,
+                                content_type: Optional[str] = None) -> dict:
         """
-        Переименовывает файл или папку.
+        Создает возобновляемую загрузку: клиент передает файл фрагментами с указанием смещения
+        и после обрыва связи продолжает с последнего принятого байта.
 
-        :param user_id: Идентификатор пользователя Django.
-        :param s3_key: Относительный путь к файлу или папке (например, 'folder/old_name.txt').
-        :param new_name: Новое имя (только имя, не путь!).
+        :param user_id: Идентификатор пользователя Django
+        :param filename_in_s3: Имя файла и путь внутри папки пользователя
+        :param size: Размер файла в байтах
+        :param content_type: MIME-тип файла
 
-        :return: True, если переименование прошло успешно, иначе False.
+        :return: dict - Состояние загрузки в формате get_resumable_upload
+
+        :raises
+            ValueError: Если имя файла пустое или размер отрицательный
+            QuotaExceededError: Если файл не помещается в оставшуюся квоту
+            botocore.exceptions.ClientError: Если не удалось сохранить пустой файл
         """
-        if not new_name:
-            logger.error(f"Новое имя не может быть пустым")
+        filename_in_s3 = filename_in_s3.strip('/')
+        if not filename_in_s3 or '..' in filename_in_s3.split('/'):
+            raise ValueError("Некорректное имя файла")
+        if size < 0:
+            raise ValueError("Размер файла не может быть отрицательным")
+
+        free_space = self.get_free_space(user_id)
+        if free_space is not None and size > free_space:
+            raise QuotaExceededError("Превышена квота на объем хранилища")
+
+        s3_key = f"user-{user_id}-files/{filename_in_s3}"
+        content_type = content_type or mimetypes.guess_type(s3_key)[0] or 'application/octet-stream'
+        upload = self.upload_repository.create(user_id, s3_key, size, self._get_part_size(size), content_type)
+        logger.info(f"Создана возобновляемая загрузка {upload.pk} в {s3_key} ({size} байт) для пользователя {user_id}")
+
+        if size == 0:
+            # Пустой файл принят целиком уже при создании загрузки
+            self._complete_resumable_upload(upload)
+            upload.refresh_from_db()
+        return self._upload_state(upload)
+
+    def get_resumable_upload(self, user_id: int, upload_id) -> Optional[dict]:
+        """
+        Возвращает состояние загрузки. Если файл принят целиком, но сборка его не удалась,
+        сборка повторяется: принятое смещение, равное размеру, означает для клиента готовый файл.
+
+        :return: dict - Словарь с ключами 'id', 'key', 'size', 'offset', 'completed' и 'expires_at'
+            или None, если загрузки нет
+
+        :raises
+            UploadLockedError: Если загрузку в это время дополняет или собирает другой запрос
+            botocore.exceptions.ClientError: Если повторная сборка файла не удалась
+        """
+        upload = self.upload_repository.get(user_id, upload_id)
+        if upload is None:
+            return None
+        if upload.offset < upload.size or upload.completed_at is not None:
+            return self._upload_state(upload)
+
+        token = uuid.uuid4().hex
+        if not self.upload_repository.lock(upload.pk, token, timezone.now() - timedelta(seconds=UPLOAD_LOCK_TIMEOUT)):
+            raise UploadLockedError("Загрузку дополняет другой запрос")
+
+        try:
+            upload.refresh_from_db()
+            if upload.completed_at is None:
+                logger.warning(f"Повторная сборка возобновляемой загрузки {upload.pk}")
+                self._complete_resumable_upload(upload)
+                upload.refresh_from_db()
+            return self._upload_state(upload)
+
+        finally:
+            self.upload_repository.unlock(upload.pk, token)
+
+    def append_resumable_upload(self, user_id: int, upload_id, offset: int, stream: BinaryIO,
+                                length: int) -> Optional[dict]:
+        """
+        Принимает очередной фрагмент возобновляемой загрузки.
+
+        Полные части сразу загружаются в S3 multipart upload, остаток сохраняется сегментом
+        под служебным префиксом до следующего фрагмента. Если клиент оборвал соединение,
+        сохраняется все, что успело прийти. Когда принят весь файл, загрузка завершается;
+        если сборка не удалась, ее повторяют get_resumable_upload или пустой фрагмент
+        со смещением, равным размеру.
+
+        :param user_id: Идентификатор пользователя Django
+        :param upload_id: Идентификатор загрузки
+        :param offset: Смещение фрагмента от начала файла
+        :param stream: Поток с данными фрагмента
+        :param length: Длина фрагмента в байтах
+
+        :return: dict - Состояние загрузки или None, если загрузки нет
+
+        :raises
+            UploadOffsetError: Если смещение не совпадает с принятым объемом
+            UploadLockedError: Если загрузку в это время дополняет другой запрос
+            ValueError: Если фрагмент выходит за размер файла
+            botocore.exceptions.ClientError: Если не удалось сохранить данные в S3
+        """
+        upload = self.upload_repository.get(user_id, upload_id)
+        if upload is None:
+            return None
+
+        token = uuid.uuid4().hex
+        if not self.upload_repository.lock(upload.pk, token, timezone.now() - timedelta(seconds=UPLOAD_LOCK_TIMEOUT)):
+            raise UploadLockedError("Загрузку дополняет другой запрос")
+
+        try:
+            upload.refresh_from_db()
+            if offset != upload.offset:
+                raise UploadOffsetError(f"Ожидалось смещение {upload.offset}")
+            if length > upload.size - upload.offset:
+                raise ValueError("Фрагмент выходит за размер файла")
+
+            started = time.monotonic()
+            received, consumed = self._receive_upload_data(upload, stream, length)
+            if not self.upload_repository.save_progress(upload.pk, token, upload.offset, upload.multipart_id,
+                                                        upload.parts, upload.segments):
+                raise UploadLockedError("Загрузку перехватил другой запрос")
+            self._delete_upload_segments(consumed)
+            logger.debug(f"Загрузка {upload.pk}: принято {received} байт за {time.monotonic() - started:.2f} с, "
+                         f"{upload.offset} из {upload.size}")
+
+            if upload.offset == upload.size and upload.completed_at is None:
+                self._complete_resumable_upload(upload)
+                upload.refresh_from_db()
+
+            return self._upload_state(upload)
+
+        finally:
+            self.upload_repository.unlock(upload.pk, token)
+
+    def abort_resumable_upload(self, user_id: int, upload_id) -> bool:
+        """
+        Отменяет возобновляемую загрузку и удаляет уже принятые данные.
+
+        :return: bool - True, если загрузка была найдена
+        """
+        upload = self.upload_repository.get(user_id, upload_id)
+        if upload is None:
             return False
+        self._discard_resumable_upload(upload)
+        logger.info(f"Возобновляемая загрузка {upload.pk} в {upload.s3_key} отменена")
+        return True
 
-        old_full_key = s3_key
-        is_folder = old_full_key.endswith('/')
+    def collect_resumable_uploads(self, updated_before: datetime) -> int:
+        """
+        Удаляет брошенные загрузки: возобновляемые загрузки без активности с updated_before
+        и multipart upload в бакете, начатые раньше updated_before и не принадлежащие
+        незавершенной возобновляемой загрузке (например, прерванные прямые загрузки).
+
+        :param updated_before: Граница давности
+
+        :return: Количество удаленных загрузок
+        """
+        removed = 0
+        for upload in self.upload_repository.list_expired(updated_before):
+            try:
+                self._discard_resumable_upload(upload)
+                removed += 1
+            except ClientError as e:
+                logger.error(f"Не удалось удалить загрузку {upload.pk}: {e}")
+
+        active = self.upload_repository.active_multipart_ids()
+        paginator = self.s3_client.get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=self.bucket_name):
+            for item in page.get('Uploads', []):
+                if item['UploadId'] in active or item['Initiated'] >= updated_before:
+                    continue
+                try:
+                    self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=item['Key'],
+                                                          UploadId=item['UploadId'])
+                    removed += 1
+                except ClientError as e:
+                    logger.error(f"Не удалось отменить multipart upload {item['Key']}: {e}")
+
+        if removed:
+            logger.info(f"Удалено брошенных загрузок: {removed}")
+        return removed
+
+    def _upload_state(self, upload: ResumableUpload) -> dict:
+        return {
+            'id': str(upload.pk),
+            'key': upload.s3_key,
+            'size': upload.size,
+            'offset': upload.offset,
+            'completed': upload.completed_at is not None,
+            'expires_at': upload.updated_at + timedelta(seconds=self.resumable_expires),
+        }
+
+    @staticmethod
+    def _upload_segment_key(upload: ResumableUpload, start: int) -> str:
+        return f"{UPLOAD_SEGMENT_PREFIX}{upload.pk}/{start}"
+
+    def _receive_upload_data(self, upload: ResumableUpload, stream: BinaryIO, length: int) -> Tuple[int, list[str]]:
+        """
+        Читает фрагмент и обновляет состояние upload (offset, multipart_id, parts, segments) без сохранения.
 
-        operations_count = 0
+        Сегмент называется по смещению своего начала, поэтому повтор фрагмента после сбоя
+        до сохранения состояния перезаписывает те же объекты теми же данными.
 
+        :return: tuple - Количество принятых байт и ключи сегментов, вошедших в загруженные части
+        """
+        consumed = []
+        buffer = bytearray()
+        pending = sum(size for _, size in upload.segments)
+        received = 0
+
+        while received < length:
+            try:
+                chunk = stream.read(min(HASH_CHUNK_SIZE, length - received))
+            except OSError as e:
+                logger.warning(f"Загрузка {upload.pk}: соединение прервано после {received} байт фрагмента: {e}")
+                break
+            if not chunk:
+                break
+            received += len(chunk)
+            buffer += chunk
+
+            while pending + len(buffer) >= upload.part_size:
+                data = bytearray()
+                for start, _ in upload.segments:
+                    data += self._read_upload_segment(upload, start)
+                    consumed.append(self._upload_segment_key(upload, start))
+                data += buffer
+                upload.segments = []
+                pending = 0
+
+                if not upload.multipart_id:
+                    upload.multipart_id = self.s3_client.create_multipart_upload(
+                        Bucket=self.bucket_name,
+                        Key=upload.s3_key,
+                        ContentType=upload.content_type,
+                    )['UploadId']
+                upload.parts.append(self._upload_part_with_retries(
+                    upload.s3_key, upload.multipart_id, len(upload.parts) + 1, bytes(data[:upload.part_size])))
+                buffer = data[upload.part_size:]
+
+        upload.offset += received
+        if buffer:
+            start = upload.offset - len(buffer)
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=self._upload_segment_key(upload, start),
+                                      Body=bytes(buffer))
+            upload.segments.append([start, len(buffer)])
+        return received, consumed
+
+    def _read_upload_segment(self, upload: ResumableUpload, start: int) -> bytes:
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._upload_segment_key(upload, start))
         try:
-            if is_folder:
-                old_prefix = old_full_key
-                parent_prefix_parts = old_prefix.rstrip('/').split('/')[:-1]
-                parent_prefix = '/'.join(parent_prefix_parts)
-                if parent_prefix:
-                    parent_prefix += '/'
-                new_prefix = f"{parent_prefix}{new_name}"
+            return response['Body'].read()
+        finally:
+            response['Body'].close()
 
-                paginator = self.s3_client.get_paginator('list_objects_v2')
-                pages = paginator.paginate(Bucket=self.bucket_name, Prefix=old_prefix)
+    def _delete_upload_segments(self, keys: list[str]) -> None:
+        """
+        Удаляет сегменты, уже вошедшие в части; оставшиеся удалит collect_resumable_uploads.
+        """
+        for batch_start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[batch_start:batch_start + DELETE_BATCH_SIZE]
+            try:
+                self.s3_client.delete_objects(Bucket=self.bucket_name,
+                                              Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+            except ClientError as e:
+                logger.error(f"Не удалось удалить сегменты загрузки: {e}")
+
+    def _complete_resumable_upload(self, upload: ResumableUpload) -> dict:
+        """
+        Собирает файл из принятых частей и сегментов и регистрирует его как обычную загрузку.
 
-                for page in pages:
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            old_object_key = obj['Key']
-                            relative_path = old_object_key[len(old_prefix):]
-                            new_object_key = f"{new_prefix}{relative_path}"
+        Файл меньше одной части загружается одним put_object без multipart upload.
+        Повторный вызов после сбоя безопасен: если multipart upload уже был завершен,
+        регистрируется собранный им объект.
 
-                            copy_source = {"Bucket": self.bucket_name, "Key": old_object_key}
+        :return: dict - Результат в формате complete_presigned_upload
+        """
+        data = bytearray()
+        for start, _ in upload.segments:
+            data += self._read_upload_segment(upload, start)
+
+        if upload.multipart_id:
+            parts = list(upload.parts)
+            try:
+                if data:
+                    parts.append(self._upload_part_with_retries(upload.s3_key, upload.multipart_id,
+                                                                len(parts) + 1, bytes(data)))
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=upload.s3_key,
+                    UploadId=upload.multipart_id,
+                    MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag}
+                                               for number, etag in enumerate(parts, start=1)]},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                    raise
+                logger.warning(f"Multipart upload загрузки {upload.pk} уже завершен, регистрируется собранный файл")
+        else:
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=upload.s3_key, Body=bytes(data),
+                                      ContentType=upload.content_type)
+
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=upload.s3_key)
+        uploaded = {
+            'key': upload.s3_key,
+            'size': head['ContentLength'],
+            'etag': head.get('ETag', ''),
+            'content_type': head.get('ContentType', ''),
+        }
+        self._register_upload(upload.user_id, upload.s3_key, uploaded)
+        self._invalidate_listing(upload.user_id, upload.s3_key)
+        self.upload_repository.complete(upload.pk)
+        self._delete_prefix(f"{UPLOAD_SEGMENT_PREFIX}{upload.pk}/")
+
+        logger.info(f"Возобновляемая загрузка {upload.pk} завершена: {upload.s3_key} ({uploaded['size']} байт)")
+        return uploaded
+
+    def _discard_resumable_upload(self, upload: ResumableUpload) -> None:
+        """
+        Отменяет multipart upload загрузки, удаляет ее сегменты и запись о ней.
+        """
+        if upload.multipart_id and upload.completed_at is None:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=upload.s3_key,
+                                                      UploadId=upload.multipart_id)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                    raise
+        self._delete_prefix(f"{UPLOAD_SEGMENT_PREFIX}{upload.pk}/")
+        self.upload_repository.delete(upload.pk)
+
+    def create_presigned_download(self, s3_key: str, filename: Optional[str] = None,
+                                  internal: bool = False) -> str:
+        """
+        Создает короткоживущую presigned-ссылку на скачивание объекта.
 
-                            self.s3_client.copy_object(
-                                Bucket=self.bucket_name,
-                                CopySource=copy_source,
-                                Key=new_object_key)
+        :param s3_key: Полный ключ s3
+        :param filename: Имя файла для заголовка Content-Disposition или None
+        :param internal: True - подписать для внутреннего адреса MinIO (для проксирования через nginx),
+            False - для публичного адреса, доступного из браузера
 
-                            self.s3_client.delete_object(Bucket=self.bucket_name, Key=old_object_key)
-                            operations_count += 1
+        :return: str - Ссылка GET на объект
+        """
+        source_key, row = self._resolve_object(s3_key)
+        params = {'Bucket': self.bucket_name, 'Key': source_key}
+        if filename:
+            params['ResponseContentDisposition'] = content_disposition_header(True, filename)
+        if row is not None and row.content_type:
+            params['ResponseContentType'] = row.content_type
 
-                logger.info(f"Папка {old_prefix} переименована в {new_prefix}, обработано {operations_count} объектов")
+        client = self.s3_client if internal else self.presign_client
+        return client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.download_expires)
 
-            else:
-                old_key = old_full_key
-                parent_prefix_parts = old_key.split('/')[:-1]
-                parent_prefix = '/'.join(parent_prefix_parts)
+    def get_object_info(self, s3_key: str) -> dict:
+        """
+        Возвращает метаданные объекта без чтения его содержимого.
 
-                if parent_prefix:
-                    parent_prefix += '/'
+        :param s3_key: Полный ключ s3
 
-                new_key = f"{parent_prefix}{new_name}"
+        :return: dict - Словарь с ключами 'size' (размер объекта в S3), 'etag', 'last_modified', 'content_type',
+            'codec' (кодек сжатия или None) и 'original_size' (размер до сжатия, если известен)
 
-                copy_source = {"Bucket": self.bucket_name, "Key": old_key}
-                self.s3_client.copy_object(Bucket=self.bucket_name, Key=new_key, CopySource=copy_source)
-                self.s3_client.delete_object(Bucket=self.bucket_name, Key=old_key)
+        :raises
+            botocore.exceptions.ClientError: Если объект не найден
+        """
+        source_key, row = self._resolve_object(s3_key)
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=source_key)
+        info = {
+            'size': head['ContentLength'],
+            'etag': head.get('ETag', ''),
+            'last_modified': head.get('LastModified'),
+            'content_type': head.get('ContentType') or 'application/octet-stream',
+            'codec': compression.object_codec(head),
+            'original_size': compression.original_size(head),
+        }
+        if row is not None:
+            # Содержимое общее для нескольких файлов, время изменения и тип - у конкретного файла
+            info['last_modified'] = row.last_modified or info['last_modified']
+            info['content_type'] = row.content_type or info['content_type']
+        return info
+
+    def open_object(self, s3_key: str, byte_range: Optional[Tuple[int, int]] = None,
+                    if_match: Optional[str] = None, decode: bool = True) -> Iterator[bytes]:
+        """
+        Открывает объект или его диапазон для потокового чтения.
 
-                logger.info(f"Файл {old_key} переименован в {new_key}")
+        Запрос к S3 выполняется сразу, чтобы ошибки (нет объекта, объект изменился)
+        возникали до начала отдачи ответа. Данные читаются частями FILES_DOWNLOAD_CHUNK_SIZE.
 
-            return True
+        :param s3_key: Полный ключ s3
+        :param byte_range: Диапазон (start, end) включительно или None для всего объекта
+        :param if_match: ETag, с которым объект должен совпадать, или None
+        :param decode: Распаковывать сжатый объект; False - отдавать байты объекта как есть.
+            Диапазон относится к байтам объекта, поэтому для сжатого объекта задается только с decode=False
 
-        except ClientError as e:
-            logger.error(f"Ошибка при переименовании объекта '{old_full_key}': {e}")
-            return False
+        :return: Iterator[bytes] - Итератор по содержимому, закрывающий поток по завершении
 
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при переименовании объекта '{old_full_key}': {e}")
+        :raises
+            botocore.exceptions.ClientError: Если объект не найден или изменился
+        """
+        return self._open_object(s3_key, byte_range, if_match, decode)[1]
+
+    def _open_object(self, s3_key: str, byte_range: Optional[Tuple[int, int]] = None,
+                     if_match: Optional[str] = None, decode: bool = True) -> Tuple[dict, Iterator[bytes]]:
+        """
+        Вариант open_object, возвращающий также ответ get_object (метаданные объекта).
+        """
+        params = {'Bucket': self.bucket_name, 'Key': self._resolve_object(s3_key)[0]}
+        if byte_range is not None:
+            params['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        if if_match:
+            params['IfMatch'] = if_match
+        response = self.s3_client.get_object(**params)
+        body = response['Body']
+        codec = compression.object_codec(response) if decode else None
+
+        def generate() -> Iterator[bytes]:
+            try:
+                chunks = body.iter_chunks(self.download_chunk_size)
+                yield from compression.iter_decompressed(chunks, codec) if codec else chunks
+            finally:
+                body.close()
+
+        return response, generate()
+
+    def iter_folder_zip(self, folder_key: str) -> Iterator[bytes]:
+        """
+        Формирует ZIP-архив папки на лету по постраничному листингу префикса.
+
+        Пока текущий файл передается клиенту, следующие FILES_ZIP_PREFETCH_DEPTH объектов
+        уже загружаются из S3 в пуле потоков. Заранее в память читаются только объекты
+        не больше FILES_ZIP_PREFETCH_MAX_SIZE, большие открываются потоком в свою очередь,
+        поэтому память ограничена независимо от размера папки.
+        Объекты, удаленные во время формирования архива, пропускаются.
+
+        :param folder_key: Полный ключ папки с завершающим '/'
+
+        :return: Iterator[bytes] - Итератор по байтам архива, в котором папка лежит в корне
+        """
+        return self.iter_selection_zip([folder_key])
+
+    def iter_selection_zip(self, s3_keys: list[str]) -> Iterator[bytes]:
+        """
+        Формирует один ZIP-архив из выбранных файлов и папок, как iter_folder_zip.
+
+        Пути в архиве строятся от общей родительской папки выбора.
+        Файлы, которых уже нет, пропускаются.
+
+        :param s3_keys: Полные ключи файлов и папок (папки - с завершающим '/')
+
+        :return: Iterator[bytes] - Итератор по байтам архива
+        """
+        selection = self._normalize_selection(s3_keys)
+        base_prefix = self._common_parent(selection)
+
+        def iter_folder(folder_key: str) -> Iterator[dict]:
+            if self.blob_repository is not None:
+                # Файлы с дедупликацией есть только в индексе; 'Source' - ключ объекта с содержимым
+                for row in self.file_repository.iter_prefix(self._key_user_id(folder_key), folder_key):
+                    yield {
+                        'Key': row.key,
+                        'Size': row.size,
+                        'LastModified': row.last_modified,
+                        'Source': self._blob_key(row.blob.sha256) if row.blob else row.key,
+                    }
+                return
+
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=folder_key):
+                yield from page.get('Contents', [])
+
+        def iter_files(keys: list[str]) -> Iterator[dict]:
+            rows = {}
+            if self.file_repository is not None and keys:
+                rows = self.file_repository.get_many(self._key_user_id(keys[0]), keys)
+            for key in keys:
+                row = rows.get(key)
+                if row is not None:
+                    source = self._blob_key(row.blob.sha256) if self.blob_repository is not None and row.blob else key
+                    yield {'Key': key, 'Size': row.size, 'LastModified': row.last_modified, 'Source': source}
+                    continue
+                try:
+                    head = self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+                except ClientError as e:
+                    if not self._is_missing(e):
+                        raise
+                    logger.warning(f"Объект {key} не найден, пропущен")
+                    continue
+                yield {'Key': key, 'Size': head['ContentLength'], 'LastModified': head.get('LastModified')}
+
+        def iter_objects() -> Iterator[dict]:
+            yield from iter_files([key for key in selection if not key.endswith('/')])
+            for folder_key in (key for key in selection if key.endswith('/')):
+                yield from iter_folder(folder_key)
+
+        def prefetch(obj: dict) -> Union[tuple, bool, None]:
+            if obj['Key'].endswith('/') or obj['Size'] > self.zip_prefetch_max_size:
+                return None
+            try:
+                source_key = obj.get('Source', obj['Key'])
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=source_key)
+                return response, response['Body'].read()
+            except ClientError as e:
+                if not self._is_missing(e):
+                    raise
+                return False
+
+        def iter_entries() -> Iterator[dict]:
+            for obj, data in iter_prefetched(prefetch, iter_objects(), self.zip_prefetch_depth,
+                                             thread_name_prefix='files-zip'):
+                entry = {
+                    'name': obj['Key'][len(base_prefix):],
+                    'size': obj['Size'],
+                    'last_modified': obj.get('LastModified'),
+                }
+                if not obj['Key'].endswith('/'):
+                    try:
+                        if data is None:
+                            response, entry['chunks'] = self._open_object(obj.get('Source', obj['Key']))
+                        elif data is not False:
+                            # Сжатый объект хранится в памяти сжатым и распаковывается по мере записи в архив
+                            response, body = data
+                            codec = compression.object_codec(response)
+                            entry['chunks'] = compression.iter_decompressed([body], codec) if codec else [body]
+                    except ClientError as e:
+                        if not self._is_missing(e):
+                            raise
+                        data = False
+                    if data is False:
+                        logger.warning(f"Объект {obj['Key']} удален во время архивации, пропущен")
+                        continue
+                    if compression.object_codec(response):
+                        # В листинге - размер сжатого объекта, в архив пишется исходное содержимое
+                        entry['size'] = compression.original_size(response)
+                yield entry
+
+        return iter_zip(iter_entries())
+
+    @staticmethod
+    def _thumbnail_key(s3_key: str) -> str:
+        return f"{DERIVATIVE_PREFIX}{s3_key}{THUMBNAIL_SUFFIX}"
+
+    def request_thumbnail(self, user_id: int, s3_key: str, content_type: Optional[str] = None) -> bool:
+        """
+        Ставит построение миниатюры файла в очередь воркера run_jobs.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ файла
+        :param content_type: MIME-тип файла или None, чтобы определить его по ключу
+
+        :return: bool - True, если для файла строится миниатюра
+        """
+        if self.job_repository is None or not thumbnails.supports(content_type or mimetypes.guess_type(s3_key)[0]):
+            return False
+        try:
+            self.job_repository.enqueue_once(user_id, Job.KIND_THUMBNAIL, {'s3_key': s3_key})
+        except DatabaseError as e:
+            logger.error(f"Не удалось поставить в очередь миниатюру {s3_key}: {e}")
             return False
+        return True
+
+    def generate_thumbnail(self, s3_key: str) -> bool:
+        """
+        Строит миниатюру файла и сохраняет ее под служебным префиксом DERIVATIVE_PREFIX.
+
+        Для файла, который слишком велик или не декодируется, сохраняется пустая миниатюра,
+        чтобы запросы из файлового менеджера не ставили его в очередь снова.
+
+        :param s3_key: Полный ключ файла
+
+        :return: bool - True, если миниатюра построена; False, если файла нет, он слишком большой
+            или его не удалось декодировать
+
+        :raises
+            botocore.exceptions.ClientError: Если возникла ошибка S3, кроме отсутствия файла
+        """
+        try:
+            info = self.get_object_info(s3_key)
+        except ClientError as e:
+            if not self._is_missing(e):
+                raise
+            return False
+
+        started = time.monotonic()
+        thumbnail = None
+        source_size = info['original_size'] or info['size']
+        if thumbnails.supports(info['content_type']) and source_size <= self.thumbnail_max_source_size:
+            # IfMatch: если файл перезаписан во время построения, операция повторится с новым содержимым
+            data = b''.join(self.open_object(s3_key, if_match=info['etag']))
+            thumbnail = thumbnails.render_thumbnail(data, info['content_type'], self.thumbnail_size)
+
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self._thumbnail_key(s3_key),
+            Body=thumbnail or b'',
+            ContentType=thumbnails.THUMBNAIL_CONTENT_TYPE,
+        )
+        if thumbnail is None:
+            logger.info(f"Для {s3_key} миниатюра не строится ({info['content_type']}, {info['size']} байт)")
+            return False
+        logger.debug(f"Миниатюра {s3_key} построена за {(time.monotonic() - started) * 1000:.1f} мс "
+                     f"({info['size']} -> {len(thumbnail)} байт)")
+        return True
+
+    def open_thumbnail(self, s3_key: str) -> dict:
+        """
+        Читает миниатюру файла.
+
+        :param s3_key: Полный ключ файла
+
+        :return: dict - Словарь с ключами 'body', 'etag' и 'content_type'; пустой 'body' - для файла
+            миниатюра не строится
+
+        :raises
+            botocore.exceptions.ClientError: Если миниатюра еще не построена
+        """
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._thumbnail_key(s3_key))
+        try:
+            body = response['Body'].read()
+        finally:
+            response['Body'].close()
+        return {
+            'body': body,
+            'etag': response.get('ETag', ''),
+            'content_type': response.get('ContentType') or thumbnails.THUMBNAIL_CONTENT_TYPE,
+        }
+
+    def _move_thumbnail(self, user_id: int, old_key: str, new_key: str) -> None:
+        """
+        Переносит миниатюру переименованного файла; если ее не было, ставит построение в очередь.
+        """
+        if self.job_repository is None:
+            return
+        try:
+            self.s3_client.copy_object(
+                Bucket=self.bucket_name,
+                CopySource={'Bucket': self.bucket_name, 'Key': self._thumbnail_key(old_key)},
+                Key=self._thumbnail_key(new_key),
+            )
+        except ClientError as e:
+            if not self._is_missing(e):
+                logger.error(f"Не удалось перенести миниатюру {old_key}: {e}")
+            # Под новым именем могла остаться миниатюра перезаписанного файла
+            self._invalidate_thumbnails(new_key)
+            self.request_thumbnail(user_id, new_key)
+        self._invalidate_thumbnails(old_key)
+
+    def _invalidate_thumbnails(self, s3_key: str) -> None:
+        """
+        Удаляет миниатюру файла или миниатюры всех файлов папки.
+
+        Ошибка записывается в лог и не отменяет уже выполненную операцию над файлами.
+
+        :param s3_key: Полный ключ файла или папки с завершающим '/'
+        """
+        if self.job_repository is None:
+            return
+        try:
+            if s3_key.endswith('/'):
+                result = self._delete_prefix(f"{DERIVATIVE_PREFIX}{s3_key}")
+                if result.failed_keys:
+                    logger.error(f"Не удалось удалить {len(result.failed_keys)} миниатюр папки {s3_key}")
+            else:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=self._thumbnail_key(s3_key))
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Не удалось удалить миниатюры {s3_key}: {e}")
+
+    @staticmethod
+    def _is_missing(error: ClientError) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey')
+
+    @staticmethod
+    def _get_file_size(file_obj: BinaryIO) -> Optional[int]:
+        """
+        Определяет размер загружаемого файла без его чтения.
+
+        :param file_obj: Объект файла (UploadedFile или файлоподобный объект)
+
+        :return: Количество байт до конца файла или None, если размер определить нельзя
+        """
+        size = getattr(file_obj, 'size', None)
+        if size is not None:
+            return size
+
+        try:
+            position = file_obj.tell()
+            file_obj.seek(0, io.SEEK_END)
+            end = file_obj.tell()
+            file_obj.seek(position)
+            return end - position
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _get_part_size(self, size: Optional[int]) -> int:
+        """
+        Подбирает размер части так, чтобы файл уложился в лимит S3 на количество частей.
+
+        :param size: Размер файла в байтах или None, если он неизвестен
+
+        :return: Размер части в байтах
+        """
+        if size is None:
+            return self.multipart_part_size
+        return max(self.multipart_part_size, math.ceil(size / MAX_PARTS_COUNT))
+
+    @staticmethod
+    def _iter_parts(file_obj: BinaryIO, part_size: int, first_chunk: bytes) -> Iterator[Tuple[int, bytes]]:
+        """
+        Последовательно читает файл частями фиксированного размера.
+
+        :param file_obj: Объект файла
+        :param part_size: Размер части в байтах
+        :param first_chunk: Уже прочитанная первая часть
+
+        :return: Итератор пар (номер части, данные части)
+        """
+        part_number = 1
+        chunk = first_chunk
+        while chunk:
+            yield part_number, chunk
+            part_number += 1
+            chunk = file_obj.read(part_size)
+
+    def _upload_multipart(self, s3_key: str, file_obj: BinaryIO, size: Optional[int] = None,
+                          content_type: str = 'application/octet-stream',
+                          object_params: Optional[dict] = None) -> dict:
+        """
+        Загружает файл по частям, отправляя части параллельно.
+
+        Части читаются из файла по мере освобождения потоков, поэтому в памяти одновременно
+        находится не более FILES_MULTIPART_MAX_CONCURRENCY частей. Если файл оказался меньше
+        одной части, он загружается обычным put_object. При ошибке незавершенная загрузка
+        отменяется, чтобы не оставлять в бакете оплачиваемые части.
+
+        :param s3_key: Полный ключ объекта в S3
+        :param file_obj: Объект файла
+        :param size: Размер файла в байтах, если известен
+        :param content_type: MIME-тип объекта
+        :param object_params: Дополнительные параметры объекта для put_object и create_multipart_upload
+            (например, ContentEncoding и Metadata)
+
+        :return: dict - Словарь с ключами 'size' (количество загруженных байт) и 'etag'
+
+        :raises
+            botocore.exceptions.ClientError: Если часть не удалось загрузить после всех повторов
+        """
+        part_size = self._get_part_size(size)
+        first_chunk = file_obj.read(part_size)
+
+        if len(first_chunk) < part_size:
+            response = self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=first_chunk,
+                                                 ContentType=content_type, **(object_params or {}))
+            return {'size': len(first_chunk), 'etag': response.get('ETag', '')}
+
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=content_type,
+            **(object_params or {}),
+        )['UploadId']
+        parts = []
+        uploaded_bytes = 0
+
+        def upload_part(part: Tuple[int, bytes]) -> dict:
+            part_number, data = part
+            etag = self._upload_part_with_retries(s3_key, upload_id, part_number, data)
+            return {'PartNumber': part_number, 'ETag': etag}
+
+        try:
+            for (part_number, data), future in iter_bounded(
+                    upload_part,
+                    self._iter_parts(file_obj, part_size, first_chunk),
+                    self.multipart_concurrency,
+                    thread_name_prefix='files-upload'):
+                parts.append(future.result())
+                uploaded_bytes += len(data)
+
+            parts.sort(key=lambda p: p['PartNumber'])
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+            logger.debug(f"Multipart загрузка {s3_key} завершена: {len(parts)} частей")
+            return {'size': uploaded_bytes, 'etag': response.get('ETag', '')}
+
+        except Exception:
+            logger.error(f"Multipart загрузка {s3_key} прервана, отмена загрузки {upload_id}")
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Не удалось отменить multipart загрузку {upload_id}: {e}")
+            raise
+
+    def _upload_part_with_retries(self, s3_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """
+        Загружает одну часть, повторяя попытку при ошибке с экспоненциальной задержкой.
+
+        :param s3_key: Полный ключ объекта в S3
+        :param upload_id: Идентификатор multipart загрузки
+        :param part_number: Номер части (начиная с 1)
+        :param data: Данные части
+
+        :return: ETag загруженной части
+
+        :raises
+            botocore.exceptions.ClientError: Если все попытки завершились ошибкой
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data,
+                )
+                return response['ETag']
+
+            except (ClientError, BotoCoreError) as e:
+                if isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                    # Multipart upload отменен или уже завершен: повтор не поможет
+                    raise
+                attempt += 1
+                if attempt > self.part_retries:
+                    logger.error(f"Часть {part_number} файла {s3_key} не загружена после {attempt} попыток: {e}")
+                    raise
+                delay = 0.5 * 2 ** (attempt - 1)
+                logger.warning(f"Ошибка загрузки части {part_number} файла {s3_key}, "
+                               f"повтор через {delay:.1f} с: {e}")
+                time.sleep(delay)
+
+    def list_files(self, user_id: int, prefix: str = '') -> list[dict]:
+        """
+        Получает Список файлов и папок для указанного пользователя и префикса.
+
+        Проходит по всем страницам листинга, поэтому папки с более чем 1000 элементами
+        не обрезаются. Для больших папок следует использовать list_files_page.
+
+        :param user_id:Идентификатор пользователя Django
+        :param prefix: Префикс пути внутри пользователя
+
+        :return:
+            list[dict] - Список словарей, представляющий файлы или папки.
+                Каждый словарь содержит ключи:
+                - 'type': 'file' или 'folder'
+                - 'name': имя файла или папки
+                - 'full_key': Полный ключ s3
+                - 'size': размер (только для файлов)
+                - 'last_modified': время последнего изменения (только для файлов)
+        """
+        try:
+            items = list(self.iter_files(user_id, prefix))
+            logger.debug(f"Получен список {len(items)} элементов для пользователя {user_id}")
+            return items
+
+        except ClientError as e:
+            logger.error(f'Ошибка при получении списка элементов пользователя {user_id}: {e} ')
+            return False
+
+    def iter_files(self, user_id: int, prefix: str = '') -> Iterator[dict]:
+        """
+        Лениво перебирает файлы и папки по страницам листинга.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Префикс пути внутри пользователя
+
+        :return: Итератор словарей в формате list_files
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось получить страницу листинга
+        """
+        cursor = None
+        while True:
+            if self.blob_repository is not None:
+                page = self._fetch_index_page(user_id, prefix, LIST_MAX_KEYS, cursor, 'name')
+            else:
+                page = self._fetch_page(user_id, prefix, LIST_MAX_KEYS, cursor)
+            yield from page['items']
+            cursor = page['next_cursor']
+            if not cursor:
+                return
+
+    def list_files_page(self, user_id: int, prefix: str = '', page_size: int = LIST_MAX_KEYS,
+                        cursor: Optional[str] = None, sort: str = 'name') -> dict:
+        """
+        Получает одну страницу списка файлов и папок.
+
+        При FILES_LISTING_SOURCE = 'index' страница читается из индекса метаданных в базе данных
+        и может быть отсортирована, иначе - из S3 в лексикографическом порядке ключей.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Префикс пути внутри пользователя
+        :param page_size: Максимальное количество элементов на странице (не больше 1000)
+        :param cursor: Курсор следующей страницы из предыдущего ответа или None для первой страницы
+        :param sort: Поле сортировки ('name', 'size', 'last_modified', с '-' для обратного порядка),
+            учитывается только при чтении из индекса
+
+        :return:
+            dict - Словарь с ключами:
+                - 'items': список элементов в формате list_files
+                - 'next_cursor': курсор следующей страницы или None, если страница последняя
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось получить страницу листинга
+        """
+        page_size = max(1, min(page_size, LIST_MAX_KEYS))
+        if self.listing_source == 'index' and self.file_repository is not None:
+            page = self._fetch_index_page(user_id, prefix, page_size, cursor, sort)
+        else:
+            page = self._fetch_page(user_id, prefix, page_size, cursor)
+        logger.debug(f"Получена страница из {len(page['items'])} элементов для пользователя {user_id}")
+        return page
+
+    def _fetch_index_page(self, user_id: int, prefix: str, page_size: int, cursor: Optional[str],
+                          sort: str) -> dict:
+        """
+        Получает страницу листинга из индекса метаданных.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Префикс пути внутри пользователя
+        :param page_size: Максимальное количество элементов
+        :param cursor: Смещение от начала списка в виде строки или None
+        :param sort: Поле сортировки
+
+        :return: dict - Словарь с ключами 'items' и 'next_cursor'
+        """
+        relative_prefix = prefix.strip('/')
+        s3_prefix = f"user-{user_id}-files/{relative_prefix}/" if relative_prefix else f"user-{user_id}-files/"
+        offset = int(cursor) if cursor and cursor.isdigit() else 0
+
+        # Запрашиваем на один элемент больше, чтобы узнать, есть ли следующая страница
+        items = self.file_repository.list_children(user_id, s3_prefix, sort, offset, page_size + 1)
+        next_cursor = str(offset + page_size) if len(items) > page_size else None
+        return {'items': items[:page_size], 'next_cursor': next_cursor}
+
+    def _fetch_page(self, user_id: int, prefix: str, page_size: int, cursor: Optional[str]) -> dict:
+        """
+        Выполняет один запрос list_objects_v2 и преобразует ответ в элементы списка.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Префикс пути внутри пользователя
+        :param page_size: Максимальное количество ключей в ответе
+        :param cursor: Токен продолжения или None
+
+        :return: dict - Словарь с ключами 'items' и 'next_cursor'
+        """
+        cache_key = None
+        if self.listing_cache is not None:
+            cache_key, page = self.listing_cache.get(user_id, prefix, cursor, page_size)
+            if page is not None:
+                return page
+
+        s3_prefix, params = self._build_list_params(user_id, prefix, page_size, cursor)
+        page = self._parse_list_page(s3_prefix, self.s3_client.list_objects_v2(**params))
+
+        if cache_key is not None:
+            self.listing_cache.set(cache_key, page)
+        return page
+
+    def _build_list_params(self, user_id: int, prefix: str, page_size: int,
+                           cursor: Optional[str]) -> Tuple[str, dict]:
+        """
+        :return: tuple - Полный префикс папки и параметры запроса list_objects_v2
+        """
+        s3_prefix = f"user-{user_id}-files/{prefix.lstrip('/')}"
+        if s3_prefix and not s3_prefix.endswith('/'):
+            s3_prefix += '/'
+
+        params = {
+            'Bucket': self.bucket_name,
+            'Prefix': s3_prefix,
+            'Delimiter': '/',
+            'MaxKeys': page_size,
+        }
+        if cursor:
+            params['ContinuationToken'] = cursor
+
+        return s3_prefix, params
+
+    @staticmethod
+    def _parse_list_page(s3_prefix: str, response: dict) -> dict:
+        """
+        Преобразует ответ list_objects_v2 в страницу листинга.
+
+        :return: dict - Словарь с ключами 'items' и 'next_cursor'
+        """
+        items = []
+        #Обработка папок
+        for common_prefix in response.get('CommonPrefixes', []):
+            folder_prefix = common_prefix.get('Prefix')
+            folder_name = folder_prefix[len(s3_prefix):].rstrip('/')
+
+            if folder_name:
+                items.append({
+                    'type': 'folder',
+                    'name': folder_name,
+                    'full_key': folder_prefix
+                })
+
+        #Обработка файлов
+        for item in response.get('Contents', []):
+            key = item.get('Key')
+            file_name = key[len(s3_prefix):]
+
+            if file_name:
+                items.append({
+                    'type': 'file',
+                    'name': file_name,
+                    'full_key': key,
+                    'size': item.get('Size', 0),
+                    'last_modified': item.get('LastModified', None)
+                })
+
+        next_cursor = response.get('NextContinuationToken') if response.get('IsTruncated') else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def _invalidate_listing(self, user_id: int, s3_key: str) -> None:
+        """
+        Сбрасывает кэш листингов, затронутых изменением объекта.
+
+        Для файла сбрасываются его папка и ее предки, для папки - она сама,
+        все вложенные папки и ее предки.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ s3 или путь внутри папки пользователя
+        """
+        if self.listing_cache is None:
+            return
+
+        user_prefix = f"user-{user_id}-files/"
+        relative_key = s3_key[len(user_prefix):] if s3_key.startswith(user_prefix) else s3_key.lstrip('/')
+
+        if relative_key.endswith('/'):
+            self.listing_cache.invalidate_tree(user_id, relative_key)
+        else:
+            self.listing_cache.invalidate(user_id, relative_key.rpartition('/')[0])
+
+    def _sync_index(self, method_name: str, *args, **kwargs) -> None:
+        """
+        Применяет изменение к индексу метаданных в базе данных.
+
+        Ошибка базы данных не отменяет уже выполненную операцию в S3: она записывается в лог,
+        а расхождение устраняется командой reindex_files.
+
+        :param method_name: Имя метода FileRepository
+        """
+        if self.file_repository is None:
+            return
+
+        try:
+            getattr(self.file_repository, method_name)(*args, **kwargs)
+        except DatabaseError as e:
+            logger.error(f"Ошибка обновления индекса метаданных ({method_name}): {e}")
+
+    def _sync_usage(self, method_name: str, *args, **kwargs) -> None:
+        """
+        Применяет изменение к учету занятого места.
+
+        Как и для индекса, ошибка базы данных только записывается в лог,
+        расхождение устраняется командой reconcile_usage.
+
+        :param method_name: Имя метода UsageRepository
+        """
+        if self.usage_repository is None:
+            return
+
+        try:
+            getattr(self.usage_repository, method_name)(*args, **kwargs)
+        except DatabaseError as e:
+            logger.error(f"Ошибка обновления учета занятого места ({method_name}): {e}")
+
+    def get_usage(self, user_id: int) -> dict:
+        """
+        Возвращает занятое пользователем место без обращения к S3.
+
+        :param user_id: Идентификатор пользователя Django
+
+        :return: dict - Словарь с ключами 'bytes', 'objects' и 'quota' (None - без ограничения)
+        """
+        if self.usage_repository is None:
+            return {'bytes': 0, 'objects': 0, 'quota': None}
+
+        usage = self.usage_repository.get_usage(user_id)
+        if usage['quota'] is None:
+            usage['quota'] = self.default_quota or None
+        return usage
+
+    def get_free_space(self, user_id: int) -> Optional[int]:
+        """
+        :return: Оставшееся место пользователя в байтах или None, если квота не ограничена
+        """
+        usage = self.get_usage(user_id)
+        if usage['quota'] is None:
+            return None
+        return max(usage['quota'] - usage['bytes'], 0)
+
+    def _register_upload(self, user_id: int, s3_key: str, uploaded: dict) -> None:
+        """
+        Учитывает загруженный файл в объеме пользователя и добавляет его в индекс метаданных.
+
+        При перезаписи существующего файла учитывается только разница размеров,
+        если прежний размер известен из индекса, и освобождается прежнее содержимое.
+        Сжатый файл учитывается в квоте по размеру в хранилище, а в индекс и листинги
+        попадает его исходный размер.
+
+        Для файла в хранилище блобов запись индекса - единственная запись о файле, поэтому
+        ошибка ее сохранения не только записывается в лог: ссылка на содержимое снимается,
+        а ошибка передается вызывающему, и загрузка считается неудачной.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ объекта в S3
+        :param uploaded: Результат _put_file или _put_blob
+
+        :raises
+            django.db.DatabaseError: Если не удалось сохранить запись индекса файла в хранилище блобов
+        """
+        previous = None
+        if self.file_repository is not None:
+            try:
+                previous = self.file_repository.get_by_key(user_id, s3_key)
+            except DatabaseError as e:
+                logger.error(f"Ошибка чтения индекса метаданных для {s3_key}: {e}")
+        if previous is not None and previous.is_folder:
+            previous = None
+
+        original_size = uploaded.get('original_size') if uploaded.get('codec') else None
+        row = {
+            'key': s3_key,
+            'size': original_size if original_size is not None else uploaded['size'],
+            'stored_size': uploaded['size'] if original_size is not None else None,
+            'etag': uploaded.get('etag'),
+            'content_type': uploaded.get('content_type'),
+            'blob_id': uploaded.get('blob_id'),
+        }
+        if uploaded.get('blob_id') is not None:
+            try:
+                self.file_repository.upsert_objects(user_id, [row])
+            except DatabaseError as e:
+                logger.error(f"Файл {s3_key} не добавлен в индекс метаданных, ссылка на содержимое снята: {e}")
+                self._release_blobs({uploaded['blob_id']: 1})
+                raise
+        else:
+            self._sync_index('upsert_objects', user_id, [row])
+
+        if self.usage_repository is not None:
+            if previous is not None:
+                change = (uploaded['size'] - previous.occupied_size, 0)
+            else:
+                change = (uploaded['size'], 1)
+            self._sync_usage('apply', user_id, {UsageRepository.top_folder(user_id, s3_key): change})
+
+        if previous is not None:
+            self._invalidate_thumbnails(s3_key)
+        self.request_thumbnail(user_id, s3_key, uploaded.get('content_type'))
+
+        if previous is None:
+            return
+        if previous.blob_id is not None:
+            self._release_blobs({previous.blob_id: 1})
+        elif uploaded.get('blob_id') is not None:
+            # Прежняя версия хранилась под ключом файла, а новая - в хранилище блобов
+            try:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
+            except ClientError as e:
+                logger.error(f"Не удалось удалить прежнюю версию {s3_key}: {e}")
+
+    def search_files(self, user_id: int, query: str, limit: int = 100) -> list[dict]:
+        """
+        Ищет файлы и папки пользователя по части имени во всем дереве пользователя.
+
+        Поиск выполняется по индексу метаданных и не обращается к S3.
+
+        :param user_id: Идентификатор пользователя Django
+        :param query: Часть имени
+        :param limit: Максимальное количество результатов
+
+        :return: list[dict] - Найденные элементы в формате list_files с ключом 'parent_key'
+        """
+        if self.file_repository is None:
+            logger.warning(f"Поиск недоступен: индекс метаданных отключен (FILES_METADATA_INDEX_ENABLED)")
+            return []
+
+        started = time.monotonic()
+        items = self.file_repository.search_by_name(user_id, query, limit)
+        logger.debug(f"Поиск '{query}' для пользователя {user_id}: {len(items)} результатов "
+                     f"за {(time.monotonic() - started) * 1000:.1f} мс")
+        return items
+
+    def delete_object(self, user_id: int, s3_key: str,
+                      progress: Optional[Callable[[str, int], None]] = None,
+                      cancel: Optional[threading.Event] = None) -> DeleteResult:
+        """
+        Удаляет файл или папку (рекурсивно, все объекты с префиксом)
+
+        Папка удаляется потоково: пакеты delete_objects по 1000 ключей отправляются
+        по мере получения страниц листинга, несколько пакетов выполняются параллельно.
+        Ошибки по отдельным ключам из ответа delete_objects попадают в результат.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Относительный путь к файлу или папке
+        :param progress: Необязательная функция progress('delete', количество удаленных объектов)
+        :param cancel: Необязательное событие отмены: удаление папки останавливается после текущих пакетов,
+            уже удаленные объекты не восстанавливаются
+
+        :return: DeleteResult - количество удаленных объектов, неудаленные ключи и время выполнения.
+            Результат истинен, если удаление прошло без ошибок и не было отменено.
+        """
+        full_s3_key = s3_key
+        started = time.monotonic()
+
+        try:
+            if full_s3_key.endswith('/'):
+                # Удаление папки
+                prefix_to_delete = full_s3_key
+                logger.info(f"Начало удаление папки с префиксом {full_s3_key}")
+
+                blob_refs = None
+                if self.blob_repository is not None:
+                    blob_refs = self.file_repository.count_blob_refs(user_id, prefix_to_delete)
+
+                # Индекс обновляется после каждого пакета, поэтому остановленное удаление его не рассогласует
+                result = self._delete_prefix(prefix_to_delete, progress, cancel,
+                                             on_deleted=lambda keys: self._sync_index('delete_keys', user_id, keys))
+                if not result.cancelled:
+                    self._sync_index('delete_prefix', user_id, prefix_to_delete, exclude_keys=result.failed_keys)
+                    self._invalidate_thumbnails(prefix_to_delete)
+                if blob_refs is not None and not result.cancelled:
+                    # Файлы в хранилище блобов удаляются вместе с записями индекса
+                    result.deleted += blob_refs['files']
+                    result.deleted_bytes += blob_refs['bytes']
+                    result.deleted_files += blob_refs['files']
+                    self._release_blobs(blob_refs['blobs'])
+                self._sync_usage('apply', user_id, {
+                    UsageRepository.top_folder(user_id, prefix_to_delete): (-result.deleted_bytes, -result.deleted_files),
+                })
+                self._invalidate_listing(user_id, prefix_to_delete)
+
+                if result.failed_keys:
+                    logger.error(f"Не удалось удалить {len(result.failed_keys)} объектов из папки {prefix_to_delete}")
+                if result.cancelled:
+                    logger.info(f"Удаление папки {prefix_to_delete} отменено после {result.deleted} объектов")
+                elif result.deleted:
+                    logger.info(f"Удалено {result.deleted} объектов из папки {prefix_to_delete} "
+                                f"за {result.elapsed:.2f} с")
+                elif not result.failed_keys:
+                    logger.info(f"Папка {prefix_to_delete} пуста или не существует.")
+
+                return result
+
+            else:
+                _, row = self._resolve_object(full_s3_key)
+                if row is not None:
+                    # Содержимое в хранилище блобов: удаляется только ссылка на него
+                    self._sync_index('delete_keys', user_id, [full_s3_key])
+                    self._sync_usage('apply', user_id,
+                                     {UsageRepository.top_folder(user_id, full_s3_key): (-row.occupied_size, -1)})
+                    self._release_blobs({row.blob_id: 1})
+                    self._invalidate_thumbnails(full_s3_key)
+                    self._invalidate_listing(user_id, full_s3_key)
+                    return DeleteResult(deleted=1, elapsed=time.monotonic() - started,
+                                        deleted_bytes=row.occupied_size, deleted_files=1)
+
+                try:
+                    size = self.s3_client.head_object(Bucket=self.bucket_name, Key=full_s3_key)['ContentLength']
+                except ClientError as e:
+                    if not self._is_missing(e):
+                        raise
+                    size = None
+
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=full_s3_key)
+                self._sync_index('delete_keys', user_id, [full_s3_key])
+                if size is not None:
+                    self._sync_usage('apply', user_id, {UsageRepository.top_folder(user_id, full_s3_key): (-size, -1)})
+                self._invalidate_thumbnails(full_s3_key)
+                self._invalidate_listing(user_id, full_s3_key)
+                return DeleteResult(deleted=1, elapsed=time.monotonic() - started,
+                                    deleted_bytes=size or 0, deleted_files=1 if size is not None else 0)
+
+        except ClientError as e:
+            logger.error(f"Ошибка при удалении объекта {full_s3_key} : {e}")
+            return DeleteResult(failed_keys=[full_s3_key], elapsed=time.monotonic() - started, error=str(e))
+
+    def delete_objects(self, user_id: int, s3_keys: list[str],
+                       progress: Optional[Callable[[str, int], None]] = None,
+                       cancel: Optional[threading.Event] = None) -> DeleteResult:
+        """
+        Удаляет выбранные файлы и папки одной операцией.
+
+        Файлы удаляются пакетами delete_objects по 1000 ключей, их размеры для учета занятого места
+        берутся из индекса метаданных (без индекса - запросами head_object в пуле потоков),
+        а индекс, учет и кэш листингов обновляются один раз на весь выбор. Папки удаляются
+        потоково, как в delete_object.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_keys: Полные ключи файлов и папок (папки - с завершающим '/'); повторы и ключи
+            внутри выбранных папок пропускаются
+        :param progress: Необязательная функция progress('delete', количество удаленных объектов)
+        :param cancel: Необязательное событие отмены: оставшиеся папки выбора не удаляются
+
+        :return: DeleteResult - суммарный результат по всем файлам и папкам
+        """
+        started = time.monotonic()
+        selection = self._normalize_selection(s3_keys)
+        file_keys = [key for key in selection if not key.endswith('/')]
+
+        try:
+            result = self._delete_files(user_id, file_keys) if file_keys else DeleteResult()
+        except ClientError as e:
+            logger.error(f"Ошибка при удалении выбранных файлов: {e}")
+            result = DeleteResult(failed_keys=file_keys, error=str(e))
+        if progress:
+            progress('delete', result.deleted)
+
+        for folder_key in (key for key in selection if key.endswith('/')):
+            if cancel is not None and cancel.is_set():
+                result.cancelled = True
+                break
+            folder_progress = None
+            if progress:
+                folder_progress = lambda stage, count, offset=result.deleted: progress(stage, offset + count)
+            folder_result = self.delete_object(user_id, folder_key, folder_progress, cancel)
+            result.deleted += folder_result.deleted
+            result.deleted_bytes += folder_result.deleted_bytes
+            result.deleted_files += folder_result.deleted_files
+            result.failed_keys.extend(folder_result.failed_keys)
+            result.error = result.error or folder_result.error
+            result.cancelled = folder_result.cancelled
+
+        result.elapsed = time.monotonic() - started
+        logger.info(f"Удалено {result.deleted} объектов по выбору из {len(selection)} файлов и папок "
+                    f"за {result.elapsed:.2f} с")
+        return result
+
+    def _delete_files(self, user_id: int, keys: list[str]) -> DeleteResult:
+        """
+        Удаляет файлы пакетами и один раз обновляет индекс, учет занятого места, миниатюры и кэш листингов.
+
+        :param user_id: Идентификатор пользователя Django
+        :param keys: Полные ключи файлов
+
+        :return: DeleteResult - результат удаления
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось выполнить запрос к S3
+        """
+        rows = self.file_repository.get_many(user_id, keys) if self.file_repository is not None else {}
+        # Файлы с дедупликацией есть только в индексе: удаляется ссылка на содержимое
+        blob_rows = {key: row for key, row in rows.items() if self.blob_repository is not None and row.blob_id}
+        s3_keys = [key for key in keys if key not in blob_rows]
+
+        sizes = {key: rows[key].occupied_size for key in s3_keys if key in rows}
+        for key, future in iter_bounded(self._head_size, [key for key in s3_keys if key not in rows],
+                                        self.copy_concurrency, thread_name_prefix='files-head'):
+            sizes[key] = future.result()
+
+        failed = {error.get('Key') for error in self._delete_keys(s3_keys)}
+        deleted = [key for key in keys if key not in failed]
+        self._sync_index('delete_keys', user_id, deleted)
+
+        result = DeleteResult(deleted=len(deleted), failed_keys=[key for key in keys if key in failed])
+        changes = {}
+        for key in deleted:
+            size = blob_rows[key].occupied_size if key in blob_rows else sizes.get(key)
+            if size is None:
+                continue
+            folder = UsageRepository.top_folder(user_id, key)
+            bytes_delta, files_delta = changes.get(folder, (0, 0))
+            changes[folder] = (bytes_delta - size, files_delta - 1)
+            result.deleted_bytes += size
+            result.deleted_files += 1
+        self._sync_usage('apply', user_id, changes)
+        self._release_blobs(dict(Counter(blob_rows[key].blob_id for key in deleted if key in blob_rows)))
+
+        if self.job_repository is not None:
+            try:
+                self._delete_keys([self._thumbnail_key(key) for key in deleted])
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Не удалось удалить миниатюры удаленных файлов: {e}")
+        # Кэш сбрасывается один раз на каждую затронутую папку
+        for key in {key.rpartition('/')[0]: key for key in deleted}.values():
+            self._invalidate_listing(user_id, key)
+        return result
+
+    def rename_object(self, user_id: int, s3_key: str, new_name: str,
+                      progress: Optional[Callable[[str, int], None]] = None,
+                      cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Переименовывает файл или папку.
+
+        Папка переименовывается копированием на стороне сервера: страницы листинга
+        по мере получения передаются в пул потоков копирования, и только после того,
+        как скопированы все объекты, старые ключи удаляются пакетами delete_objects.
+        Ход операции записывается в журнал в бакете, поэтому прерванное переименование
+        можно довести до конца методом resume_renames.
+
+        :param user_id: Идентификатор пользователя Django.
+        :param s3_key: Относительный путь к файлу или папке (например, 'folder/old_name.txt').
+        :param new_name: Новое имя (только имя, не путь!).
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов),
+            где этап - 'copy' или 'delete'.
+        :param cancel: Необязательное событие отмены. Отмена на этапе копирования откатывает
+            скопированное, на этапе удаления уже не действует: переименование доводится до конца.
+
+        :return: True, если переименование прошло успешно, иначе False.
+        """
+        if not new_name:
+            logger.error(f"Новое имя не может быть пустым")
+            return False
+
+        if '/' in new_name.strip('/'):
+            logger.error(f"Новое имя '{new_name}' не должно содержать путь")
+            return False
+
+        new_name = new_name.strip('/')
+        old_full_key = s3_key
+        is_folder = old_full_key.endswith('/')
+
+        try:
+            if is_folder:
+                old_prefix = old_full_key
+                parent_prefix_parts = old_prefix.rstrip('/').split('/')[:-1]
+                parent_prefix = '/'.join(parent_prefix_parts)
+                if parent_prefix:
+                    parent_prefix += '/'
+                new_prefix = f"{parent_prefix}{new_name}/"
+
+                if new_prefix == old_prefix:
+                    return True
+
+                return self._move_folder(user_id, old_prefix, new_prefix, progress, cancel)
+
+            else:
+                old_key = old_full_key
+                parent_prefix_parts = old_key.split('/')[:-1]
+                parent_prefix = '/'.join(parent_prefix_parts)
+
+                if parent_prefix:
+                    parent_prefix += '/'
+
+                new_key = f"{parent_prefix}{new_name}"
+                if new_key == old_key:
+                    return True
+
+                _, row = self._resolve_object(old_key)
+                if row is not None:
+                    self._rename_blob_file(user_id, old_key, new_key)
+                    self._move_thumbnail(user_id, old_key, new_key)
+                    return True
+
+                # Существующий файл с новым именем перезаписывается: его место освобождается в учете
+                overwritten = self._overwritten_files(user_id, [new_key])
+                size = self.s3_client.head_object(Bucket=self.bucket_name, Key=old_key)['ContentLength']
+                self._copy_object(old_key, new_key, size)
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=old_key)
+                self._sync_index('move_key', user_id, old_key, new_key)
+                self._release_overwritten(user_id, overwritten)
+                self._move_thumbnail(user_id, old_key, new_key)
+                self._invalidate_listing(user_id, old_key)
+
+                logger.info(f"Файл {old_key} переименован в {new_key}")
+
+            return True
+
+        except ClientError as e:
+            logger.error(f"Ошибка при переименовании объекта '{old_full_key}': {e}")
+            return False
+
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при переименовании объекта '{old_full_key}': {e}")
+            return False
+
+    def move_object(self, user_id: int, s3_key: str, new_key: str,
+                    progress: Optional[Callable[[str, int], None]] = None,
+                    cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Перемещает файл или папку под новый полный ключ, в том числе в другую папку.
+
+        Данные копируются на стороне сервера (CopyObject, для объектов больше 5 ГБ - параллельный
+        multipart UploadPartCopy) и не проходят через Django. Папка переносится через журнал,
+        как при переименовании; существующий файл с новым ключом перезаписывается.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ файла или папки (папки - с завершающим '/')
+        :param new_key: Новый полный ключ (для папки - с завершающим '/')
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов)
+        :param cancel: Необязательное событие отмены этапа копирования
+
+        :return: True, если перемещение прошло успешно, иначе False
+        """
+        result = self._move_targets(user_id, {s3_key: new_key}, progress, cancel)
+        for key, error in result.errors.items():
+            logger.error(f"Не удалось переместить {key} в {new_key}: {error}")
+        return bool(result)
+
+    def move_objects(self, user_id: int, s3_keys: list[str], destination: str,
+                     progress: Optional[Callable[[str, int], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> MoveResult:
+        """
+        Перемещает выбранные файлы и папки в другую папку пользователя.
+
+        Файлы копируются на стороне сервера в пуле из FILES_COPY_MAX_CONCURRENCY потоков,
+        исходные ключи удаляются пакетами delete_objects, а учет занятого места и кэш листингов
+        обновляются один раз на весь выбор. Папки переносятся через журнал, как при переименовании.
+        Существующие файлы с теми же именами в папке назначения перезаписываются.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_keys: Полные ключи файлов и папок (папки - с завершающим '/')
+        :param destination: Полный ключ папки назначения с завершающим '/'
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов),
+            где этап - 'copy' или 'delete'
+        :param cancel: Необязательное событие отмены: еще не начатые файлы и папки остаются на месте
+
+        :return: MoveResult - перемещенные ключи и ошибки по остальным
+        """
+        selection = self._normalize_selection(s3_keys)
+        if not destination.endswith('/'):
+            return MoveResult(errors={key: "Недопустимая папка назначения" for key in selection})
+
+        moves = {}
+        for key in selection:
+            name = key.rstrip('/').rpartition('/')[2]
+            moves[key] = f"{destination}{name}/" if key.endswith('/') else f"{destination}{name}"
+        result = self._move_targets(user_id, moves, progress, cancel)
+        logger.info(f"Перемещено {len(result.moved)} из {len(selection)} файлов и папок в {destination} "
+                    f"за {result.elapsed:.2f} с")
+        return result
+
+    def _move_targets(self, user_id: int, moves: dict[str, str],
+                      progress: Optional[Callable[[str, int], None]] = None,
+                      cancel: Optional[threading.Event] = None) -> MoveResult:
+        """
+        Перемещает файлы и папки по словарю {полный ключ: новый полный ключ}.
+
+        Повторный вызов после сбоя безопасен: файлы и папки, которых уже нет по исходному ключу,
+        но которые есть по новому, засчитываются как перемещенные.
+
+        :return: MoveResult - перемещенные ключи и ошибки по остальным
+        """
+        started = time.monotonic()
+        result = MoveResult()
+        user_prefix = f"user-{user_id}-files/"
+
+        files, folders = {}, {}
+        for key, target in moves.items():
+            if not target.startswith(user_prefix) or target == user_prefix or key.endswith('/') != target.endswith('/'):
+                result.errors[key] = "Недопустимый путь назначения"
+            elif target == key:
+                result.moved.append(key)
+            elif key.endswith('/') and target.startswith(key):
+                result.errors[key] = "Папку нельзя переместить в саму себя"
+            elif key.endswith('/'):
+                folders[key] = target
+            else:
+                files[key] = target
+
+        if files:
+            try:
+                self._move_files(user_id, files, result, progress, cancel)
+            except ClientError as e:
+                logger.error(f"Ошибка при перемещении файлов: {e}")
+                for key in files:
+                    if key not in result.moved:
+                        result.errors.setdefault(key, str(e))
+
+        for old_prefix, new_prefix in folders.items():
+            if cancel is not None and cancel.is_set():
+                result.cancelled = True
+                break
+            try:
+                if self._prefix_exists(new_prefix):
+                    # Повтор после сбоя: папка уже перемещена
+                    if not self._prefix_exists(old_prefix):
+                        result.moved.append(old_prefix)
+                    else:
+                        result.errors[old_prefix] = "Папка с таким именем уже существует"
+                    continue
+                if self._move_folder(user_id, old_prefix, new_prefix, progress, cancel):
+                    result.moved.append(old_prefix)
+                elif cancel is not None and cancel.is_set():
+                    result.cancelled = True
+                else:
+                    result.errors[old_prefix] = "Не удалось переместить папку"
+            except ClientError as e:
+                logger.error(f"Ошибка при перемещении папки {old_prefix} в {new_prefix}: {e}")
+                result.errors[old_prefix] = str(e)
+
+        result.elapsed = time.monotonic() - started
+        return result
+
+    def _move_files(self, user_id: int, files: dict[str, str], result: MoveResult,
+                    progress: Optional[Callable[[str, int], None]] = None,
+                    cancel: Optional[threading.Event] = None) -> None:
+        """
+        Перемещает файлы копированием на стороне сервера и пакетным удалением исходных ключей.
+
+        Если исходный ключ не удалось удалить, копия удаляется, чтобы файл не оказался в двух местах.
+        Перезаписанные файлы в месте назначения снимаются с учета занятого места.
+
+        :param user_id: Идентификатор пользователя Django
+        :param files: Словарь {полный ключ файла: новый полный ключ}
+        :param result: Результат, в который добавляются перемещенные ключи и ошибки
+        :param progress: Необязательная функция progress('copy', количество перемещенных файлов)
+        :param cancel: Необязательное событие отмены: новые файлы перестают передаваться в пул
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось выполнить запрос к S3
+        """
+        rows = self.file_repository.get_many(user_id, list(files)) if self.file_repository is not None else {}
+        sizes = {}
+
+        for key, row in rows.items():
+            if self.blob_repository is not None and row.blob_id:
+                # Содержимое в хранилище блобов не копируется: меняется только запись индекса
+                self._rename_blob_file(user_id, key, files[key])
+                self._move_thumbnail(user_id, key, files[key])
+                sizes[key] = row.occupied_size
+                result.moved.append(key)
+
+        # Существующие файлы в месте назначения перезаписываются: их место освобождается в учете
+        overwritten = self._overwritten_files(user_id, [files[key] for key in files if key not in sizes])
+
+        def iter_keys() -> Iterator[str]:
+            for key in files:
+                if key in sizes:
+                    continue
+                if cancel is not None and cancel.is_set():
+                    result.cancelled = True
+                    return
+                yield key
+
+        def copy_one(key: str) -> Optional[int]:
+            size = rows[key].occupied_size if key in rows else self._head_size(key)
+            if size is None:
+                return None
+            try:
+                self._copy_object(key, files[key], size)
+            except ClientError as e:
+                if not self._is_missing(e):
+                    raise
+                return None
+            return size
+
+        copied = []
+        for key, future in iter_bounded(copy_one, iter_keys(), self.copy_concurrency,
+                                        thread_name_prefix='files-copy'):
+            try:
+                size = future.result()
+            except ClientError as e:
+                logger.error(f"Не удалось скопировать {key} в {files[key]}: {e}")
+                result.errors[key] = str(e)
+                continue
+            if size is not None:
+                sizes[key] = size
+                copied.append(key)
+            elif self._head_size(files[key]) is not None:
+                # Повтор после сбоя: файл уже перемещен
+                result.moved.append(key)
+            else:
+                result.errors[key] = "Файл не найден"
+            if progress:
+                progress('copy', len(copied) + len(result.moved))
+
+        failed = {error.get('Key') for error in self._delete_keys(copied)}
+        if failed:
+            self._delete_keys([files[key] for key in failed])
+            result.errors.update((key, "Не удалось удалить исходный файл") for key in failed)
+
+        for key in copied:
+            if key in failed:
+                continue
+            self._sync_index('move_key', user_id, key, files[key])
+            self._move_thumbnail(user_id, key, files[key])
+            result.moved.append(key)
+        self._release_overwritten(user_id, {files[key]: overwritten[files[key]] for key in copied
+                                            if key not in failed and files[key] in overwritten})
+
+        # Объем переходит между папками верхнего уровня одним изменением учета
+        changes = {}
+        for key in files:
+            if key not in sizes or key in failed:
+                continue
+            for folder, sign in ((UsageRepository.top_folder(user_id, key), -1),
+                                 (UsageRepository.top_folder(user_id, files[key]), 1)):
+                bytes_delta, files_delta = changes.get(folder, (0, 0))
+                changes[folder] = (bytes_delta + sign * sizes[key], files_delta + sign)
+        self._sync_usage('apply', user_id, changes)
+
+        # Кэш сбрасывается один раз на исходные папки и папку назначения
+        for key in {key.rpartition('/')[0]: key for key in (*files, *files.values())}.values():
+            self._invalidate_listing(user_id, key)
+
+    def _move_folder(self, user_id: int, old_prefix: str, new_prefix: str,
+                     progress: Optional[Callable[[str, int], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Переносит папку под новый префикс через журнал переименования.
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_prefix: Полный ключ папки с завершающим '/'
+        :param new_prefix: Новый полный ключ папки с завершающим '/'
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов)
+        :param cancel: Необязательное событие отмены этапа копирования
+
+        :return: True, если перенос завершен, иначе False
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось проверить новый префикс или записать журнал
+        """
+        if self._prefix_exists(new_prefix):
+            logger.error(f"Невозможно перенести папку {old_prefix}: {new_prefix} уже существует")
+            return False
+
+        journal = {
+            'id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'old_prefix': old_prefix,
+            'new_prefix': new_prefix,
+            'state': 'copy',
+        }
+        self._write_journal(journal)
+        return self._run_folder_rename(journal, progress, cancel=cancel)
+
+    def copy_object(self, user_id: int, s3_key: str, new_key: str,
+                    progress: Optional[Callable[[str, int], None]] = None,
+                    cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Копирует файл или папку под новый полный ключ на стороне сервера.
+
+        Объекты копируются CopyObject (больше 5 ГБ - параллельным multipart UploadPartCopy),
+        объекты папки - в пуле из FILES_COPY_MAX_CONCURRENCY потоков; данные не проходят через Django.
+        Файлы с дедупликацией не копируются в S3: копия получает новую ссылку на то же содержимое.
+        Копия учитывается в занятом месте и индексе метаданных. Если копирование папки
+        не удалось или отменено, уже скопированные объекты удаляются.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ файла или папки (папки - с завершающим '/')
+        :param new_key: Полный ключ копии (для папки - с завершающим '/'); существующий ключ не перезаписывается
+        :param progress: Необязательная функция progress('copy', количество скопированных объектов)
+        :param cancel: Необязательное событие отмены копирования папки
+
+        :return: True, если копирование прошло успешно, иначе False
+
+        :raises
+            QuotaExceededError: Если копия не помещается в квоту пользователя
+        """
+        user_prefix = f"user-{user_id}-files/"
+        if (not new_key.startswith(user_prefix) or new_key == user_prefix
+                or s3_key.endswith('/') != new_key.endswith('/') or new_key == s3_key):
+            logger.error(f"Недопустимый ключ копии {new_key} для {s3_key}")
+            return False
+
+        try:
+            if s3_key.endswith('/'):
+                return self._copy_folder(user_id, s3_key, new_key, progress, cancel)
+            return self._copy_file(user_id, s3_key, new_key)
+
+        except ClientError as e:
+            logger.error(f"Ошибка при копировании объекта '{s3_key}' в '{new_key}': {e}")
+            return False
+
+    def _copy_file(self, user_id: int, s3_key: str, new_key: str) -> bool:
+        """
+        Копирует файл и регистрирует копию как загруженный файл.
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось выполнить запрос к S3
+            QuotaExceededError: Если копия не помещается в квоту пользователя
+        """
+        _, target_row = self._resolve_object(new_key)
+        if target_row is not None or self._head_size(new_key) is not None:
+            logger.error(f"Невозможно скопировать файл {s3_key}: {new_key} уже существует")
+            return False
+
+        _, row = self._resolve_object(s3_key)
+        if row is not None:
+            uploaded = {'size': row.size, 'etag': row.etag, 'content_type': row.content_type, 'blob_id': row.blob_id}
+        else:
+            try:
+                head = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            except ClientError as e:
+                if not self._is_missing(e):
+                    raise
+                logger.error(f"Невозможно скопировать файл {s3_key}: файл не найден")
+                return False
+            uploaded = {'size': head['ContentLength'], 'etag': head.get('ETag'), 'content_type': head.get('ContentType'),
+                        'codec': compression.object_codec(head), 'original_size': compression.original_size(head)}
+
+        free_space = self.get_free_space(user_id)
+        if free_space is not None and uploaded['size'] > free_space:
+            raise QuotaExceededError(f"Копия {s3_key} ({uploaded['size']} байт) не помещается в квоту")
+
+        if row is not None:
+            # Содержимое в хранилище блобов: добавляется только ссылка, и она сохраняется вместе
+            # с записью индекса, иначе ссылка без записи не дала бы удалить содержимое
+            try:
+                with transaction.atomic():
+                    self.blob_repository.add_refs({row.blob_id: 1})
+                    self.file_repository.upsert_objects(user_id, [{'key': new_key, **uploaded}])
+            except DatabaseError as e:
+                logger.error(f"Невозможно скопировать файл {s3_key}: ссылка на содержимое не сохранена: {e}")
+                return False
+            self._sync_usage('apply', user_id, {UsageRepository.top_folder(user_id, new_key): (uploaded['size'], 1)})
+            self.request_thumbnail(user_id, new_key, uploaded['content_type'])
+        else:
+            self._copy_object(s3_key, new_key, uploaded['size'])
+            self._register_upload(user_id, new_key, uploaded)
+        self._invalidate_listing(user_id, new_key)
+
+        logger.info(f"Файл {s3_key} скопирован в {new_key}")
+        return True
+
+    def _copy_folder(self, user_id: int, old_prefix: str, new_prefix: str,
+                     progress: Optional[Callable[[str, int], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Копирует папку со всем содержимым и ее записи индекса, учет и миниатюры.
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось выполнить запрос к S3
+            QuotaExceededError: Если копия не помещается в квоту пользователя
+        """
+        if new_prefix.startswith(old_prefix):
+            logger.error(f"Невозможно скопировать папку {old_prefix} в саму себя")
+            return False
+        if self._prefix_exists(new_prefix):
+            logger.error(f"Невозможно скопировать папку {old_prefix}: {new_prefix} уже существует")
+            return False
+        if not self._prefix_exists(old_prefix):
+            logger.error(f"Невозможно скопировать папку {old_prefix}: папка не найдена")
+            return False
+
+        free_space = self.get_free_space(user_id)
+        if free_space is not None:
+            size = self._prefix_size(user_id, old_prefix)
+            if size > free_space:
+                raise QuotaExceededError(f"Копия папки {old_prefix} ({size} байт) не помещается в квоту")
+
+        started = time.monotonic()
+        try:
+            copied, copied_bytes, copied_files = self._copy_prefix(old_prefix, new_prefix, progress, cancel)
+        except Exception as e:
+            logger.error(f"Ошибка копирования папки {old_prefix} в {new_prefix}: {e}")
+            self._delete_prefix(new_prefix)
+            return False
+        if cancel is not None and cancel.is_set():
+            self._delete_prefix(new_prefix)
+            logger.info(f"Копирование {old_prefix} в {new_prefix} отменено, скопированные объекты удалены")
+            return False
+
+        if self.file_repository is not None:
+            try:
+                with transaction.atomic():
+                    if self.blob_repository is not None:
+                        # Записи и ссылки на содержимое создаются вместе, иначе счетчик ссылок разойдется с индексом
+                        blob_refs = self.file_repository.count_blob_refs(user_id, old_prefix)
+                        self.blob_repository.add_refs(blob_refs['blobs'])
+                        copied_bytes += blob_refs['bytes']
+                        copied_files += blob_refs['files']
+                    self.file_repository.copy_prefix(user_id, old_prefix, new_prefix)
+            except DatabaseError as e:
+                logger.error(f"Ошибка обновления индекса метаданных при копировании {old_prefix}: {e}")
+                if self.blob_repository is not None:
+                    # Без записей индекса файлы с дедупликацией не скопированы
+                    self._delete_prefix(new_prefix)
+                    return False
+
+        self._sync_usage('apply', user_id, {UsageRepository.top_folder(user_id, new_prefix): (copied_bytes, copied_files)})
+        if self.job_repository is not None:
+            try:
+                self._copy_prefix(f"{DERIVATIVE_PREFIX}{old_prefix}", f"{DERIVATIVE_PREFIX}{new_prefix}")
+            except (ClientError, BotoCoreError) as e:
+                # Недостающие миниатюры строятся заново при первом запросе
+                logger.error(f"Не удалось скопировать миниатюры папки {old_prefix}: {e}")
+        self._invalidate_listing(user_id, new_prefix)
+
+        logger.info(f"Папка {old_prefix} скопирована в {new_prefix}: {copied} объектов "
+                    f"за {time.monotonic() - started:.2f} с")
+        return True
+
+    def _prefix_size(self, user_id: int, prefix: str) -> int:
+        """
+        :return: Объем файлов папки в байтах: по индексу метаданных, без него - по листингу S3
+        """
+        if self.file_repository is not None:
+            return self.file_repository.prefix_totals(user_id, prefix)['bytes']
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        return sum(obj.get('Size', 0) for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+                   for obj in page.get('Contents', []))
+
+    def _rename_blob_file(self, user_id: int, old_key: str, new_key: str) -> None:
+        """
+        Переименовывает файл из хранилища блобов: меняется только запись индекса, содержимое не копируется.
+
+        :param user_id: Идентификатор пользователя Django
+        :param old_key: Прежний полный ключ
+        :param new_key: Новый полный ключ
+        """
+        replaced = self.file_repository.get_by_key(user_id, new_key)
+        self._sync_index('move_key', user_id, old_key, new_key)
+        if replaced is not None and not replaced.is_folder:
+            # Как и при копировании в S3, существующий файл с новым именем перезаписывается
+            if replaced.blob_id is None:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=new_key)
+            self._release_overwritten(user_id, {new_key: (replaced.occupied_size, replaced.blob_id)})
+        self._invalidate_listing(user_id, old_key)
+        logger.info(f"Файл {old_key} переименован в {new_key} без копирования содержимого")
+
+    def _overwritten_files(self, user_id: int, keys: list[str]) -> dict[str, Tuple[int, Optional[int]]]:
+        """
+        Находит существующие файлы, которые перезапишет перенос других файлов на ключи keys.
+
+        Размеры берутся из индекса метаданных, для ключей вне индекса - запросами head_object в пуле потоков.
+
+        :return: dict - {полный ключ: (занятое место в байтах, идентификатор Blob или None)}
+        """
+        rows = self.file_repository.get_many(user_id, keys) if self.file_repository is not None else {}
+        found = {key: (row.occupied_size, row.blob_id if self.blob_repository is not None else None)
+                 for key, row in rows.items() if not row.is_folder}
+        for key, future in iter_bounded(self._head_size, [key for key in keys if key not in rows],
+                                        self.copy_concurrency, thread_name_prefix='files-head'):
+            size = future.result()
+            if size is not None:
+                found[key] = (size, None)
+        return found
+
+    def _release_overwritten(self, user_id: int, overwritten: dict[str, Tuple[int, Optional[int]]]) -> None:
+        """
+        Снимает перезаписанные файлы с учета занятого места и освобождает их содержимое в хранилище блобов.
+
+        :param user_id: Идентификатор пользователя Django
+        :param overwritten: Результат _overwritten_files для уже перезаписанных ключей
+        """
+        changes = {}
+        for key, (size, _) in overwritten.items():
+            folder = UsageRepository.top_folder(user_id, key)
+            bytes_delta, files_delta = changes.get(folder, (0, 0))
+            changes[folder] = (bytes_delta - size, files_delta - 1)
+        if changes:
+            self._sync_usage('apply', user_id, changes)
+        self._release_blobs(dict(Counter(blob_id for _, blob_id in overwritten.values() if blob_id is not None)))
+
+    def resume_renames(self, updated_before: datetime) -> int:
+        """
+        Завершает переименования папок, прерванные падением процесса.
+
+        Для каждого журнала в бакете повторяет этап, на котором операция остановилась:
+        копирование идемпотентно, а удаление старых ключей начинается только после
+        полного копирования. Журналы, обновленные после updated_before, пропускаются:
+        выполняющее переименование обновляет журнал каждые RENAME_HEARTBEAT_INTERVAL секунд,
+        и такая операция, скорее всего, еще идет в другом процессе.
+
+        :param updated_before: Граница давности последнего обновления журнала
+
+        :return: Количество успешно завершенных переименований
+        """
+        completed = 0
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=RENAME_JOURNAL_PREFIX):
+            for obj in page.get('Contents', []):
+                body = self.s3_client.get_object(Bucket=self.bucket_name, Key=obj['Key'])['Body'].read()
+                journal = json.loads(body)
+                # В журналах, записанных до появления отметки, давность определяется по времени объекта
+                updated_at = datetime.fromisoformat(journal['updated_at']) if 'updated_at' in journal \
+                    else obj['LastModified']
+                if updated_at >= updated_before:
+                    logger.info(f"Переименование {journal['old_prefix']} -> {journal['new_prefix']} пропущено: "
+                                f"журнал обновлен {updated_at.isoformat()}, операция может еще выполняться")
+                    continue
+                # Перезапись журнала отмечает, что операцию подхватил этот процесс
+                self._write_journal(journal)
+                logger.info(f"Возобновление переименования {journal['old_prefix']} -> {journal['new_prefix']} "
+                            f"с этапа {journal['state']}")
+                if self._run_folder_rename(journal, resume=True):
+                    completed += 1
+        return completed
+
+    def _run_folder_rename(self, journal: dict, progress: Optional[Callable[[str, int], None]] = None,
+                           resume: bool = False, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Выполняет переименование папки по записи журнала.
+
+        :param journal: Запись журнала с ключами 'id', 'old_prefix', 'new_prefix', 'state'
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов)
+        :param resume: True, если операция возобновляется после сбоя
+        :param cancel: Необязательное событие отмены этапа копирования
+
+        :return: True, если переименование завершено, иначе False
+        """
+        try:
+            return self._run_folder_rename_stages(journal, progress, resume, cancel)
+        finally:
+            self._invalidate_listing(journal['user_id'], journal['old_prefix'])
+            self._invalidate_listing(journal['user_id'], journal['new_prefix'])
+
+    def _run_folder_rename_stages(self, journal: dict, progress: Optional[Callable[[str, int], None]],
+                                  resume: bool, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Выполняет этапы копирования и удаления для переименования папки.
+
+        :param journal: Запись журнала
+        :param progress: Необязательная функция progress(этап, количество обработанных объектов)
+        :param resume: True, если операция возобновляется после сбоя
+        :param cancel: Необязательное событие отмены этапа копирования
+
+        :return: True, если переименование завершено, иначе False
+        """
+        old_prefix = journal['old_prefix']
+        new_prefix = journal['new_prefix']
+        started = heartbeat_at = time.monotonic()
+
+        def heartbeat(stage: str, count: int) -> None:
+            nonlocal heartbeat_at
+            if time.monotonic() - heartbeat_at >= RENAME_HEARTBEAT_INTERVAL:
+                self._write_journal(journal)
+                heartbeat_at = time.monotonic()
+            if progress:
+                progress(stage, count)
+
+        if journal['state'] == 'copy':
+            try:
+                copied, copied_bytes, copied_files = self._copy_prefix(old_prefix, new_prefix, heartbeat, cancel)
+            except Exception as e:
+                logger.error(f"Ошибка копирования папки {old_prefix} в {new_prefix}: {e}")
+                if not resume:
+                    # Откатываем частично скопированную папку, чтобы она не оказалась в двух местах
+                    self._delete_prefix(new_prefix)
+                    self._delete_journal(journal)
+                return False
+
+            if cancel is not None and cancel.is_set():
+                self._delete_prefix(new_prefix)
+                self._delete_journal(journal)
+                logger.info(f"Переименование {old_prefix} в {new_prefix} отменено, скопированные объекты удалены")
+                return False
+
+            logger.info(f"Скопировано {copied} объектов из {old_prefix} в {new_prefix}")
+            if self.blob_repository is not None:
+                # Файлы с дедупликацией не копируются, но их объем тоже переходит к новой папке
+                blob_refs = self.file_repository.count_blob_refs(journal['user_id'], old_prefix)
+                copied_bytes += blob_refs['bytes']
+                copied_files += blob_refs['files']
+            journal['usage'] = [copied_bytes, copied_files]
+            journal['state'] = 'delete'
+            self._write_journal(journal)
+
+        # Повторный перенос после сбоя безопасен: под старым префиксом записей уже не останется
+        self._sync_index('move_prefix', journal['user_id'], old_prefix, new_prefix)
+        user_prefix = f"user-{journal['user_id']}-files/"
+        old_top = UsageRepository.top_folder(journal['user_id'], old_prefix)
+        new_top = UsageRepository.top_folder(journal['user_id'], new_prefix)
+        if old_prefix.count('/') == user_prefix.count('/') + 1:
+            # Переименована или перемещена папка верхнего уровня: ее объем переходит к новой папке
+            self._sync_usage('move_folder', journal['user_id'], old_top, new_top)
+        elif old_top != new_top and 'usage' in journal and not journal.get('usage_applied'):
+            # Вложенная папка перемещена в другую папку верхнего уровня; отметка в журнале
+            # не дает применить перенос объема повторно при возобновлении
+            moved_bytes, moved_files = journal['usage']
+            self._sync_usage('apply', journal['user_id'], {
+                old_top: (-moved_bytes, -moved_files),
+                new_top: (moved_bytes, moved_files),
+            })
+            journal['usage_applied'] = True
+            self._write_journal(journal)
+
+        result = self._delete_prefix(old_prefix, heartbeat)
+        if result.failed_keys:
+            # Журнал остается на этапе удаления, resume_renames повторит удаление оставшихся ключей
+            logger.error(f"Папка {old_prefix} скопирована в {new_prefix}, но {len(result.failed_keys)} "
+                         f"старых объектов не удалено")
+            return False
+
+        self._delete_journal(journal)
+        # Миниатюры файлов под новым именем строятся заново при первом запросе
+        self._invalidate_thumbnails(old_prefix)
+
+        logger.info(f"Папка {old_prefix} переименована в {new_prefix}, обработано {result.deleted} объектов "
+                    f"за {time.monotonic() - started:.2f} с")
+        return True
+
+    def _copy_prefix(self, old_prefix: str, new_prefix: str,
+                     progress: Optional[Callable[[str, int], None]] = None,
+                     cancel: Optional[threading.Event] = None) -> Tuple[int, int, int]:
+        """
+        Копирует все объекты с префиксом old_prefix под префикс new_prefix.
+
+        Страницы листинга читаются лениво и передаются в пул из FILES_COPY_MAX_CONCURRENCY потоков.
+
+        :param old_prefix: Исходный префикс
+        :param new_prefix: Целевой префикс
+        :param progress: Необязательная функция progress('copy', количество скопированных объектов)
+        :param cancel: Необязательное событие отмены: новые объекты перестают передаваться в пул
+
+        :return: tuple - (количество скопированных объектов, байт, файлов без маркеров папок)
+
+        :raises
+            botocore.exceptions.ClientError: Если объект не удалось скопировать
+        """
+        def iter_objects() -> Iterator[dict]:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=old_prefix):
+                for obj in page.get('Contents', []):
+                    if cancel is not None and cancel.is_set():
+                        return
+                    yield obj
+
+        def copy_one(obj: dict) -> None:
+            new_object_key = f"{new_prefix}{obj['Key'][len(old_prefix):]}"
+            self._copy_object(obj['Key'], new_object_key, obj.get('Size', 0))
+
+        copied = copied_bytes = copied_files = 0
+        for obj, future in iter_bounded(copy_one, iter_objects(), self.copy_concurrency,
+                                        thread_name_prefix='files-copy'):
+            future.result()
+            copied += 1
+            if not obj['Key'].endswith('/'):
+                copied_bytes += obj.get('Size', 0)
+                copied_files += 1
+            if progress:
+                progress('copy', copied)
+            if copied % 1000 == 0:
+                logger.info(f"Копирование {old_prefix} -> {new_prefix}: {copied} объектов")
+        return copied, copied_bytes, copied_files
+
+    def _delete_prefix(self, prefix: str, progress: Optional[Callable[[str, int], None]] = None,
+                       cancel: Optional[threading.Event] = None,
+                       on_deleted: Optional[Callable[[list[str]], None]] = None) -> DeleteResult:
+        """
+        Удаляет все объекты с префиксом пакетами delete_objects по мере получения страниц листинга.
+
+        Одновременно выполняется не более FILES_DELETE_MAX_CONCURRENCY пакетов, поэтому
+        в памяти находится лишь несколько страниц листинга независимо от размера папки.
+
+        :param prefix: Удаляемый префикс
+        :param progress: Необязательная функция progress('delete', количество удаленных объектов)
+        :param cancel: Необязательное событие отмены: новые пакеты перестают отправляться,
+            а уже отправленные дожидаются и учитываются в результате
+        :param on_deleted: Необязательная функция, получающая ключи, удаленные очередным пакетом
+
+        :return: DeleteResult - результат удаления
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось получить листинг или выполнить запрос удаления
+        """
+        started = time.monotonic()
+        result = DeleteResult()
+
+        def iter_batches() -> Iterator[list[dict]]:
+            batch = []
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    if cancel is not None and cancel.is_set():
+                        result.cancelled = True
+                        return
+                    batch.append(obj)
+                    if len(batch) == DELETE_BATCH_SIZE:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+
+        def delete_batch(batch: list[dict]) -> list[dict]:
+            return self._delete_batch([obj['Key'] for obj in batch])
+
+        for batch, future in iter_bounded(delete_batch, iter_batches(), self.delete_concurrency,
+                                          thread_name_prefix='files-delete'):
+            errors = future.result()
+            for error in errors:
+                logger.error(f"Объект {error.get('Key')} не удален: {error.get('Code')} {error.get('Message')}")
+            failed = {error.get('Key') for error in errors}
+            result.failed_keys.extend(failed)
+            result.deleted += len(batch) - len(errors)
+            for obj in batch:
+                if obj['Key'] not in failed and not obj['Key'].endswith('/'):
+                    result.deleted_bytes += obj.get('Size', 0)
+                    result.deleted_files += 1
+            if on_deleted:
+                on_deleted([obj['Key'] for obj in batch if obj['Key'] not in failed])
+            if progress:
+                progress('delete', result.deleted)
+
+        result.elapsed = time.monotonic() - started
+        return result
+
+    def _delete_batch(self, keys: list[str]) -> list[dict]:
+        """
+        Удаляет до 1000 ключей одним запросом delete_objects.
+
+        :return: list[dict] - Ошибки по отдельным ключам из ответа S3
+        """
+        response = self.s3_client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+        return response.get('Errors', [])
+
+    def _delete_keys(self, keys: list[str]) -> list[dict]:
+        """
+        Удаляет список ключей пакетами delete_objects, до FILES_DELETE_MAX_CONCURRENCY пакетов параллельно.
+
+        :param keys: Полные ключи объектов
+
+        :return: list[dict] - Ошибки по отдельным ключам из ответов S3
+
+        :raises
+            botocore.exceptions.ClientError: Если не удалось выполнить запрос удаления
+        """
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        errors = []
+        for _, future in iter_bounded(self._delete_batch, batches, self.delete_concurrency,
+                                      thread_name_prefix='files-delete'):
+            for error in future.result():
+                logger.error(f"Объект {error.get('Key')} не удален: {error.get('Code')} {error.get('Message')}")
+                errors.append(error)
+        return errors
+
+    def _head_size(self, s3_key: str) -> Optional[int]:
+        """
+        :return: Размер объекта в байтах или None, если объекта нет
+        """
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)['ContentLength']
+        except ClientError as e:
+            if not self._is_missing(e):
+                raise
+            return None
+
+    def _copy_object(self, source_key: str, dest_key: str, size: int) -> None:
+        """
+        Копирует объект внутри бакета на стороне сервера.
+
+        Объекты больше 5 ГБ копируются через multipart upload_part_copy, части копируются параллельно.
+
+        :param source_key: Ключ исходного объекта
+        :param dest_key: Ключ нового объекта
+        :param size: Размер исходного объекта в байтах
+
+        :raises
+            botocore.exceptions.ClientError: Если копирование не удалось
+        """
+        copy_source = {"Bucket": self.bucket_name, "Key": source_key}
+
+        if size <= MAX_COPY_OBJECT_SIZE:
+            self.s3_client.copy_object(Bucket=self.bucket_name, CopySource=copy_source, Key=dest_key)
+            return
+
+        head = self.s3_client.head_object(Bucket=self.bucket_name, Key=source_key)
+        # Content-Encoding сжатого объекта не входит в Metadata и переносится отдельно
+        encoding = {'ContentEncoding': head['ContentEncoding']} if head.get('ContentEncoding') else {}
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=dest_key,
+            ContentType=head.get('ContentType', 'application/octet-stream'),
+            Metadata=head.get('Metadata', {}),
+            **encoding,
+        )['UploadId']
+
+        part_size = max(COPY_PART_SIZE, math.ceil(size / MAX_PARTS_COUNT))
+        ranges = [(number, start, min(start + part_size, size) - 1)
+                  for number, start in enumerate(range(0, size, part_size), start=1)]
+
+        def copy_part(part_range: Tuple[int, int, int]) -> dict:
+            part_number, first_byte, last_byte = part_range
+            response = self.s3_client.upload_part_copy(
+                Bucket=self.bucket_name,
+                Key=dest_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                CopySource=copy_source,
+                CopySourceRange=f"bytes={first_byte}-{last_byte}",
+            )
+            return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+        try:
+            parts = [future.result() for _, future in iter_bounded(
+                copy_part, ranges, self.multipart_concurrency, thread_name_prefix='files-copy-part')]
+            parts.sort(key=lambda p: p['PartNumber'])
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=dest_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+            logger.debug(f"Объект {source_key} скопирован в {dest_key} по частям: {len(parts)} частей")
+
+        except Exception:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=dest_key, UploadId=upload_id)
+            raise
+
+    def folder_exists(self, folder_key: str) -> bool:
+        """
+        Проверяет, существует ли папка (маркер папки или хотя бы один вложенный объект).
+
+        :param folder_key: Полный ключ папки с завершающим '/'
+
+        :return: True, если папка существует
+        """
+        return self._prefix_exists(folder_key)
+
+    def _prefix_exists(self, prefix: str) -> bool:
+        """
+        Проверяет, есть ли в бакете объекты с указанным префиксом.
+
+        :param prefix: Проверяемый префикс
+
+        :return: True, если найден хотя бы один объект
+        """
+        user_id = self._key_user_id(prefix)
+        if self.blob_repository is not None and user_id is not None:
+            # Папки, содержащие только файлы с дедупликацией, есть лишь в индексе
+            if self.file_repository.prefix_exists(user_id, prefix):
+                return True
+
+        response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix, MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def _write_journal(self, journal: dict) -> None:
+        """
+        Сохраняет запись журнала переименования в бакет, обновляя в ней отметку времени 'updated_at'.
+
+        :param journal: Запись журнала
+        """
+        journal['updated_at'] = timezone.now().isoformat()
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=f"{RENAME_JOURNAL_PREFIX}{journal['id']}.json",
+            Body=json.dumps(journal).encode(),
+            ContentType='application/json',
+        )
+
+    def _delete_journal(self, journal: dict) -> None:
+        """
+        Удаляет запись журнала переименования после завершения операции.
+
+        :param journal: Запись журнала
+        """
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=f"{RENAME_JOURNAL_PREFIX}{journal['id']}.json")
 
     def create_folder(self, user_id: int, folder_s3_key: str) -> bool:
         """
@@ -273,7 +3100,9 @@ class FileStorageService:
             s3_key += '/'
 
         try:
-            self.s3_client.put_object(Bucket=self.bucket_name, Key=folder_s3_key, Body=b'')
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=b'')
+            self._sync_index('ensure_folders', user_id, {s3_key})
+            self._invalidate_listing(user_id, s3_key)
             logger.info(f"Папка {s3_key} создана")
             return True
 
@@ -0,0 +1,141 @@
+import re
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
+
+# Больше диапазонов в одном запросе не обслуживается: запрос отдается целиком
+MAX_RANGES = 16
+
+_RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Ни один из запрошенных диапазонов не пересекается с объектом"""
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[list[tuple[int, int]]]:
+    """
+    Разбирает заголовок Range (RFC 9110) для объекта заданного размера.
+
+    Пересекающиеся и соседние диапазоны объединяются. Некорректный заголовок,
+    единицы, отличные от bytes, или слишком много диапазонов игнорируются,
+    как разрешает стандарт, - тогда объект отдается целиком.
+
+    :param header: Значение заголовка Range или None
+    :param size: Размер объекта в байтах
+
+    :return: list[tuple] - Отсортированные диапазоны (start, end) включительно
+        или None, если Range нужно игнорировать
+
+    :raises
+        RangeNotSatisfiable: Если ни один диапазон не попадает в объект
+    """
+    if not header:
+        return None
+
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = _RANGE_SPEC_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+
+        if not first:
+            # Суффикс: последние N байт
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    if not ranges:
+        raise RangeNotSatisfiable(header)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def content_range(start: int, end: int, size: int) -> str:
+    return f"bytes {start}-{end}/{size}"
+
+
+def iter_byteranges(ranges: list[tuple[int, int]], size: int, content_type: str, boundary: str,
+                    open_range: Callable[[int, int], Iterable[bytes]]) -> tuple[int, Iterator[bytes]]:
+    """
+    Формирует тело ответа multipart/byteranges.
+
+    Диапазоны открываются по очереди при итерации, поэтому одновременно
+    читается не больше одного потока из хранилища.
+
+    :param ranges: Диапазоны (start, end) из parse_range_header
+    :param size: Размер объекта в байтах
+    :param content_type: MIME-тип объекта
+    :param boundary: Разделитель частей
+    :param open_range: Функция, возвращающая поток байт диапазона (start, end)
+
+    :return: tuple - Длина тела в байтах и итератор по нему
+    """
+    headers, closing, length = _byteranges_layout(ranges, size, content_type, boundary)
+
+    def generate() -> Iterator[bytes]:
+        for header, (start, end) in zip(headers, ranges):
+            yield header
+            yield from open_range(start, end)
+        yield closing
+
+    return length, generate()
+
+
+def aiter_byteranges(ranges: list[tuple[int, int]], size: int, content_type: str, boundary: str,
+                     open_range: Callable[[int, int], Awaitable[AsyncIterable[bytes]]]
+                     ) -> tuple[int, AsyncIterator[bytes]]:
+    """
+    Асинхронный вариант iter_byteranges: open_range - корутина, возвращающая асинхронный поток диапазона.
+
+    :return: tuple - Длина тела в байтах и асинхронный итератор по нему
+    """
+    headers, closing, length = _byteranges_layout(ranges, size, content_type, boundary)
+
+    async def generate() -> AsyncIterator[bytes]:
+        for header, (start, end) in zip(headers, ranges):
+            yield header
+            async for chunk in await open_range(start, end):
+                yield chunk
+        yield closing
+
+    return length, generate()
+
+
+def _byteranges_layout(ranges: list[tuple[int, int]], size: int, content_type: str,
+                       boundary: str) -> tuple[list[bytes], bytes, int]:
+    """
+    :return: tuple - Заголовки частей, завершающий разделитель и полная длина тела
+    """
+    headers = [
+        (f"\r\n--{boundary}\r\n"
+         f"Content-Type: {content_type}\r\n"
+         f"Content-Range: {content_range(start, end, size)}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(header) for header in headers) + sum(end - start + 1 for start, end in ranges) + len(closing)
+    return headers, closing, length
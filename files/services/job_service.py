@@ -0,0 +1,314 @@
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from botocore.exceptions import ClientError, BotoCoreError
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import threading
+import time
+from typing import Callable, Iterator, Optional
+from files.models import Job
+from files.repositories.job_repository import JobRepository
+from files.services.fileStorage_service import FileStorageService, QuotaExceededError
+
+logger = logging.getLogger(__name__)
+
+# Интервал в секундах, с которым ход выполняемой операции сохраняется в базе данных
+HEARTBEAT_INTERVAL = 1.0
+
+
+class JobService:
+    """
+    Фоновое выполнение удаления, переименования и перемещения папок и построения миниатюр.
+
+    Представления ставят операцию в очередь в базе данных и сразу отвечают, а воркер
+    (команда run_jobs) выполняет ее с отметками хода выполнения, отменой и повторами.
+    """
+
+    def __init__(self, storage: Optional[FileStorageService] = None):
+        """
+        :param storage: Сервис хранения файлов; по умолчанию создается новый
+        """
+        self.storage = storage or FileStorageService()
+        self.repository = JobRepository()
+        self.max_attempts = max(1, settings.FILES_JOB_MAX_ATTEMPTS)
+        self.retry_delay = settings.FILES_JOB_RETRY_DELAY
+        self.stale_timeout = settings.FILES_JOB_STALE_TIMEOUT
+
+    def submit_delete(self, user_id: int, s3_key: str) -> dict:
+        """
+        Ставит в очередь удаление папки.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ папки с завершающим '/'
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_DELETE, {'s3_key': s3_key})
+        logger.info(f"Удаление {s3_key} поставлено в очередь (операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def submit_rename(self, user_id: int, s3_key: str, new_name: str) -> dict:
+        """
+        Ставит в очередь переименование папки.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ папки с завершающим '/'
+        :param new_name: Новое имя (только имя, не путь)
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_RENAME, {'s3_key': s3_key, 'new_name': new_name})
+        logger.info(f"Переименование {s3_key} в {new_name} поставлено в очередь (операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def submit_bulk_delete(self, user_id: int, s3_keys: list[str]) -> dict:
+        """
+        Ставит в очередь удаление выбранных файлов и папок.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_keys: Полные ключи файлов и папок
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_BULK_DELETE, {'s3_keys': s3_keys})
+        logger.info(f"Удаление {len(s3_keys)} выбранных объектов поставлено в очередь (операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def submit_move(self, user_id: int, s3_keys: list[str], destination: str) -> dict:
+        """
+        Ставит в очередь перемещение выбранных файлов и папок.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_keys: Полные ключи файлов и папок
+        :param destination: Полный ключ папки назначения с завершающим '/'
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_MOVE, {'s3_keys': s3_keys, 'destination': destination})
+        logger.info(f"Перемещение {len(s3_keys)} выбранных объектов в {destination} поставлено в очередь "
+                    f"(операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def submit_move_object(self, user_id: int, s3_key: str, new_key: str) -> dict:
+        """
+        Ставит в очередь перемещение папки под новый ключ.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ папки с завершающим '/'
+        :param new_key: Новый полный ключ папки с завершающим '/'
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_MOVE, {'s3_key': s3_key, 'new_key': new_key})
+        logger.info(f"Перемещение {s3_key} в {new_key} поставлено в очередь (операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def submit_copy(self, user_id: int, s3_key: str, new_key: str) -> dict:
+        """
+        Ставит в очередь копирование папки.
+
+        :param user_id: Идентификатор пользователя Django
+        :param s3_key: Полный ключ папки с завершающим '/'
+        :param new_key: Полный ключ копии с завершающим '/'
+
+        :return: dict - Операция в формате JobRepository.to_dict
+        """
+        job = self.repository.create(user_id, Job.KIND_COPY, {'s3_key': s3_key, 'new_key': new_key})
+        logger.info(f"Копирование {s3_key} в {new_key} поставлено в очередь (операция {job.pk})")
+        return self.repository.to_dict(job)
+
+    def get_job(self, user_id: int, job_id: int) -> Optional[dict]:
+        job = self.repository.get(user_id, job_id)
+        return self.repository.to_dict(job) if job is not None else None
+
+    def list_jobs(self, user_id: int) -> list[dict]:
+        return [self.repository.to_dict(job) for job in self.repository.list_for_user(user_id)]
+
+    def cancel(self, user_id: int, job_id: int) -> bool:
+        """
+        :return: bool - True, если отмена принята (операция еще не завершена)
+        """
+        return self.repository.request_cancel(user_id, job_id)
+
+    def requeue_stale(self) -> int:
+        """
+        Возвращает в очередь операции воркеров, не отмечавшихся дольше FILES_JOB_STALE_TIMEOUT.
+
+        :return: Количество возвращенных в очередь операций
+        """
+        heartbeat_before = timezone.now() - timedelta(seconds=self.stale_timeout)
+        requeued = self.repository.requeue_stale(heartbeat_before, self.max_attempts)
+        if requeued:
+            logger.warning(f"Возвращено в очередь прерванных операций: {requeued}")
+        return requeued
+
+    def run_next(self, worker: str) -> bool:
+        """
+        Захватывает и выполняет следующую операцию из очереди.
+
+        :param worker: Идентификатор воркера
+
+        :return: bool - True, если операция была выполнена, False, если очередь пуста
+        """
+        job = self.repository.claim(worker)
+        if job is None:
+            return False
+
+        logger.info(f"Воркер {worker} начал операцию {job.pk}: {job.kind} {job.params.get('s3_key')} "
+                    f"(попытка {job.attempts})")
+        started = time.monotonic()
+        self._execute(job)
+        logger.info(f"Операция {job.pk} обработана за {time.monotonic() - started:.2f} с")
+        return True
+
+    def _execute(self, job: Job) -> None:
+        """
+        Выполняет операцию и записывает ее итог: успех, отмену, повтор или ошибку.
+
+        :param job: Захваченная операция
+        """
+        if job.cancel_requested:
+            self.repository.finish(job.pk, Job.STATUS_CANCELLED)
+            return
+
+        cancel = threading.Event()
+        error = ''
+        retryable = True
+        try:
+            with self._heartbeat(job, cancel) as progress:
+                succeeded, error = self._run(job, progress, cancel)
+
+        except (ClientError, BotoCoreError, OSError) as e:
+            logger.error(f"Ошибка выполнения операции {job.pk}: {e}", exc_info=True)
+            succeeded = False
+            error = str(e)
+
+        except Exception as e:
+            # Непредвиденная ошибка не должна останавливать воркер и оставлять операцию в работе;
+            # повтор ее, скорее всего, не исправит
+            logger.error(f"Непредвиденная ошибка выполнения операции {job.pk}: {e}", exc_info=True)
+            succeeded = False
+            error = f"{type(e).__name__}: {e}"
+            retryable = False
+
+        if succeeded and job.kind == Job.KIND_THUMBNAIL:
+            # Служебные операции не видны пользователю, хранить их после выполнения незачем
+            self.repository.delete(job.pk)
+        elif succeeded:
+            self.repository.finish(job.pk, Job.STATUS_SUCCEEDED)
+        elif cancel.is_set():
+            self.repository.finish(job.pk, Job.STATUS_CANCELLED)
+            logger.info(f"Операция {job.pk} отменена пользователем")
+        elif retryable and job.attempts < self.max_attempts:
+            run_after = timezone.now() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+            self.repository.retry(job.pk, error, run_after)
+            logger.warning(f"Операция {job.pk} завершилась ошибкой ({error}), повтор после {run_after}")
+        else:
+            self.repository.finish(job.pk, Job.STATUS_FAILED, error)
+            logger.error(f"Операция {job.pk} завершилась ошибкой после {job.attempts} попыток: {error}")
+
+    def _run(self, job: Job, progress: Callable[[str, int], None], cancel: threading.Event) -> tuple:
+        """
+        Вызывает операцию FileStorageService, соответствующую типу операции.
+
+        :return: tuple - Признак успеха и текст ошибки
+        """
+        if job.kind == Job.KIND_DELETE:
+            result = self.storage.delete_object(job.user_id, job.params['s3_key'], progress, cancel)
+            if result or result.cancelled:
+                return bool(result), ''
+            return False, result.error or f"Не удалось удалить объектов: {len(result.failed_keys)}"
+
+        if job.kind == Job.KIND_RENAME:
+            if self._run_rename(job, progress, cancel):
+                return True, ''
+            return False, "Не удалось переименовать папку"
+
+        if job.kind == Job.KIND_BULK_DELETE:
+            result = self.storage.delete_objects(job.user_id, job.params['s3_keys'], progress, cancel)
+            if result or result.cancelled:
+                return bool(result), ''
+            return False, result.error or f"Не удалось удалить объектов: {len(result.failed_keys)}"
+
+        if job.kind == Job.KIND_MOVE:
+            # Перемещение повторяемо: уже перенесенные файлы и папки засчитываются без копирования
+            if 'new_key' in job.params:
+                if self.storage.move_object(job.user_id, job.params['s3_key'], job.params['new_key'], progress, cancel):
+                    return True, ''
+                return False, "Не удалось переместить папку"
+            result = self.storage.move_objects(job.user_id, job.params['s3_keys'], job.params['destination'],
+                                               progress, cancel)
+            if result or result.cancelled:
+                return bool(result), ''
+            return False, '; '.join(f"{key}: {error}" for key, error in result.errors.items())
+
+        if job.kind == Job.KIND_COPY:
+            try:
+                if self.storage.copy_object(job.user_id, job.params['s3_key'], job.params['new_key'], progress, cancel):
+                    return True, ''
+            except QuotaExceededError as e:
+                return False, str(e)
+            return False, "Не удалось скопировать папку"
+
+        if job.kind == Job.KIND_THUMBNAIL:
+            # Файл, который нельзя декодировать, не построится и при повторе: ошибкой считаются только сбои S3
+            self.storage.generate_thumbnail(job.params['s3_key'])
+            return True, ''
+
+        return False, f"Неизвестный тип операции: {job.kind}"
+
+    def _run_rename(self, job: Job, progress: Callable[[str, int], None], cancel: threading.Event) -> bool:
+        """
+        Выполняет переименование папки.
+
+        При повторной попытке сначала проверяется, не было ли переименование уже выполнено.
+        """
+        s3_key = job.params['s3_key']
+        new_name = job.params['new_name']
+        if job.attempts > 1:
+            parent_prefix = s3_key.rstrip('/').rpartition('/')[0]
+            new_key = f"{parent_prefix}/{new_name.strip('/')}/"
+            if not self.storage.folder_exists(s3_key) and self.storage.folder_exists(new_key):
+                return True
+        return self.storage.rename_object(job.user_id, s3_key, new_name, progress, cancel)
+
+    @contextmanager
+    def _heartbeat(self, job: Job, cancel: threading.Event) -> Iterator[Callable[[str, int], None]]:
+        """
+        Сохраняет ход выполнения операции из отдельного потока каждые HEARTBEAT_INTERVAL секунд.
+
+        Отметки не зависят от того, как часто операция сообщает о ходе выполнения, поэтому
+        долгое копирование одного большого объекта не выглядит для других воркеров как
+        прерванная операция. Если пользователь запросил отмену, устанавливается событие cancel.
+
+        :return: Функция progress(этап, количество обработанных объектов) для операций FileStorageService
+        """
+        state = {'stage': '', 'processed': 0}
+        stop = threading.Event()
+
+        def progress(stage: str, processed: int) -> None:
+            state['stage'] = stage
+            state['processed'] = processed
+
+        def beat() -> None:
+            try:
+                while not stop.wait(HEARTBEAT_INTERVAL):
+                    try:
+                        if self.repository.heartbeat(job.pk, state['stage'], state['processed']):
+                            cancel.set()
+                    except DatabaseError as e:
+                        logger.error(f"Не удалось сохранить ход операции {job.pk}: {e}")
+            finally:
+                # У потока собственное соединение с базой данных
+                connection.close()
+
+        thread = threading.Thread(target=beat, name=f"files-job-{job.pk}", daemon=True)
+        thread.start()
+        try:
+            yield progress
+        finally:
+            stop.set()
+            thread.join()
+            self.repository.heartbeat(job.pk, state['stage'], state['processed'])
@@ -0,0 +1,216 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BaseCacheBackend(ABC):
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+
+class LRUCacheBackend(BaseCacheBackend):
+    """Кэш в памяти процесса с вытеснением давно неиспользуемых записей и TTL"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> dict:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at is not None and expires_at < now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class DjangoCacheBackend(BaseCacheBackend):
+    """Кэш на основе фреймворка кэширования Django (например, Redis), общий для всех процессов"""
+
+    def __init__(self, alias: str):
+        self.cache = caches[alias]
+
+    def get_many(self, keys: list[str]) -> dict:
+        return self.cache.get_many(keys)
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        self.cache.set(key, value, ttl)
+
+
+class ListingCache:
+    """
+    Кэш страниц листинга папок пользователя.
+
+    Инвалидация построена на поколениях: ключ страницы включает поколение
+    самой папки и поколения поддеревьев всех ее предков. Новое значение поколения
+    делает недействительными все зависящие от него страницы без перебора ключей.
+    Поколения читаются при каждом обращении к странице, поэтому при вытеснении
+    по LRU они всегда уходят позже зависящих от них страниц.
+    """
+
+    def __init__(self, backend: BaseCacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, prefix: str, cursor: Optional[str], page_size: int) -> tuple[str, Optional[dict]]:
+        """
+        Возвращает страницу листинга из кэша.
+
+        Ключ вычисляется по поколениям на момент чтения и возвращается вместе со страницей:
+        при промахе страницу нужно сохранить именно под ним, тогда инвалидация,
+        произошедшая во время запроса к S3, не даст закэшировать устаревшие данные.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Относительный путь папки ('' для корня, 'a/b/' для вложенной)
+        :param cursor: Курсор страницы или None
+        :param page_size: Размер страницы
+
+        :return: tuple - Ключ страницы и страница листинга или None при промахе
+        """
+        key = self._page_key(user_id, prefix, cursor, page_size)
+        page = self.backend.get_many([key]).get(key)
+
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, page
+
+    def set(self, key: str, page: dict) -> None:
+        """
+        Сохраняет страницу листинга в кэш.
+
+        :param key: Ключ страницы, полученный из get
+        :param page: Страница листинга
+        """
+        self.backend.set(key, page, self.ttl)
+
+    def invalidate(self, user_id: int, prefix: str) -> None:
+        """
+        Сбрасывает кэш листинга папки и всех ее предков.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Относительный путь измененной папки
+        """
+        for ancestor in self._ancestors(prefix):
+            self._bump(self._generation_key('self', user_id, ancestor))
+
+    def invalidate_tree(self, user_id: int, prefix: str) -> None:
+        """
+        Сбрасывает кэш листинга папки, всех вложенных в нее папок и всех ее предков.
+
+        :param user_id: Идентификатор пользователя Django
+        :param prefix: Относительный путь измененной папки
+        """
+        self._bump(self._generation_key('tree', user_id, self._normalize(prefix)))
+        self.invalidate(user_id, prefix)
+
+    def stats(self) -> dict:
+        """
+        :return: dict - Количество попаданий и промахов кэша в текущем процессе
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _bump(self, generation_key: str) -> None:
+        # Уникальное значение вместо счетчика: поколение, вытесненное из кэша, не совпадет с прежним
+        # Поколение живет дольше страниц, чтобы устаревшие страницы успели истечь раньше него
+        self.backend.set(generation_key, time.time_ns(), self.ttl * 2)
+
+    def _page_key(self, user_id: int, prefix: str, cursor: Optional[str], page_size: int) -> str:
+        prefix = self._normalize(prefix)
+        ancestors = self._ancestors(prefix)
+        generation_keys = [self._generation_key('self', user_id, prefix)]
+        generation_keys += [self._generation_key('tree', user_id, ancestor) for ancestor in ancestors]
+
+        generations = self.backend.get_many(generation_keys)
+        signature = ':'.join(str(generations.get(key, 0)) for key in generation_keys)
+        raw_key = f"{prefix}|{cursor or ''}|{page_size}|{signature}"
+        return f"files:listing:{user_id}:{hashlib.sha1(raw_key.encode()).hexdigest()}"
+
+    @staticmethod
+    def _generation_key(kind: str, user_id: int, prefix: str) -> str:
+        return f"files:listing:{kind}:{user_id}:{hashlib.sha1(prefix.encode()).hexdigest()}"
+
+    @staticmethod
+    def _normalize(prefix: str) -> str:
+        prefix = prefix.strip('/')
+        return f"{prefix}/" if prefix else ''
+
+    def _ancestors(self, prefix: str) -> list[str]:
+        """
+        :return: list[str] - Папка и все ее предки, начиная с корня ('', 'a/', 'a/b/')
+        """
+        ancestors = ['']
+        accumulated = ''
+        for part in self._normalize(prefix).split('/'):
+            if part:
+                accumulated += f"{part}/"
+                ancestors.append(accumulated)
+        return ancestors
+
+
+_listing_cache = None
+_listing_cache_lock = threading.Lock()
+
+
+def get_listing_cache() -> Optional[ListingCache]:
+    """
+    Возвращает общий для процесса кэш листингов согласно FILES_LISTING_CACHE_BACKEND.
+
+    :return: ListingCache или None, если кэширование отключено
+    """
+    global _listing_cache
+
+    backend_name = settings.FILES_LISTING_CACHE_BACKEND
+    if backend_name == 'none':
+        return None
+
+    if _listing_cache is None:
+        with _listing_cache_lock:
+            if _listing_cache is None:
+                ttl = settings.FILES_LISTING_CACHE_TTL
+                if backend_name == 'django':
+                    backend = DjangoCacheBackend(settings.FILES_LISTING_CACHE_ALIAS)
+                elif backend_name == 'locmem':
+                    backend = LRUCacheBackend(settings.FILES_LISTING_CACHE_MAX_ENTRIES)
+                else:
+                    raise ValueError(f"Неизвестный бэкенд кэша листингов: {backend_name}")
+                _listing_cache = ListingCache(backend, ttl)
+                logger.info(f"Кэш листингов: {backend_name}, TTL {ttl} с")
+
+    return _listing_cache
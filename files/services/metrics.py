@@ -0,0 +1,231 @@
+from contextvars import ContextVar
+from typing import Optional
+import bisect
+import threading
+import time
+
+# Границы корзин гистограмм длительности в секундах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Описание метрик для формата Prometheus: имя -> (тип, справка)
+METRICS = {
+    'files_s3_requests_total': ('counter', "Запросы к S3 по операции и HTTP-статусу"),
+    'files_s3_request_duration_seconds': ('histogram', "Длительность запросов к S3 вместе с повторами"),
+    'files_s3_sent_bytes_total': ('counter', "Байт отправлено в S3 в телах запросов"),
+    'files_s3_received_bytes_total': ('counter', "Байт получено из S3 по Content-Length ответов"),
+    'files_s3_retries_total': ('counter', "Повторные попытки запросов к S3"),
+    'files_s3_errors_total': ('counter', "Ошибки запросов к S3 по коду ошибки"),
+    'files_http_requests_total': ('counter', "HTTP-запросы по представлению, методу и статусу"),
+    'files_http_request_duration_seconds': ('histogram', "Длительность обработки HTTP-запросов"),
+    'files_http_request_s3_seconds': ('histogram', "Суммарное время запросов к S3 за HTTP-запрос"),
+    'files_http_request_db_seconds': ('histogram', "Суммарное время запросов к базе данных за HTTP-запрос"),
+    'files_compression_input_bytes_total': ('counter', "Байт загруженных файлов до сжатия по кодеку"),
+    'files_compression_output_bytes_total': ('counter', "Байт загруженных файлов после сжатия по кодеку"),
+    'files_compression_seconds_total': ('counter', "Время сжатия загружаемых файлов по кодеку"),
+}
+
+
+class MetricsRegistry:
+    """
+    Счетчики и гистограммы процесса в памяти.
+
+    Метрики не разделяются между процессами: при нескольких воркерах Gunicorn
+    каждый воркер отдает собственные значения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, labels: dict, value: float = 1) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self) -> str:
+        """
+        :return: str - метрики в текстовом формате Prometheus 0.0.4
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count)
+                          for key, (buckets, total, count) in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip((*DURATION_BUCKETS, '+Inf'), buckets):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Накопитель времени S3 и базы данных за один HTTP-запрос.
+
+    Запросы к S3 могут выполняться из пула потоков, поэтому значения обновляются под блокировкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.s3_calls = 0
+        self.s3_seconds = 0.0
+        self.s3_errors = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add_s3(self, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.s3_calls += 1
+            self.s3_seconds += seconds
+            self.s3_errors += int(failed)
+
+    def add_db(self, seconds: float) -> None:
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar('files_request_metrics', default=None)
+
+
+def start_request() -> tuple[RequestMetrics, object]:
+    """
+    Начинает учет запроса в текущем контексте.
+
+    :return: tuple - (накопитель, токен для finish_request)
+    """
+    metrics = RequestMetrics()
+    return metrics, _current_request.set(metrics)
+
+
+def finish_request(token) -> None:
+    _current_request.reset(token)
+
+
+def instrument_client(client) -> None:
+    """
+    Подключает учет запросов к клиенту boto3 или aiobotocore через события botocore.
+
+    Время измеряется от before-call до after-call, то есть вместе с повторами;
+    количество повторов берется из ResponseMetadata.RetryAttempts.
+    """
+    events = client.meta.events
+    events.register('before-call.s3', _before_call, unique_id='files-metrics-before')
+    events.register('after-call.s3', _after_call, unique_id='files-metrics-after')
+    events.register('after-call-error.s3', _after_call_error, unique_id='files-metrics-error')
+
+
+def _before_call(model, params, context, **kwargs) -> None:
+    context['files_metrics_started'] = time.perf_counter()
+    context['files_metrics_operation'] = model.name
+    context['files_metrics_sent'] = _body_size(params.get('body'))
+
+
+def _after_call(http_response, parsed, model, context, **kwargs) -> None:
+    metadata = parsed.get('ResponseMetadata', {})
+    error_code = parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+    # У HEAD Content-Length - размер объекта, а не полученные данные
+    received = 0 if model.http.get('method') == 'HEAD' else metadata.get('HTTPHeaders', {}).get('content-length', 0)
+    _record(model.name, context, str(http_response.status_code), int(received or 0),
+            metadata.get('RetryAttempts', 0), error_code)
+
+
+def _after_call_error(exception, context, **kwargs) -> None:
+    # Ошибка соединения или таймаут после всех повторов: ответа S3 нет
+    _record(context.get('files_metrics_operation', 'unknown'), context, 'error', 0, 0, type(exception).__name__)
+
+
+def _record(operation: str, context: dict, status: str, received: int, retries: int,
+            error_code: Optional[str]) -> None:
+    started = context.pop('files_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    sent = context.pop('files_metrics_sent', 0)
+    context.pop('files_metrics_operation', None)
+    labels = {'operation': operation}
+
+    registry.inc('files_s3_requests_total', {**labels, 'status': status})
+    registry.observe('files_s3_request_duration_seconds', labels, elapsed)
+    if sent:
+        registry.inc('files_s3_sent_bytes_total', labels, sent)
+    if received:
+        registry.inc('files_s3_received_bytes_total', labels, received)
+    if retries:
+        registry.inc('files_s3_retries_total', labels, retries)
+    if error_code:
+        registry.inc('files_s3_errors_total', {**labels, 'code': error_code})
+
+    request_metrics = _current_request.get()
+    if request_metrics is not None:
+        request_metrics.add_s3(elapsed, bool(error_code))
+
+
+def _body_size(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode())
+    # Файловый объект: размер остатка от текущей позиции
+    try:
+        position = body.tell()
+        size = body.seek(0, 2) - position
+        body.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """
+    Обертка запросов Django к базе данных: время запроса добавляется к текущему HTTP-запросу.
+    """
+    request_metrics = _current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.add_db(time.perf_counter() - started)
@@ -0,0 +1,77 @@
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from files.services.metrics import instrument_client
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client_config() -> Config:
+    """
+    Настройки клиента S3 из FILES_S3_*: пул соединений, таймауты, повторы и keepalive.
+
+    :return: botocore.config.Config
+    """
+    return Config(
+        signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+        max_pool_connections=settings.FILES_S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.FILES_S3_CONNECT_TIMEOUT,
+        read_timeout=settings.FILES_S3_READ_TIMEOUT,
+        retries={'total_max_attempts': settings.FILES_S3_MAX_ATTEMPTS, 'mode': settings.FILES_S3_RETRY_MODE},
+        tcp_keepalive=True,
+        # MinIO обычно доступен по адресу без поддоменов бакетов
+        s3={'addressing_style': 'path'},
+    )
+
+
+def get_s3_client():
+    """
+    Возвращает общий для процесса клиент S3, создавая его при первом обращении.
+
+    Клиенты boto3 потокобезопасны, поэтому один клиент с пулом на
+    FILES_S3_MAX_POOL_CONNECTIONS соединений обслуживает все потоки процесса,
+    а учетные данные, эндпоинт и подписчик запросов инициализируются один раз.
+    Создание клиента не обращается к сети.
+
+    :return: Клиент boto3 S3 для внутреннего адреса MinIO
+    """
+    return _get_client('internal', settings.AWS_S3_ENDPOINT_URL)
+
+
+def get_presign_client():
+    """
+    Возвращает общий для процесса клиент для подписи ссылок, выдаваемых браузеру.
+
+    :return: Клиент boto3 S3 для публичного адреса MinIO (тот же клиент, если адреса совпадают)
+    """
+    if settings.AWS_S3_PUBLIC_ENDPOINT_URL == settings.AWS_S3_ENDPOINT_URL:
+        return get_s3_client()
+    return _get_client('public', settings.AWS_S3_PUBLIC_ENDPOINT_URL)
+
+
+def _get_client(name: str, endpoint_url: str):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                # Сессия на каждый клиент: сессия boto3 по умолчанию не потокобезопасна
+                client = boto3.session.Session().client(
+                    's3',
+                    endpoint_url=endpoint_url,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    region_name=settings.AWS_S3_REGION_NAME,
+                    config=get_client_config(),
+                )
+                if settings.FILES_METRICS_ENABLED:
+                    instrument_client(client)
+                _clients[name] = client
+                logger.info(f"Создан клиент S3 для {endpoint_url}, "
+                            f"пул {settings.FILES_S3_MAX_POOL_CONNECTIONS} соединений")
+    return client
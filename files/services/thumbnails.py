@@ -0,0 +1,103 @@
+import io
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Форматы изображений, для которых строятся миниатюры (декодирование - Pillow)
+IMAGE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+# Первая страница PDF отрисовывается, только если установлен pypdfium2
+PDF_MIME_TYPE = 'application/pdf'
+
+THUMBNAIL_CONTENT_TYPE = 'image/jpeg'
+THUMBNAIL_QUALITY = 80
+
+
+def _pdf_supported() -> bool:
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _images_supported() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def supports(content_type: Optional[str]) -> bool:
+    """
+    Проверяет, можно ли построить миниатюру для файла с указанным MIME-типом.
+
+    :param content_type: MIME-тип файла или None
+    """
+    if not content_type or not _images_supported():
+        return False
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type == PDF_MIME_TYPE:
+        return _pdf_supported()
+    return content_type in IMAGE_MIME_TYPES
+
+
+def render_thumbnail(data: bytes, content_type: str, size: int) -> Optional[bytes]:
+    """
+    Строит миниатюру JPEG, вписанную в квадрат size x size.
+
+    :param data: Содержимое исходного файла
+    :param content_type: MIME-тип исходного файла
+    :param size: Наибольшая сторона миниатюры в пикселях
+
+    :return: bytes - Миниатюра в формате JPEG или None, если файл не удалось декодировать
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        if content_type.split(';')[0].strip().lower() == PDF_MIME_TYPE:
+            image = _render_pdf_page(data, size)
+        else:
+            image = Image.open(io.BytesIO(data))
+            # JPEG декодируется сразу в уменьшенном масштабе, без полного растра
+            image.draft('RGB', (size, size))
+            image = ImageOps.exif_transpose(image)
+
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность заменяется белым фоном: в JPEG нет альфа-канала
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+    except (OSError, ValueError, IndexError, Image.DecompressionBombError) as e:
+        logger.warning(f"Не удалось построить миниатюру ({content_type}): {e}")
+        return None
+
+
+def _render_pdf_page(data: bytes, size: int):
+    """
+    Отрисовывает первую страницу PDF в масштабе, близком к размеру миниатюры.
+
+    :return: PIL.Image.Image - Изображение страницы
+    """
+    import pypdfium2
+
+    try:
+        document = pypdfium2.PdfDocument(data)
+    except pypdfium2.PdfiumError as e:
+        raise ValueError(str(e)) from e
+    try:
+        page = document[0]
+        width, height = page.get_size()
+        # Запас в два раза по разрешению сглаживает текст после уменьшения
+        scale = 2 * size / max(width, height, 1)
+        return page.render(scale=scale).to_pil()
+    finally:
+        document.close()
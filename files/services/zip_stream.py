@@ -0,0 +1,108 @@
+from datetime import datetime
+from django.utils import timezone
+import io
+import mimetypes
+import zipfile
+from typing import Iterable, Iterator, Optional
+
+# Форматы, которые уже сжаты: повторное сжатие тратит процессор почти без выигрыша
+STORED_EXTENSIONS = {
+    '.7z', '.aac', '.avi', '.avif', '.br', '.bz2', '.docx', '.epub', '.flac', '.gif', '.gz', '.heic',
+    '.jar', '.jpeg', '.jpg', '.m4a', '.m4v', '.mkv', '.mov', '.mp3', '.mp4', '.odp', '.ods', '.odt',
+    '.ogg', '.opus', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip', '.zst',
+}
+STORED_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+DEFLATED_MIME_TYPES = {'image/svg+xml', 'image/bmp', 'image/tiff', 'audio/wav', 'audio/x-wav'}
+
+# Минимальная дата, представимая в формате ZIP
+ZIP_MIN_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Приемник для zipfile без поддержки seek: накапливает записанные байты до их выдачи в ответ"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def is_compressible(name: str) -> bool:
+    """
+    Определяет, имеет ли смысл сжимать файл в архиве.
+
+    :param name: Имя файла
+
+    :return: bool - False для уже сжатых форматов (изображения, видео, архивы)
+    """
+    lower_name = name.lower()
+    if any(lower_name.endswith(extension) for extension in STORED_EXTENSIONS):
+        return False
+    content_type = mimetypes.guess_type(lower_name)[0] or ''
+    return content_type in DEFLATED_MIME_TYPES or not content_type.startswith(STORED_MIME_PREFIXES)
+
+
+def iter_zip(entries: Iterable[dict]) -> Iterator[bytes]:
+    """
+    Формирует ZIP-архив на лету, не удерживая его в памяти и не записывая на диск.
+
+    Так как выходной поток не поддерживает seek, размеры и CRC каждого файла
+    записываются в data descriptor после его содержимого. ZIP64 включается
+    автоматически для файлов больше 4 ГБ и для архивов, превысивших ограничения ZIP.
+
+    :param entries: Элементы архива - словари с ключами:
+        - 'name': Путь внутри архива (с завершающим '/' для папки)
+        - 'size': Размер файла в байтах или None, если он неизвестен
+        - 'last_modified': Время изменения (datetime) или None
+        - 'chunks': Итерируемый объект с содержимым файла (для папок не нужен)
+
+    :return: Iterator[bytes] - Итератор по байтам архива
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', allowZip64=True) as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry['name'], date_time=_zip_date_time(entry.get('last_modified')))
+
+            if entry['name'].endswith('/'):
+                info.external_attr = 0o40775 << 16 | 0x10
+                archive.writestr(info, b'')
+                continue
+
+            info.external_attr = 0o644 << 16
+            # Для файла неизвестного размера ZIP64 включается заранее: размер может превысить 4 ГБ
+            info.file_size = entry['size'] if entry['size'] is not None else zipfile.ZIP64_LIMIT
+            if is_compressible(entry['name']):
+                info.compress_type = zipfile.ZIP_DEFLATED
+            else:
+                info.compress_type = zipfile.ZIP_STORED
+
+            # file_size заранее известен, поэтому zipfile сам решает, нужен ли ZIP64 для файла
+            with archive.open(info, mode='w') as target:
+                for chunk in entry['chunks']:
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+    # Остаток: data descriptor последнего файла и центральный каталог
+    yield buffer.drain()
+
+
+def _zip_date_time(last_modified: Optional[datetime]) -> tuple:
+    if last_modified is None:
+        last_modified = timezone.now()
+    if timezone.is_aware(last_modified):
+        last_modified = timezone.localtime(last_modified)
+    date_time = last_modified.timetuple()[:6]
+    return max(date_time, ZIP_MIN_DATE)
@@ -1,13 +1,36 @@
+from django.conf import settings
 from django.urls import path
 from .views.files_views import *
 
+# Под ASGI основные представления заменяются асинхронными вариантами
+if settings.FILES_ASYNC_VIEWS:
+    from .views.files_async_views import file_manager_view, file_download_view, file_upload_view
+
 app_name = 'files'
 
 urlpatterns = [
      path('manager/', file_manager_view, name='file_manager'),
+     path('list/', file_list_view, name='list'),
+     path('search/', file_search_view, name='search'),
      path('upload/', file_upload_view, name='upload'),
+     path('upload/presign/', file_presign_upload_view, name='presign_upload'),
+     path('upload/complete/', file_complete_upload_view, name='complete_upload'),
+     path('upload/abort/', file_abort_upload_view, name='abort_upload'),
+     path('upload/resumable/', resumable_upload_view, name='resumable_upload'),
+     path('upload/resumable/<uuid:upload_id>/', resumable_upload_detail_view, name='resumable_upload_detail'),
      path('download/<path:s3_key>/', file_download_view, name='download'),
+     path('thumbnail/<path:s3_key>/', file_thumbnail_view, name='thumbnail'),
+     path('download-folder/<path:s3_key>/', file_download_folder_view, name='download_folder'),
      path('delete/<path:s3_key>/', file_delete_view, name='delete'),
      path('rename/<path:s3_key>/', file_rename_view, name='rename'),
+     path('move/<path:s3_key>/', file_move_view, name='move'),
+     path('copy/<path:s3_key>/', file_copy_view, name='copy'),
+     path('bulk/delete/', file_bulk_delete_view, name='bulk_delete'),
+     path('bulk/move/', file_bulk_move_view, name='bulk_move'),
+     path('bulk/download/', file_bulk_download_view, name='bulk_download'),
+     path('jobs/', job_list_view, name='jobs'),
+     path('jobs/<int:job_id>/', job_detail_view, name='job_detail'),
+     path('jobs/<int:job_id>/cancel/', job_cancel_view, name='job_cancel'),
+     path('metrics/', metrics_view, name='metrics'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,206 @@
+from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_protect
+from django.http import Http404, HttpResponse, StreamingHttpResponse, JsonResponse
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.utils.http import content_disposition_header
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from files.services.asyncFileStorage_service import AsyncFileStorageService
+from files.services.http_ranges import aiter_byteranges, content_range
+from files.views.files_views import (service as sync_service, _build_manager_context, _exceeds_quota,
+                                     _get_page_size, _requires_decoding, _resolve_compressed_download,
+                                     _resolve_download_ranges, _set_compressed_headers, _set_download_headers)
+import logging
+import uuid
+from urllib.parse import unquote, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+service = AsyncFileStorageService(sync_service)
+
+
+@csrf_protect
+@login_required
+async def file_manager_view(request):
+    """
+    Асинхронный вариант files_views.file_manager_view
+    :param request:
+    :return:
+    """
+    user = await request.auser()
+    try:
+        encoded_path = request.GET.get('path', '')
+        current_path = unquote(encoded_path) if encoded_path else ''
+
+        cursor = request.GET.get('cursor') or None
+        page_size = _get_page_size(request)
+        sort = request.GET.get('sort', 'name')
+
+        page = await service.list_files_page(user_id=user.id, prefix=current_path, page_size=page_size,
+                                             cursor=cursor, sort=sort)
+        logger.debug(f"Получено {len(page['items'])} для отображения")
+
+        usage = await sync_to_async(sync_service.get_usage)(user.id)
+        context = _build_manager_context(current_path, page, page_size, sort, usage)
+
+        # Шаблоны обращаются к сессии и пользователю, поэтому рендерятся в синхронном потоке
+        return await sync_to_async(render)(request, "files/file_manager.html", context)
+
+    except Exception as e:
+        logger.error(f"Ошибка в file_manager_view для пользователя {user.id}: {e}", exc_info=True)
+        return await sync_to_async(render)(request, 'files/error.html',
+                                           {'error_message': 'Произошла ошибка при загрузке файлов.'})
+
+
+@login_required
+@csrf_protect
+async def file_upload_view(request):
+    """
+    Асинхронный вариант files_views.file_upload_view
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return redirect('files:file_manager')
+
+    user = await request.auser()
+    if await sync_to_async(_exceeds_quota)(request, user.id):
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({'error': 'Превышена квота на объем хранилища'}, status=413)
+        messages.error(request, "Превышена квота на объем хранилища")
+        return redirect('files:file_manager')
+
+    # Разбор multipart-тела запроса читает поток запроса синхронно
+    post, uploaded_files = await sync_to_async(lambda: (request.POST, request.FILES.getlist('files')))()
+    current_path_form_form = post.get('current_path', '').strip('/')
+
+    files_to_upload = []
+    for uploaded_file in uploaded_files:
+        s3_filename = uploaded_file.name
+        if current_path_form_form:
+            s3_filename = f"{current_path_form_form}/{s3_filename}"
+        files_to_upload.append((uploaded_file, s3_filename))
+
+    results = await service.upload_files(user_id=user.id, files=files_to_upload)
+    failed = [result for result in results if not result['success']]
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'uploaded': len(results) - len(failed),
+            'failed': len(failed),
+            'results': results,
+        }, status=200 if not failed else 207)
+
+    if failed:
+        messages.error(request, f"Не удалось загрузить файлов: {len(failed)} из {len(results)}: "
+                                f"{', '.join(result['name'] for result in failed)}")
+    elif results:
+        messages.success(request, f"Загружено файлов: {len(results)}")
+
+    redirect_url = reverse("files:file_manager")
+    if current_path_form_form:
+        redirect_url = f"{redirect_url}?{urlencode({'path': current_path_form_form})}"
+    return redirect(redirect_url)
+
+
+@login_required
+@csrf_protect
+async def file_download_view(request, s3_key):
+    """
+    Асинхронный вариант files_views.file_download_view: в режиме proxy поток из MinIO
+    передается клиенту без выделения потока на время скачивания.
+    :param s3_key:
+    :param request:
+    """
+    user = await request.auser()
+    expected_prefix = f"user-{user.id}-files/"
+
+    if not s3_key.startswith(expected_prefix):
+        raise Http404("Файл не найден или доступ запрещен")
+
+    file_name = s3_key.split("/")[-1]
+    download_mode = settings.FILES_DOWNLOAD_MODE
+
+    try:
+        info = None
+        if download_mode != 'proxy' and settings.FILES_COMPRESSION_ENABLED:
+            info = await service.get_object_info(s3_key)
+            if _requires_decoding(request, info):
+                download_mode = 'proxy'
+
+        # Подпись ссылок выполняется локально, без обращения к S3
+        if download_mode == 'presigned':
+            logger.info(f"Файл {s3_key} отдан по presigned-ссылке")
+            return redirect(sync_service.create_presigned_download(s3_key, file_name))
+
+        if download_mode == 'accel':
+            url = urlsplit(sync_service.create_presigned_download(s3_key, file_name, internal=True))
+            http_response = HttpResponse()
+            http_response["X-Accel-Redirect"] = f"{settings.FILES_ACCEL_REDIRECT_PREFIX.rstrip('/')}{url.path}?{url.query}"
+            http_response["Content-Disposition"] = content_disposition_header(True, file_name)
+            logger.info(f"Файл {s3_key} передан nginx для отдачи")
+            return http_response
+
+        info = info or await service.get_object_info(s3_key)
+        etag = info['etag']
+        last_modified = int(info['last_modified'].timestamp()) if info['last_modified'] else None
+        size = info['size']
+
+        if info['codec']:
+            early_response, passthrough, response_etag = _resolve_compressed_download(request, info, last_modified)
+            if early_response is not None:
+                return early_response
+            http_response = StreamingHttpResponse(
+                await service.open_object(s3_key, if_match=etag, decode=not passthrough),
+                content_type=info['content_type'],
+            )
+            _set_compressed_headers(http_response, info, passthrough)
+            _set_download_headers(http_response, file_name, response_etag, last_modified, accept_ranges=False)
+            logger.info(f"Файл {s3_key} ({info['codec']}) начал скачиваться "
+                        f"{'без распаковки' if passthrough else 'с распаковкой'}")
+            return http_response
+
+        early_response, ranges = _resolve_download_ranges(request, etag, last_modified, size)
+        if early_response is not None:
+            return early_response
+
+        if ranges is None:
+            http_response = StreamingHttpResponse(await service.open_object(s3_key, if_match=etag),
+                                                  content_type=info['content_type'])
+            http_response["Content-Length"] = str(size)
+
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            http_response = StreamingHttpResponse(await service.open_object(s3_key, (start, end), if_match=etag),
+                                                  content_type=info['content_type'], status=206)
+            http_response["Content-Range"] = content_range(start, end, size)
+            http_response["Content-Length"] = str(end - start + 1)
+
+        else:
+            boundary = uuid.uuid4().hex
+            content_length, body = aiter_byteranges(
+                ranges, size, info['content_type'], boundary,
+                lambda start, end: service.open_object(s3_key, (start, end), if_match=etag),
+            )
+            http_response = StreamingHttpResponse(body, content_type=f"multipart/byteranges; boundary={boundary}",
+                                                  status=206)
+            http_response["Content-Length"] = str(content_length)
+
+        _set_download_headers(http_response, file_name, etag, last_modified)
+
+        logger.info(f"Файл {s3_key} начал скачиваться")
+        return http_response
+
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+            logger.error(f"Ошибка при скачивании файла {s3_key}: {e}", exc_info=True)
+            return redirect('files:file_manager')
+        logger.error(f"Файл не найден в S3: {s3_key}")
+        raise Http404("Файл не найден")
+
+    except Exception as e:
+        logger.error(f"Ошибка при скачивании файла {s3_key}: {e}", exc_info=True)
+        return redirect('files:file_manager')
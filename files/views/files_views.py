@@ -1,20 +1,43 @@
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_protect
-from django.http import Http404, StreamingHttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse, JsonResponse
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from files.services.fileStorage_service import FileStorageService
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from files.services.fileStorage_service import (FileStorageService, QuotaExceededError, UploadLockedError,
+                                                UploadOffsetError)
+from files.services.job_service import JobService
+from files.services.http_ranges import RangeNotSatisfiable, content_range, iter_byteranges, parse_range_header
+from files.services import compression, metrics, thumbnails
+from botocore.exceptions import ClientError
 from django.conf import settings
+import base64
+import binascii
+import hmac
+import json
 import logging
-from urllib.parse import unquote, urlencode
-from typing import List, Dict
+import mimetypes
+import uuid
+from urllib.parse import unquote, urlencode, urlsplit
+from typing import List, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 service = FileStorageService()
+job_service = JobService(service)
 
 bucket_name = settings.AWS_STORAGE_BUCKET_NAME
 
+# Срок кэширования миниатюр браузером: ссылка меняется вместе с версией файла
+THUMBNAIL_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Поддерживаемая версия и расширения протокола tus для возобновляемой загрузки
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination,expiration'
+
 
 @csrf_protect
 @login_required
@@ -32,18 +55,16 @@ def file_manager_view(request):
 
         logger.debug(f"Текущий путь (переданный в ?path=): {current_path}")
 
-        items = service.list_files(user_id=user.id, prefix=current_path)
-        logger.debug(f"Получено {len(items)} для отображения")
+        cursor = request.GET.get('cursor') or None
+        page_size = _get_page_size(request)
+        sort = request.GET.get('sort', 'name')
 
-        breadcrumbs = _build_breadcrumbs(current_path)
-        print(f"DEBUG: breadcrumbs = {breadcrumbs}")
-        logger.debug(f"Breadcrumbs: {breadcrumbs}")
+        page = service.list_files_page(user_id=user.id, prefix=current_path, page_size=page_size,
+                                       cursor=cursor, sort=sort)
+        items = page['items']
+        logger.debug(f"Получено {len(items)} для отображения")
 
-        context = {
-            'breadcrumbs': breadcrumbs,
-            'items': items,
-            "current_path": current_path,
-        }
+        context = _build_manager_context(current_path, page, page_size, sort, service.get_usage(user.id))
 
         return render(request, "files/file_manager.html", context)
 
@@ -52,45 +73,348 @@ def file_manager_view(request):
         return render(request, 'files/error.html', {'error_message': 'Произошла ошибка при загрузке файлов.'})
 
 
+@login_required
+def file_list_view(request):
+    """
+    Возвращает страницу списка файлов в формате JSON для бесконечной прокрутки.
+
+    Параметры запроса: ?path= - папка, ?cursor= - курсор из предыдущего ответа, ?page_size= - размер страницы,
+    ?sort= - поле сортировки.
+    Ответ содержит элементы, курсор следующей страницы и готовую HTML-разметку карточек.
+    :param request:
+    :return:
+    """
+    user_id = request.user.id
+    current_path = unquote(request.GET.get('path', ''))
+    cursor = request.GET.get('cursor') or None
+
+    try:
+        page = service.list_files_page(user_id=user_id, prefix=current_path,
+                                       page_size=_get_page_size(request), cursor=cursor,
+                                       sort=request.GET.get('sort', 'name'))
+
+    except ClientError as e:
+        logger.error(f"Ошибка в file_list_view для пользователя {user_id}: {e}")
+        return JsonResponse({'error': 'Не удалось получить список файлов'}, status=502)
+
+    html = render_to_string('files/partials/file_items.html', {'items': _with_thumbnails(page['items'])},
+                            request=request)
+    return JsonResponse({'items': page['items'], 'next_cursor': page['next_cursor'], 'html': html})
+
+
+@login_required
+def file_search_view(request):
+    """
+    Ищет файлы и папки пользователя по имени во всем дереве.
+
+    Параметры запроса: ?q= - часть имени. Если клиент ожидает JSON
+    (заголовок Accept: application/json), возвращает результаты в JSON для выпадающего списка.
+    :param request:
+    :return:
+    """
+    user_id = request.user.id
+    query = request.GET.get('q', '').strip()
+    user_prefix = f"user-{user_id}-files/"
+
+    results = service.search_files(user_id=user_id, query=query) if query else []
+    for item in results:
+        item['path'] = item['parent_key'][len(user_prefix):]
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'query': query, 'results': results})
+
+    return render(request, 'files/search.html', {'query': query, 'results': results})
+
+
 @login_required
 @csrf_protect
 def file_upload_view(request):
     """
-    Позволяет пользователю загрузить файлы в облако
+    Позволяет пользователю загрузить файлы в облако.
+
+    Все выбранные файлы загружаются параллельно. Если клиент ожидает JSON
+    (заголовок Accept: application/json), возвращается отчет по каждому файлу,
+    иначе итог показывается сообщением в файловом менеджере.
     :param request:
     :return:
     """
     if request.method == "POST":
         user_id = request.user.id
+        # Проверка до разбора тела запроса, чтобы не принимать файлы, которые все равно не поместятся
+        if _exceeds_quota(request, user_id):
+            if 'application/json' in request.headers.get('Accept', ''):
+                return JsonResponse({'error': 'Превышена квота на объем хранилища'}, status=413)
+            messages.error(request, "Превышена квота на объем хранилища")
+            return redirect('files:file_manager')
+
         current_path_form_form = request.POST.get('current_path', '').strip('/')
         uploaded_files = request.FILES.getlist('files')
 
+        files_to_upload = []
         for uploaded_file in uploaded_files:
             s3_filename = uploaded_file.name
             if current_path_form_form:
                 s3_filename = f"{current_path_form_form}/{s3_filename}"
+            files_to_upload.append((uploaded_file, s3_filename))
 
-            service.upload_file(
-                user_id=user_id,
-                file_obj=uploaded_file,
-                filename_in_s3=s3_filename,
-            )
+        results = service.upload_files(user_id=user_id, files=files_to_upload)
+        failed = [result for result in results if not result['success']]
 
-            redirect_url = "files:file_manager"
-            if current_path_form_form:
-                redirect_url = f"{reverse(redirect_url)}?path={current_path_form_form}"
-            else:
-                redirect_url = f"{reverse(redirect_url)}"
-            return redirect(redirect_url)
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({
+                'uploaded': len(results) - len(failed),
+                'failed': len(failed),
+                'results': results,
+            }, status=200 if not failed else 207)
+
+        if failed:
+            messages.error(request, f"Не удалось загрузить файлов: {len(failed)} из {len(results)}: "
+                                    f"{', '.join(result['name'] for result in failed)}")
+        elif results:
+            messages.success(request, f"Загружено файлов: {len(results)}")
+
+        redirect_url = "files:file_manager"
+        if current_path_form_form:
+            redirect_url = f"{reverse(redirect_url)}?{urlencode({'path': current_path_form_form})}"
+        else:
+            redirect_url = f"{reverse(redirect_url)}"
+        return redirect(redirect_url)
     else:
         return redirect('files:file_manager')
 
 
+@login_required
+@csrf_protect
+def file_presign_upload_view(request):
+    """
+    Выдает presigned-ссылки для прямой загрузки файла из браузера в MinIO.
+
+    Ожидает JSON {"name", "size", "content_type", "current_path"}. Данные файла
+    не проходят через Django: после загрузки клиент вызывает file_complete_upload_view.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+    if not settings.FILES_DIRECT_UPLOAD_ENABLED:
+        return JsonResponse({'error': 'Прямая загрузка отключена'}, status=404)
+
+    try:
+        payload = json.loads(request.body)
+        current_path = str(payload.get('current_path', '')).strip('/')
+        filename = str(payload['name'])
+        if current_path:
+            filename = f"{current_path}/{filename}"
+
+        upload = service.create_presigned_upload(
+            user_id=request.user.id,
+            filename_in_s3=filename,
+            size=int(payload['size']),
+            content_type=payload.get('content_type'),
+        )
+        return JsonResponse(upload)
+
+    except QuotaExceededError as e:
+        return JsonResponse({'error': str(e)}, status=413)
+
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': f"Некорректный запрос: {e}"}, status=400)
+
+    except ClientError as e:
+        logger.error(f"Ошибка при подготовке прямой загрузки: {e}", exc_info=True)
+        return JsonResponse({'error': 'Не удалось подготовить загрузку'}, status=502)
+
+
+@login_required
+@csrf_protect
+def file_complete_upload_view(request):
+    """
+    Регистрирует файл, загруженный напрямую в MinIO.
+
+    Ожидает JSON {"key", "upload_id", "parts": [{"part_number", "etag"}]};
+    upload_id и parts передаются только для multipart загрузки.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+        uploaded = service.complete_presigned_upload(
+            user_id=request.user.id,
+            s3_key=str(payload['key']),
+            upload_id=payload.get('upload_id'),
+            parts=payload.get('parts'),
+        )
+        return JsonResponse(uploaded)
+
+    except PermissionError:
+        raise Http404("Файл не найден или доступ запрещен")
+
+    except QuotaExceededError as e:
+        return JsonResponse({'error': str(e)}, status=413)
+
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': f"Некорректный запрос: {e}"}, status=400)
+
+    except ClientError as e:
+        logger.error(f"Ошибка при завершении прямой загрузки: {e}", exc_info=True)
+        return JsonResponse({'error': 'Не удалось завершить загрузку'}, status=502)
+
+
+@login_required
+@csrf_protect
+def file_abort_upload_view(request):
+    """
+    Отменяет незавершенную прямую multipart загрузку.
+
+    Ожидает JSON {"key", "upload_id"}.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+        aborted = service.abort_presigned_upload(
+            user_id=request.user.id,
+            s3_key=str(payload['key']),
+            upload_id=str(payload['upload_id']),
+        )
+        return JsonResponse({'aborted': aborted}, status=200 if aborted else 400)
+
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': f"Некорректный запрос: {e}"}, status=400)
+
+
+@login_required
+@csrf_protect
+def resumable_upload_view(request):
+    """
+    Создает возобновляемую загрузку (протокол tus 1.0.0, расширение creation).
+
+    Ожидает заголовки Upload-Length и Upload-Metadata с ключами filename и, необязательно,
+    current_path и filetype (значения в base64). Отвечает 201 с адресом загрузки в Location.
+    :param request:
+    :return:
+    """
+    if not settings.FILES_RESUMABLE_UPLOAD_ENABLED:
+        raise Http404("Возобновляемая загрузка отключена")
+
+    if request.method == "OPTIONS":
+        http_response = HttpResponse(status=204)
+        http_response["Tus-Version"] = TUS_VERSION
+        http_response["Tus-Extension"] = TUS_EXTENSIONS
+        return _tus_response(http_response)
+
+    if request.method != "POST":
+        return _tus_response(HttpResponse(status=405))
+
+    try:
+        metadata = _parse_upload_metadata(request.headers.get('Upload-Metadata', ''))
+        current_path = metadata.get('current_path', '').strip('/')
+        filename = metadata['filename']
+        if current_path:
+            filename = f"{current_path}/{filename}"
+
+        upload = service.create_resumable_upload(
+            user_id=request.user.id,
+            filename_in_s3=filename,
+            size=int(request.headers['Upload-Length']),
+            content_type=metadata.get('filetype'),
+        )
+
+    except QuotaExceededError as e:
+        return _tus_response(HttpResponse(str(e), status=413))
+
+    except (ValueError, KeyError) as e:
+        return _tus_response(HttpResponse(f"Некорректный запрос: {e}", status=400))
+
+    except ClientError as e:
+        logger.error(f"Ошибка при создании возобновляемой загрузки: {e}", exc_info=True)
+        return _tus_response(HttpResponse(status=502))
+
+    http_response = HttpResponse(status=201)
+    http_response["Location"] = reverse('files:resumable_upload_detail', kwargs={'upload_id': upload['id']})
+    return _tus_response(http_response, upload)
+
+
+@login_required
+@csrf_protect
+def resumable_upload_detail_view(request, upload_id):
+    """
+    Возобновляемая загрузка: HEAD - принятое смещение, PATCH - очередной фрагмент
+    (Content-Type: application/offset+octet-stream, Upload-Offset), DELETE - отмена.
+    :param upload_id:
+    :param request:
+    :return:
+    """
+    if not settings.FILES_RESUMABLE_UPLOAD_ENABLED:
+        raise Http404("Возобновляемая загрузка отключена")
+
+    user_id = request.user.id
+
+    if request.method == "HEAD":
+        try:
+            upload = service.get_resumable_upload(user_id, upload_id)
+
+        except UploadLockedError as e:
+            return _tus_response(HttpResponse(str(e), status=423))
+
+        except ClientError as e:
+            logger.error(f"Ошибка при сборке загрузки {upload_id}: {e}", exc_info=True)
+            return _tus_response(HttpResponse(status=502))
+
+        if upload is None:
+            raise Http404("Загрузка не найдена")
+        return _tus_response(HttpResponse(status=200), upload)
+
+    if request.method == "DELETE":
+        if not service.abort_resumable_upload(user_id, upload_id):
+            raise Http404("Загрузка не найдена")
+        return _tus_response(HttpResponse(status=204))
+
+    if request.method != "PATCH":
+        return _tus_response(HttpResponse(status=405))
+
+    if request.content_type != 'application/offset+octet-stream':
+        return _tus_response(HttpResponse(status=415))
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        upload = service.append_resumable_upload(user_id, upload_id, offset, request, length)
+
+    except UploadOffsetError as e:
+        return _tus_response(HttpResponse(str(e), status=409))
+
+    except UploadLockedError as e:
+        return _tus_response(HttpResponse(str(e), status=423))
+
+    except (ValueError, KeyError) as e:
+        return _tus_response(HttpResponse(f"Некорректный запрос: {e}", status=400))
+
+    except ClientError as e:
+        logger.error(f"Ошибка при приеме фрагмента загрузки {upload_id}: {e}", exc_info=True)
+        return _tus_response(HttpResponse(status=502))
+
+    if upload is None:
+        raise Http404("Загрузка не найдена")
+    return _tus_response(HttpResponse(status=204), upload)
+
+
 @login_required
 @csrf_protect
 def file_download_view(request, s3_key):
     """
-    Позволяет пользователю скачать файлы из облака
+    Позволяет пользователю скачать файлы из облака.
+
+    Способ отдачи задается FILES_DOWNLOAD_MODE: поток через Django (proxy),
+    редирект на presigned-ссылку MinIO (presigned) или передача отдачи nginx
+    через X-Accel-Redirect (accel). Сжатый объект, кодек которого клиент не принимает,
+    всегда распаковывается в режиме proxy.
     :param s3_key:
     :param request:
     """
@@ -101,26 +425,83 @@ def file_download_view(request, s3_key):
     if not s3_key.startswith(expected_prefix):
         raise Http404("Файл не найден или доступ запрещен")
 
+    file_name = s3_key.split("/")[-1]
+    download_mode = settings.FILES_DOWNLOAD_MODE
+
     try:
-        response = service.s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        info = None
+        if download_mode != 'proxy' and settings.FILES_COMPRESSION_ENABLED:
+            info = service.get_object_info(s3_key)
+            if _requires_decoding(request, info):
+                download_mode = 'proxy'
 
-        file_stream = response["Body"]
-        content_type = response.get("ContentType", 'application/octet-stream')
-        content_length = response.get("ContentLength", None)
+        if download_mode == 'presigned':
+            logger.info(f"Файл {s3_key} отдан по presigned-ссылке")
+            return redirect(service.create_presigned_download(s3_key, file_name))
 
-        file_name = s3_key.split("/")[-1]
+        if download_mode == 'accel':
+            # nginx сам запрашивает объект у MinIO по подписанной ссылке на внутренний адрес
+            url = urlsplit(service.create_presigned_download(s3_key, file_name, internal=True))
+            http_response = HttpResponse()
+            http_response["X-Accel-Redirect"] = f"{settings.FILES_ACCEL_REDIRECT_PREFIX.rstrip('/')}{url.path}?{url.query}"
+            http_response["Content-Disposition"] = content_disposition_header(True, file_name)
+            logger.info(f"Файл {s3_key} передан nginx для отдачи")
+            return http_response
+
+        info = info or service.get_object_info(s3_key)
+        etag = info['etag']
+        last_modified = int(info['last_modified'].timestamp()) if info['last_modified'] else None
+        size = info['size']
+
+        if info['codec']:
+            early_response, passthrough, response_etag = _resolve_compressed_download(request, info, last_modified)
+            if early_response is not None:
+                return early_response
+            http_response = StreamingHttpResponse(
+                service.open_object(s3_key, if_match=etag, decode=not passthrough),
+                content_type=info['content_type'],
+            )
+            _set_compressed_headers(http_response, info, passthrough)
+            _set_download_headers(http_response, file_name, response_etag, last_modified, accept_ranges=False)
+            logger.info(f"Файл {s3_key} ({info['codec']}) начал скачиваться "
+                        f"{'без распаковки' if passthrough else 'с распаковкой'}")
+            return http_response
 
-        http_response = StreamingHttpResponse(file_stream, content_type=content_type)
+        early_response, ranges = _resolve_download_ranges(request, etag, last_modified, size)
+        if early_response is not None:
+            return early_response
 
-        http_response["Content-Disposition"] = f"attachment; filename={file_name}"
+        # IfMatch защищает от смены объекта между head_object и get_object
+        if ranges is None:
+            http_response = StreamingHttpResponse(service.open_object(s3_key, if_match=etag),
+                                                  content_type=info['content_type'])
+            http_response["Content-Length"] = str(size)
 
-        if content_length:
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            http_response = StreamingHttpResponse(service.open_object(s3_key, (start, end), if_match=etag),
+                                                  content_type=info['content_type'], status=206)
+            http_response["Content-Range"] = content_range(start, end, size)
+            http_response["Content-Length"] = str(end - start + 1)
+
+        else:
+            boundary = uuid.uuid4().hex
+            content_length, body = iter_byteranges(
+                ranges, size, info['content_type'], boundary,
+                lambda start, end: service.open_object(s3_key, (start, end), if_match=etag),
+            )
+            http_response = StreamingHttpResponse(body, content_type=f"multipart/byteranges; boundary={boundary}",
+                                                  status=206)
             http_response["Content-Length"] = str(content_length)
 
+        _set_download_headers(http_response, file_name, etag, last_modified)
+
         logger.info(f"Файл {s3_key} начал скачиваться")
         return http_response
 
-    except service.s3_client.exceptions.NoSuchKey:
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+            raise
         logger.error(f"Файл не найден в S3: {s3_key}")
         raise Http404("Файл не найден")
 
@@ -128,6 +509,80 @@ def file_download_view(request, s3_key):
         logger.error(f"Ошибка при скачивании файла {s3_key}: {e}", exc_info=True)
         return redirect('files:file_manager')
 
+@login_required
+def file_thumbnail_view(request, s3_key):
+    """
+    Отдает миниатюру файла.
+
+    Ссылка на миниатюру содержит версию файла (?v=), поэтому ответ кэшируется браузером надолго.
+    Если миниатюры еще нет, ее построение ставится в очередь, а ответ - 404 (шаблон показывает значок файла).
+    :param s3_key:
+    :param request:
+    """
+    user_id = request.user.id
+    expected_prefix = f"user-{user_id}-files/"
+
+    if not s3_key.startswith(expected_prefix) or s3_key.endswith('/'):
+        raise Http404("Файл не найден или доступ запрещен")
+
+    try:
+        thumbnail = service.open_thumbnail(s3_key)
+
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+            logger.error(f"Ошибка при чтении миниатюры {s3_key}: {e}")
+            return HttpResponse(status=502)
+        service.request_thumbnail(user_id, s3_key)
+        raise Http404("Миниатюра еще не готова")
+
+    if not thumbnail['body']:
+        raise Http404("Для файла нет миниатюры")
+
+    http_response = get_conditional_response(request, etag=thumbnail['etag'])
+    if http_response is None:
+        http_response = HttpResponse(thumbnail['body'], content_type=thumbnail['content_type'])
+    if thumbnail['etag']:
+        http_response["ETag"] = thumbnail['etag']
+    if request.GET.get('v'):
+        http_response["Cache-Control"] = f"private, max-age={THUMBNAIL_CACHE_MAX_AGE}, immutable"
+    else:
+        http_response["Cache-Control"] = "private, no-cache"
+    return http_response
+
+
+@login_required
+@csrf_protect
+def file_download_folder_view(request, s3_key):
+    """
+    Позволяет пользователю скачать папку целиком ZIP-архивом.
+
+    Архив формируется на лету во время отдачи и не сохраняется ни в памяти, ни на диске.
+    :param s3_key:
+    :param request:
+    """
+    user_id = request.user.id
+    expected_prefix = f"user-{user_id}-files/"
+    folder_key = f"{s3_key.rstrip('/')}/"
+
+    if not folder_key.startswith(expected_prefix) or folder_key == expected_prefix:
+        raise Http404("Папка не найдена или доступ запрещен")
+
+    try:
+        if not service.folder_exists(folder_key):
+            raise Http404("Папка не найдена")
+
+        archive_name = f"{folder_key.rstrip('/').rpartition('/')[2]}.zip"
+        http_response = StreamingHttpResponse(service.iter_folder_zip(folder_key), content_type='application/zip')
+        http_response["Content-Disposition"] = content_disposition_header(True, archive_name)
+
+        logger.info(f"Папка {folder_key} начала скачиваться архивом")
+        return http_response
+
+    except ClientError as e:
+        logger.error(f"Ошибка при скачивании папки {folder_key}: {e}", exc_info=True)
+        return redirect('files:file_manager')
+
+
 @login_required
 @csrf_protect
 def file_delete_view(request, s3_key):
@@ -144,14 +599,21 @@ def file_delete_view(request, s3_key):
         if not s3_key.startswith(expected_prefix):
             raise Http404("Файл не найден или доступ запрещен")
 
+        if settings.FILES_JOBS_ENABLED and s3_key.endswith('/'):
+            # Папка может быть большой: удаление выполняет воркер, ход виден в файловом менеджере
+            job = job_service.submit_delete(user_id, s3_key)
+            return _job_submitted_response(request, job, f"Удаление папки {s3_key[len(expected_prefix):]} запущено")
+
         try:
 
-            success = service.delete_object(
+            result = service.delete_object(
                 user_id=user_id,
                 s3_key=s3_key,
             )
-            if success:
+            if result:
                 logger.info(f"файл {s3_key} удален")
+            else:
+                messages.error(request, f"Не удалось удалить объектов: {len(result.failed_keys)}")
 
         except Exception as e:
             logger.error(f"Ошибка при удалении файла {s3_key}: {e}", exc_info=True)
@@ -178,6 +640,11 @@ def file_rename_view(request, s3_key):
         if not s3_key.startswith(expected_prefix):
             raise Http404("Файл не найден или доступ запрещен")
 
+        if settings.FILES_JOBS_ENABLED and s3_key.endswith('/'):
+            job = job_service.submit_rename(user_id, s3_key, new_name)
+            return _job_submitted_response(request, job,
+                                           f"Переименование папки {s3_key[len(expected_prefix):]} запущено")
+
         try:
             service.rename_object(
                 user_id=user_id,
@@ -197,6 +664,504 @@ def file_rename_view(request, s3_key):
         return redirect('files:file_manager')
 
 
+@login_required
+@csrf_protect
+def file_move_view(request, s3_key):
+    """
+    Перемещает файл или папку в другую папку пользователя без передачи данных через Django.
+
+    Ожидает поля формы destination (путь папки назначения от корня пользователя, пустой - корень),
+    необязательное new_name и current_path.
+    :param s3_key:
+    :param request:
+    :return:
+    """
+    return _transfer(request, s3_key, copy=False)
+
+
+@login_required
+@csrf_protect
+def file_copy_view(request, s3_key):
+    """
+    Копирует файл или папку на стороне сервера, в том числе в другую папку.
+
+    Принимает те же поля, что и file_move_view; для копии в той же папке нужно новое имя.
+    :param s3_key:
+    :param request:
+    :return:
+    """
+    return _transfer(request, s3_key, copy=True)
+
+
+@login_required
+@csrf_protect
+def file_bulk_delete_view(request):
+    """
+    Удаляет выбранные файлы и папки одной операцией.
+
+    Ожидает поля формы keys (полные ключи) и current_path или JSON {"keys": [...]}.
+    Если в выборе есть папки и включены фоновые операции, удаление выполняет воркер.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return redirect('files:file_manager')
+
+    user_id = request.user.id
+    try:
+        keys, params = _parse_bulk_request(request)
+    except ValueError as e:
+        return _operation_response(request, '', {'error': str(e)}, 400, str(e), messages.ERROR)
+
+    if settings.FILES_JOBS_ENABLED and any(key.endswith('/') for key in keys):
+        job = job_service.submit_bulk_delete(user_id, keys)
+        return _job_submitted_response(request, job, f"Удаление выбранных объектов ({len(keys)}) запущено")
+
+    result = service.delete_objects(user_id, keys)
+    payload = {
+        'deleted': result.deleted,
+        'deleted_bytes': result.deleted_bytes,
+        'failed_keys': result.failed_keys,
+        'elapsed': round(result.elapsed, 3),
+    }
+    if result:
+        return _operation_response(request, params['current_path'], payload, 200, f"Удалено объектов: {result.deleted}")
+    return _operation_response(request, params['current_path'], payload, 207,
+                               f"Не удалось удалить объектов: {len(result.failed_keys)}", messages.ERROR)
+
+
+@login_required
+@csrf_protect
+def file_bulk_move_view(request):
+    """
+    Перемещает выбранные файлы и папки в другую папку пользователя.
+
+    Ожидает поля формы keys, destination (путь папки назначения от корня пользователя,
+    пустой - корень) и current_path или JSON {"keys": [...], "destination": "..."}.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return redirect('files:file_manager')
+
+    user_id = request.user.id
+    try:
+        keys, params = _parse_bulk_request(request)
+    except ValueError as e:
+        return _operation_response(request, '', {'error': str(e)}, 400, str(e), messages.ERROR)
+
+    destination = params['destination'].strip('/')
+    destination_key = f"user-{user_id}-files/{destination}/" if destination else f"user-{user_id}-files/"
+
+    if settings.FILES_JOBS_ENABLED and any(key.endswith('/') for key in keys):
+        job = job_service.submit_move(user_id, keys, destination_key)
+        return _job_submitted_response(request, job, f"Перемещение выбранных объектов ({len(keys)}) запущено")
+
+    result = service.move_objects(user_id, keys, destination_key)
+    payload = {'moved': result.moved, 'errors': result.errors, 'elapsed': round(result.elapsed, 3)}
+    if result:
+        return _operation_response(request, params['current_path'], payload, 200,
+                                   f"Перемещено объектов: {len(result.moved)}")
+    return _operation_response(request, params['current_path'], payload, 207,
+                               f"Не удалось переместить объектов: {len(result.errors)}", messages.ERROR)
+
+
+@login_required
+@csrf_protect
+def file_bulk_download_view(request):
+    """
+    Отдает выбранные файлы и папки одним ZIP-архивом, формируемым на лету.
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return redirect('files:file_manager')
+
+    try:
+        keys, params = _parse_bulk_request(request)
+    except ValueError as e:
+        return _operation_response(request, '', {'error': str(e)}, 400, str(e), messages.ERROR)
+
+    if len(keys) == 1 and keys[0].endswith('/'):
+        archive_name = f"{keys[0].rstrip('/').rpartition('/')[2]}.zip"
+    else:
+        archive_name = "files.zip"
+
+    http_response = StreamingHttpResponse(service.iter_selection_zip(keys), content_type='application/zip')
+    http_response["Content-Disposition"] = content_disposition_header(True, archive_name)
+    logger.info(f"Выбранные объекты ({len(keys)}) начали скачиваться архивом")
+    return http_response
+
+
+@login_required
+def job_list_view(request):
+    """
+    Возвращает фоновые операции пользователя в формате JSON: активные и последние завершенные.
+    :param request:
+    :return:
+    """
+    return JsonResponse({'jobs': job_service.list_jobs(request.user.id)})
+
+
+@login_required
+def job_detail_view(request, job_id):
+    """
+    Возвращает состояние фоновой операции в формате JSON.
+    :param job_id:
+    :param request:
+    :return:
+    """
+    job = job_service.get_job(request.user.id, job_id)
+    if job is None:
+        raise Http404("Операция не найдена")
+    return JsonResponse(job)
+
+
+@login_required
+@csrf_protect
+def job_cancel_view(request, job_id):
+    """
+    Запрашивает отмену фоновой операции.
+    :param job_id:
+    :param request:
+    :return:
+    """
+    if request.method != "POST":
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+    job = job_service.get_job(request.user.id, job_id)
+    if job is None:
+        raise Http404("Операция не найдена")
+
+    cancelled = job_service.cancel(request.user.id, job_id)
+    return JsonResponse(job_service.get_job(request.user.id, job_id), status=202 if cancelled else 409)
+
+
+def metrics_view(request):
+    """
+    Отдает метрики процесса в формате Prometheus.
+
+    Доступ - только по токену FILES_METRICS_TOKEN в заголовке Authorization: Bearer;
+    если токен не задан, доступ закрыт (за прокси REMOTE_ADDR всегда локальный).
+    :param request:
+    :return:
+    """
+    if not settings.FILES_METRICS_ENABLED:
+        raise Http404("Метрики отключены")
+
+    token = settings.FILES_METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponse("Доступ запрещен", status=403, content_type='text/plain; charset=utf-8')
+
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _job_submitted_response(request, job: dict, message: str):
+    """
+    Вспомогательная функция: ответ на постановку операции в очередь (202 с операцией для JSON-клиента).
+    """
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(job, status=202)
+    messages.info(request, message)
+    return redirect('files:file_manager')
+
+
+def _transfer(request, s3_key: str, copy: bool):
+    """
+    Вспомогательная функция: перемещение или копирование объекта по полям destination и new_name.
+    """
+    if request.method != "POST":
+        return redirect('files:file_manager')
+
+    user_id = request.user.id
+    expected_prefix = f"user-{user_id}-files/"
+    if not s3_key.startswith(expected_prefix) or s3_key == expected_prefix:
+        raise Http404("Файл не найден или доступ запрещен")
+
+    current_path = request.POST.get('current_path', '').strip('/')
+    destination = request.POST.get('destination', '').strip().strip('/')
+    new_name = request.POST.get('new_name', '').strip().strip('/') or s3_key.rstrip('/').rpartition('/')[2]
+    if '/' in new_name:
+        return _operation_response(request, current_path, {'error': 'Новое имя не должно содержать путь'}, 400,
+                                   f"Новое имя '{new_name}' не должно содержать путь", messages.ERROR)
+
+    is_folder = s3_key.endswith('/')
+    new_key = f"{expected_prefix}{destination}/" if destination else expected_prefix
+    new_key = f"{new_key}{new_name}/" if is_folder else f"{new_key}{new_name}"
+    action = "Копирование" if copy else "Перемещение"
+
+    if settings.FILES_JOBS_ENABLED and is_folder:
+        # Папка может быть большой: копирование выполняет воркер, ход виден в файловом менеджере
+        submit = job_service.submit_copy if copy else job_service.submit_move_object
+        job = submit(user_id, s3_key, new_key)
+        return _job_submitted_response(request, job, f"{action} папки {s3_key[len(expected_prefix):]} запущено")
+
+    try:
+        if copy:
+            succeeded = service.copy_object(user_id, s3_key, new_key)
+        else:
+            succeeded = service.move_object(user_id, s3_key, new_key)
+    except QuotaExceededError as e:
+        return _operation_response(request, current_path, {'error': str(e)}, 413,
+                                   "Копия не помещается в квоту хранилища", messages.ERROR)
+
+    payload = {'success': succeeded, 'key': new_key}
+    if succeeded:
+        return _operation_response(request, current_path, payload, 200,
+                                   f"{action}: {new_key[len(expected_prefix):]}")
+    return _operation_response(request, current_path, payload, 409,
+                               f"{action} {s3_key[len(expected_prefix):]} не выполнено", messages.ERROR)
+
+
+def _parse_bulk_request(request) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Вспомогательная функция: читает выбор из полей формы keys или JSON {"keys": [...]}
+    и один раз проверяет, что все ключи принадлежат папке пользователя.
+
+    :return: tuple - Полные ключи и параметры 'current_path' и 'destination'
+
+    :raises
+        ValueError: Если выбор пуст, больше FILES_BULK_MAX_KEYS или запрос некорректен
+        Http404: Если хотя бы один ключ не принадлежит пользователю
+    """
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректный запрос: {e}")
+        if not isinstance(payload, dict) or not isinstance(payload.get('keys'), list):
+            raise ValueError("Некорректный запрос: ожидается список keys")
+        keys = [str(key) for key in payload['keys']]
+        params = {name: str(payload.get(name) or '') for name in ('current_path', 'destination')}
+    else:
+        keys = request.POST.getlist('keys')
+        params = {name: request.POST.get(name, '') for name in ('current_path', 'destination')}
+    params['current_path'] = params['current_path'].strip('/')
+
+    if not keys:
+        raise ValueError("Не выбрано ни одного файла или папки")
+    if len(keys) > settings.FILES_BULK_MAX_KEYS:
+        raise ValueError(f"Можно выбрать не больше {settings.FILES_BULK_MAX_KEYS} файлов и папок")
+
+    expected_prefix = f"user-{request.user.id}-files/"
+    if any(not key.startswith(expected_prefix) or key == expected_prefix for key in keys):
+        raise Http404("Файл не найден или доступ запрещен")
+    return keys, params
+
+
+def _operation_response(request, current_path: str, payload: dict, status: int, message: str,
+                        level: int = messages.SUCCESS):
+    """
+    Вспомогательная функция: итог операции - JSON для клиента, ожидающего JSON,
+    иначе сообщение и возврат в текущую папку файлового менеджера.
+    """
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(payload, status=status)
+    messages.add_message(request, level, message)
+    redirect_url = reverse('files:file_manager')
+    if current_path:
+        redirect_url = f"{redirect_url}?{urlencode({'path': current_path})}"
+    return redirect(redirect_url)
+
+
+def _build_manager_context(current_path: str, page: dict, page_size: int, sort: str, usage: dict) -> Dict:
+    """
+    Вспомогательная функция для сборки контекста шаблона файлового менеджера.
+
+    :param current_path: Относительный путь текущей папки
+    :param page: Страница листинга из list_files_page
+    :param page_size: Размер страницы
+    :param sort: Поле сортировки
+    :param usage: Занятое место из get_usage
+
+    :return: dict - Контекст шаблона files/file_manager.html
+    """
+    breadcrumbs = _build_breadcrumbs(current_path)
+    logger.debug(f"Breadcrumbs: {breadcrumbs}")
+
+    return {
+        'breadcrumbs': breadcrumbs,
+        'items': _with_thumbnails(page['items']),
+        "current_path": current_path,
+        'next_cursor': page['next_cursor'],
+        'page_size': page_size,
+        'sort': sort,
+        'sortable': service.listing_source == 'index',
+        'direct_upload': settings.FILES_DIRECT_UPLOAD_ENABLED,
+        'usage': usage,
+        'jobs_enabled': settings.FILES_JOBS_ENABLED,
+        'resumable_upload': settings.FILES_RESUMABLE_UPLOAD_ENABLED,
+        'resumable_chunk_size': settings.FILES_MULTIPART_PART_SIZE,
+    }
+
+
+def _tus_response(http_response, upload: Optional[Dict] = None):
+    """
+    Вспомогательная функция: добавляет к ответу заголовки протокола tus и состояние загрузки.
+    """
+    http_response["Tus-Resumable"] = TUS_VERSION
+    http_response["Cache-Control"] = "no-store"
+    if upload is not None:
+        http_response["Upload-Offset"] = str(upload['offset'])
+        http_response["Upload-Length"] = str(upload['size'])
+        if not upload['completed']:
+            http_response["Upload-Expires"] = http_date(upload['expires_at'].timestamp())
+    return http_response
+
+
+def _parse_upload_metadata(header: str) -> Dict[str, str]:
+    """
+    Вспомогательная функция для разбора заголовка Upload-Metadata: пары "ключ значение_base64" через запятую.
+
+    :raises
+        ValueError: Если значение не в base64
+    """
+    metadata = {}
+    for pair in header.split(','):
+        key, _, value = pair.strip().partition(' ')
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError) as e:
+            raise ValueError(f"Некорректное значение {key} в Upload-Metadata") from e
+    return metadata
+
+
+def _with_thumbnails(items: List[Dict]) -> List[Dict]:
+    """
+    Вспомогательная функция: отмечает файлы, для которых показывается миниатюра.
+
+    Элементы копируются: листинг может быть взят из кэша и не должен меняться.
+    """
+    if not settings.FILES_THUMBNAILS_ENABLED:
+        return items
+    return [
+        dict(item, thumbnail=True)
+        if item['type'] == 'file' and thumbnails.supports(mimetypes.guess_type(item['name'])[0]) else item
+        for item in items
+    ]
+
+
+def _exceeds_quota(request, user_id: int) -> bool:
+    """
+    Вспомогательная функция: проверяет по Content-Length, что тело запроса на загрузку больше свободного места.
+
+    :return: bool - True, если загрузку можно отклонить, не читая тело запроса
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    free_space = service.get_free_space(user_id)
+    return free_space is not None and content_length > free_space
+
+
+def _resolve_download_ranges(request, etag: str, last_modified: Optional[int],
+                             size: int) -> Tuple[Optional[HttpResponse], Optional[List[Tuple[int, int]]]]:
+    """
+    Вспомогательная функция для обработки условных заголовков и Range при скачивании.
+
+    :param request:
+    :param etag: ETag объекта
+    :param last_modified: Время изменения объекта (unix timestamp) или None
+    :param size: Размер объекта в байтах
+
+    :return: tuple - Готовый ответ (304, 412 или 416) или None, и диапазоны из Range или None для всего объекта
+    """
+    # If-None-Match / If-Modified-Since / If-Match / If-Unmodified-Since
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional_response is not None:
+        return conditional_response, None
+
+    if not size or not _if_range_matches(request, etag, last_modified):
+        return None, None
+    try:
+        return None, parse_range_header(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        http_response = HttpResponse(status=416)
+        http_response["Content-Range"] = f"bytes */{size}"
+        return http_response, None
+
+
+def _set_download_headers(http_response, file_name: str, etag: str, last_modified: Optional[int],
+                          accept_ranges: bool = True) -> None:
+    http_response["Content-Disposition"] = content_disposition_header(True, file_name)
+    http_response["Accept-Ranges"] = "bytes" if accept_ranges else "none"
+    if etag:
+        http_response["ETag"] = etag
+    if last_modified is not None:
+        http_response["Last-Modified"] = http_date(last_modified)
+
+
+def _requires_decoding(request, info: dict) -> bool:
+    """
+    Вспомогательная функция: True, если объект сжат, а клиент не принимает его кодек (Accept-Encoding).
+    """
+    return bool(info['codec']) and not compression.accepts(request.headers.get('Accept-Encoding'), info['codec'])
+
+
+def _resolve_compressed_download(request, info: dict,
+                                 last_modified: Optional[int]) -> Tuple[Optional[HttpResponse], bool, str]:
+    """
+    Вспомогательная функция для обработки условных заголовков при скачивании сжатого объекта.
+
+    Объект отдается целиком: Range относится к исходному содержимому и не переводится в байты объекта.
+    Распакованное содержимое отличается от хранимого побайтно, поэтому его ETag - слабый.
+
+    :param request:
+    :param info: Результат get_object_info
+    :param last_modified: Время изменения объекта (unix timestamp) или None
+
+    :return: tuple - Готовый ответ (304 или 412) или None, признак отдачи объекта без распаковки и ETag ответа
+    """
+    passthrough = not _requires_decoding(request, info)
+    etag = info['etag'] if passthrough or not info['etag'] else f"W/{info['etag']}"
+    return get_conditional_response(request, etag=etag, last_modified=last_modified), passthrough, etag
+
+
+def _set_compressed_headers(http_response, info: dict, passthrough: bool) -> None:
+    if passthrough:
+        http_response["Content-Encoding"] = info['codec']
+        http_response["Content-Length"] = str(info['size'])
+    elif info['original_size'] is not None:
+        http_response["Content-Length"] = str(info['original_size'])
+    http_response["Vary"] = "Accept-Encoding"
+
+
+def _if_range_matches(request, etag: str, last_modified: Optional[int]) -> bool:
+    """
+    Вспомогательная функция для проверки заголовка If-Range.
+
+    :param request:
+    :param etag: ETag объекта
+    :param last_modified: Время изменения объекта (unix timestamp) или None
+
+    :return: bool - True, если Range можно применять (If-Range отсутствует или совпадает с объектом)
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return last_modified is not None and parse_http_date_safe(if_range) == last_modified
+
+
+def _get_page_size(request) -> int:
+    """
+    Вспомогательная функция для чтения размера страницы из параметра ?page_size=.
+
+    :param request:
+
+    :return: int - Размер страницы в пределах от 1 до 1000
+    """
+    try:
+        page_size = int(request.GET.get('page_size', settings.FILES_LIST_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.FILES_LIST_PAGE_SIZE
+    return max(1, min(page_size, 1000))
+
+
 def _build_breadcrumbs(path: str) -> List[Dict]:
     """
     Вспомогательная функция для построения навигационной цепочки из пути.
@@ -18,8 +18,9 @@ def run_tests():
     print("--- Тестирование подключения к MinIO ---")
     try:
         # Создаем экземпляр сервиса
-        # (Это вызовет _ensure_bucket_exists и проверит подключение)
+        # (ensure_bucket проверит подключение и создаст бакет при необходимости)
         service = FileStorageService() # <-- Теперь это происходит ПОСЛЕ django.setup()
+        service.ensure_bucket()
         print("✅ Сервис FileStorageService инициализирован, бакет проверен/создан.")
 
     except Exception as e: